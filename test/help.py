@@ -1,5 +1,7 @@
 """Helping functions and data for tests"""
-from typing import Any
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from typing import Any, Type, TypeVar
 from unittest.mock import NonCallableMagicMock
 
 from twitter_discord_bot.twitter_discord_bot import TwitterUserWrapper
@@ -52,3 +54,40 @@ def get_user_mock(screen_name: Any = TWITTER_USER_SAMPLE['screen_name']) -> NonC
     user_mock.user_id = TWITTER_USER_SAMPLE['id']
     user_mock.profile_image_url = TWITTER_USER_SAMPLE['profile_image_url_orig']
     return user_mock
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    """A request handler not logging every request to stderr"""
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    # Connections beyond the backlog would wait for the retransmission of SYN
+    request_queue_size = 64
+
+
+_FakeServerT = TypeVar('_FakeServerT', bound='FakeHTTPServer')
+
+
+class FakeHTTPServer:
+    """
+    Serve on a free port of 127.0.0.1 with `handler_class` in background threads
+
+    Subclasses define the handler in `__init__` to reach their state, and call this
+    `__init__` with it. The server runs within the `with` block.
+    """
+
+    def __init__(self, handler_class: Type[BaseHTTPRequestHandler]) -> None:
+        self.server = _Server(('127.0.0.1', 0), handler_class)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self: _FakeServerT) -> _FakeServerT:
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.server.shutdown()
+        self.server.server_close()
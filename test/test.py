@@ -5,11 +5,30 @@ import logging
 import unittest
 from unittest.mock import MagicMock, NonCallableMagicMock, mock_open, patch
 
+import requests
+import tweepy
+
+from twitter_discord_bot.archive import TweetArchive
+from twitter_discord_bot.circuit_breaker import CircuitBreakers
+from twitter_discord_bot.concurrency import AIMDLimiter
+from twitter_discord_bot.control import ControlCommand
+from twitter_discord_bot.delivery import DeliveryQueues
+from twitter_discord_bot.models import TwitterAccount
+from twitter_discord_bot.stream import TweetStream
+from twitter_discord_bot.twitter_api import is_twitter_overloaded
 from twitter_discord_bot.twitter_discord_bot import (
     DiscordPost,
-    _post_tweets_to_discord,
+    _build_webhook_routes,
+    _enqueue_streamed_tweets,
+    _enqueue_tweets,
+    _fetch_and_post,
+    _GlobalFetchError,
+    _handle_control_command,
+    _merge_tenant_configurations,
     _read_last_fetched_ids_from_file,
     _save_last_fetched_ids_to_file,
+    _sync_stream_rules,
+    _update_webhook_routes,
 )
 
 from .help import DISCORD_WEBHOOK_SAMPLE
@@ -20,26 +39,95 @@ module_logger.setLevel(logging.CRITICAL)
 
 class TestHelpFunctions(unittest.TestCase):
     @patch.object(DiscordPost, 'generate_from_twitter_status')
-    def test_post_tweets_to_discord(self, generate_from_twitter_status_mock: MagicMock) -> None:
+    def test_enqueue_tweets(self, generate_from_twitter_status_mock: MagicMock) -> None:
         user_mock = NonCallableMagicMock()
-        webhook_url = DISCORD_WEBHOOK_SAMPLE
+        webhook_urls = [DISCORD_WEBHOOK_SAMPLE, f'{DISCORD_WEBHOOK_SAMPLE}/2']
         status_number = 10
-        status_mocks = [NonCallableMagicMock() for _ in range(status_number)]
-        generate_from_twitter_status_mock.return_value.save.side_effect = [
-            200, 201, 204, 304, 400, 401, 403, 404, 405, 429
-        ]
+        status_mocks = [NonCallableMagicMock(spec=['id']) for _ in range(status_number)]
+        for status_id, status_mock in enumerate(status_mocks):
+            status_mock.id = status_id
+        delivery_queues_mock = NonCallableMagicMock(spec=DeliveryQueues)
+        archive_mock = NonCallableMagicMock(spec=TweetArchive)
+
+        _enqueue_tweets(
+            user=user_mock,
+            statuses=status_mocks,
+            webhook_urls=webhook_urls,
+            delivery_queues=delivery_queues_mock,
+            archive=archive_mock,
+        )
 
-        _post_tweets_to_discord(user=user_mock, statuses=status_mocks, webhook_url=webhook_url)
+        self.assertEqual(
+            [call.kwargs['status'] for call in archive_mock.append.call_args_list],
+            status_mocks,
+        )
 
+        # Generate the post once for all webhooks
         self.assertEqual(
             generate_from_twitter_status_mock.call_args_list,
-            [({'user': user_mock, 'status': status},) for status in reversed(status_mocks)]
+            [({'user': user_mock, 'status': status, 'media_cache': None, 'hydrator': None},)
+             for status in reversed(status_mocks)]
         )
         self.assertEqual(
-            generate_from_twitter_status_mock.return_value.save.call_count,
-            status_number
+            [
+                (call.kwargs['webhook_url'], call.kwargs['delivery'].status_id)
+                for call in delivery_queues_mock.enqueue.call_args_list
+            ],
+            [
+                (webhook_url, status.id)
+                for status in reversed(status_mocks)
+                for webhook_url in webhook_urls
+            ],
         )
 
+    @patch('twitter_discord_bot.twitter_discord_bot._enqueue_tweets')
+    def test_enqueue_streamed_tweets(self, enqueue_tweets_mock: MagicMock) -> None:
+        user_mock = NonCallableMagicMock()
+        fetched_status_mock = NonCallableMagicMock(id=100)
+        new_status_mock = NonCallableMagicMock(id=200)
+        untracked_status_mock = NonCallableMagicMock(id=300)
+        tweet_stream_mock = NonCallableMagicMock()
+        tweet_stream_mock.get_received.return_value = [
+            ({'username': 'Foo'}, fetched_status_mock),
+            ({'username': 'Foo'}, new_status_mock),
+            ({'username': 'bar'}, untracked_status_mock),
+        ]
+        delivery_queues_mock = NonCallableMagicMock(spec=DeliveryQueues)
+
+        latest_posts = _enqueue_streamed_tweets(
+            tweet_stream=tweet_stream_mock,
+            twitter_users_infos={'foo': user_mock},
+            webhook_routes={'foo': [DISCORD_WEBHOOK_SAMPLE]},
+            last_fetched_posts={'foo': 100},
+            delivery_queues=delivery_queues_mock,
+        )
+
+        enqueue_tweets_mock.assert_called_once_with(
+            user=user_mock,
+            statuses=[new_status_mock],
+            webhook_urls=[DISCORD_WEBHOOK_SAMPLE],
+            delivery_queues=delivery_queues_mock,
+            media_cache=None,
+            archive=None,
+            hydrator=None,
+        )
+        self.assertEqual(latest_posts, {'foo': 200})
+
+    def test_sync_stream_rules(self) -> None:
+        tweet_stream_mock = NonCallableMagicMock(spec=TweetStream)
+        twitter_accounts = [TwitterAccount(twitter='foo', discord_channels=['channel'])]
+
+        self.assertTrue(_sync_stream_rules(tweet_stream_mock, twitter_accounts))
+        tweet_stream_mock.sync_rules.assert_called_once_with(twitter_accounts)
+
+        # Polled until retried
+        for error in [
+            requests.ConnectionError(),
+            tweepy.TwitterServerError(MagicMock(status_code=503, json=dict)),
+        ]:
+            tweet_stream_mock.sync_rules.side_effect = error
+            self.assertFalse(_sync_stream_rules(tweet_stream_mock, twitter_accounts))
+
     @patch('twitter_discord_bot.twitter_discord_bot.open', new=mock_open())
     @patch('twitter_discord_bot.twitter_discord_bot.ConfigParser', new=MagicMock())
     def test_read_last_fetched_ids_from_file(self) -> None:
@@ -106,3 +194,327 @@ class TestHelpFunctions(unittest.TestCase):
              for screen_name, last_fetched_id in last_fetched_ids.items()]
         )
         config_parser_mock.return_value.write.assert_called_once_with(open_mock.return_value)
+
+
+class TestWebhookRoutes(unittest.TestCase):
+    discord_webhooks = {
+        'foo': 'https://discord.com/api/webhooks/foo',
+        'bar': 'https://discord.com/api/webhooks/bar',
+    }
+
+    def test_build_webhook_routes(self) -> None:
+        twitter_accounts = [
+            TwitterAccount(twitter='Alice', discord_channels=['Foo', 'bar']),
+            TwitterAccount(twitter='bob'),
+        ]
+
+        webhook_routes = _build_webhook_routes(
+            twitter_accounts=twitter_accounts, discord_webhooks=self.discord_webhooks
+        )
+
+        self.assertEqual(
+            webhook_routes,
+            {
+                'alice': [self.discord_webhooks['foo'], self.discord_webhooks['bar']],
+                'bob': [],
+            },
+        )
+
+    def test_update_webhook_routes(self) -> None:
+        old_twitter_accounts = [
+            TwitterAccount(twitter='alice', discord_channels=['foo']),
+            TwitterAccount(twitter='bob', discord_channels=['bar']),
+            TwitterAccount(twitter='carol', discord_channels=['foo']),
+        ]
+        new_twitter_accounts = [
+            TwitterAccount(twitter='alice', discord_channels=['foo']),
+            TwitterAccount(twitter='bob', discord_channels=['bar']),
+            TwitterAccount(twitter='dave', discord_channels=['foo', 'bar']),
+        ]
+        new_discord_webhooks = {
+            'foo': self.discord_webhooks['foo'],
+            'bar': 'https://discord.com/api/webhooks/bar2',
+        }
+        webhook_routes = _build_webhook_routes(old_twitter_accounts, self.discord_webhooks)
+        alice_routes = webhook_routes['alice']
+
+        _update_webhook_routes(
+            webhook_routes=webhook_routes,
+            old_twitter_accounts=old_twitter_accounts,
+            new_twitter_accounts=new_twitter_accounts,
+            old_discord_webhooks=self.discord_webhooks,
+            new_discord_webhooks=new_discord_webhooks,
+        )
+
+        self.assertEqual(
+            webhook_routes,
+            _build_webhook_routes(new_twitter_accounts, new_discord_webhooks),
+        )
+        # Unchanged routes are kept as is
+        self.assertIs(webhook_routes['alice'], alice_routes)
+
+    def test_merge_tenant_configurations(self) -> None:
+        twitter_accounts, discord_webhooks = _merge_tenant_configurations({
+            'tenant_a': (
+                [
+                    TwitterAccount(twitter='Alice', discord_channels=['Foo'], interval=3),
+                    TwitterAccount(twitter='bob', discord_channels=['bar']),
+                ],
+                self.discord_webhooks,
+            ),
+            'tenant_b': (
+                [TwitterAccount(twitter='alice', discord_channels=['foo'], priority=2)],
+                {'foo': self.discord_webhooks['foo']},
+            ),
+        })
+
+        self.assertEqual(
+            twitter_accounts,
+            [
+                TwitterAccount(
+                    twitter='Alice',
+                    discord_channels=['tenant_a/foo', 'tenant_b/foo'],
+                    interval=1,
+                    priority=2,
+                ),
+                TwitterAccount(twitter='bob', discord_channels=['tenant_a/bar']),
+            ],
+        )
+        self.assertEqual(
+            discord_webhooks,
+            {
+                'tenant_a/foo': self.discord_webhooks['foo'],
+                'tenant_a/bar': self.discord_webhooks['bar'],
+                'tenant_b/foo': self.discord_webhooks['foo'],
+            },
+        )
+        # Fetched once and posted once to the webhook shared by both tenants
+        self.assertEqual(
+            _build_webhook_routes(twitter_accounts, discord_webhooks),
+            {
+                'alice': [self.discord_webhooks['foo']],
+                'bob': [self.discord_webhooks['bar']],
+            },
+        )
+
+
+@patch('twitter_discord_bot.twitter_discord_bot._enqueue_tweets')
+@patch('twitter_discord_bot.twitter_discord_bot.get_twitter_user_timeline')
+class TestFetchAndPost(unittest.TestCase):
+    twitter_accounts = [
+        TwitterAccount(twitter='foo', discord_channels=['channel']),
+        TwitterAccount(twitter='bar', discord_channels=['channel']),
+    ]
+    webhook_routes = {'foo': [DISCORD_WEBHOOK_SAMPLE], 'bar': [DISCORD_WEBHOOK_SAMPLE]}
+
+    def _fetch_and_post(
+        self,
+        account_breakers: CircuitBreakers,
+        has_quota: bool = True,
+    ) -> dict:
+        twitter_clients = NonCallableMagicMock()
+        twitter_clients.has_quota.return_value = has_quota
+        return _fetch_and_post(
+            twitter_clients=twitter_clients,
+            twitter_accounts=self.twitter_accounts,
+            twitter_users_infos={'foo': NonCallableMagicMock(), 'bar': NonCallableMagicMock()},
+            webhook_routes=self.webhook_routes,
+            last_fetched_posts={},
+            interval_count=0,
+            delivery_queues=NonCallableMagicMock(spec=DeliveryQueues),
+            account_breakers=account_breakers,
+        )
+
+    def test_failing_account(
+        self, get_twitter_user_timeline_mock: MagicMock, _enqueue_tweets_mock: MagicMock
+    ) -> None:
+        account_breakers = CircuitBreakers(name='account', failure_threshold=2)
+        self.users = {'foo': NonCallableMagicMock(), 'bar': NonCallableMagicMock()}
+
+        def _get_timeline(user: MagicMock, **_kwargs: object) -> list:
+            if user is self.users['foo']:
+                raise tweepy.NotFound(MagicMock(status_code=404, json=dict))
+            return [NonCallableMagicMock(id=100)]
+
+        get_twitter_user_timeline_mock.side_effect = _get_timeline
+        for _ in range(3):
+            latest_posts = _fetch_and_post(
+                twitter_clients=NonCallableMagicMock(),
+                twitter_accounts=self.twitter_accounts,
+                twitter_users_infos=self.users,
+                webhook_routes=self.webhook_routes,
+                last_fetched_posts={},
+                interval_count=0,
+                delivery_queues=NonCallableMagicMock(spec=DeliveryQueues),
+                account_breakers=account_breakers,
+            )
+            self.assertEqual(latest_posts, {'bar': 100})
+
+        # foo is skipped once its circuit is opened
+        self.assertEqual(
+            [call.kwargs['user'] for call in get_twitter_user_timeline_mock.call_args_list],
+            [self.users['foo'], self.users['bar']] * 2 + [self.users['bar']],
+        )
+
+    def test_fetch_concurrently(
+        self, get_twitter_user_timeline_mock: MagicMock, enqueue_tweets_mock: MagicMock
+    ) -> None:
+        users = {'foo': NonCallableMagicMock(), 'bar': NonCallableMagicMock()}
+        get_twitter_user_timeline_mock.side_effect = lambda user, **_kwargs: [
+            NonCallableMagicMock(id=100 if user is users['foo'] else 200)
+        ]
+        fetch_limiter = AIMDLimiter(name='fetch', is_overloaded=is_twitter_overloaded)
+
+        latest_posts = _fetch_and_post(
+            twitter_clients=NonCallableMagicMock(),
+            twitter_accounts=self.twitter_accounts,
+            twitter_users_infos=users,
+            webhook_routes=self.webhook_routes,
+            last_fetched_posts={},
+            interval_count=0,
+            delivery_queues=NonCallableMagicMock(spec=DeliveryQueues),
+            fetch_limiter=fetch_limiter,
+        )
+
+        self.assertEqual(latest_posts, {'foo': 100, 'bar': 200})
+        # Queued in the order of the accounts
+        self.assertEqual(
+            [call.kwargs['user'] for call in enqueue_tweets_mock.call_args_list],
+            [users['foo'], users['bar']],
+        )
+        self.assertEqual(fetch_limiter.get_stats()['request_count'], 2)
+
+    @patch(
+        'twitter_discord_bot.twitter_discord_bot.is_token_authorized', return_value=False
+    )
+    def test_global_failure(
+        self,
+        is_token_authorized_mock: MagicMock,
+        get_twitter_user_timeline_mock: MagicMock,
+        _enqueue_tweets_mock: MagicMock,
+    ) -> None:
+        get_twitter_user_timeline_mock.side_effect = [
+            [NonCallableMagicMock(id=100)],
+            tweepy.Unauthorized(MagicMock(status_code=401, json=dict)),
+        ]
+        self.twitter_accounts = list(reversed(self.twitter_accounts))
+
+        with self.assertRaises(_GlobalFetchError) as context:
+            self._fetch_and_post(account_breakers=CircuitBreakers(name='account'))
+
+        self.assertEqual(context.exception.latest_posts, {'bar': 100})
+        is_token_authorized_mock.assert_called_once()
+
+    @patch(
+        'twitter_discord_bot.twitter_discord_bot.is_token_authorized', return_value=True
+    )
+    def test_unauthorized_account(
+        self,
+        _is_token_authorized_mock: MagicMock,
+        get_twitter_user_timeline_mock: MagicMock,
+        _enqueue_tweets_mock: MagicMock,
+    ) -> None:
+        # foo is protected or suspended, while the token is fine
+        get_twitter_user_timeline_mock.side_effect = [
+            tweepy.Unauthorized(MagicMock(status_code=401, json=dict)),
+            [NonCallableMagicMock(id=100)],
+        ]
+        account_breakers = CircuitBreakers(name='account', failure_threshold=1)
+
+        self.assertEqual(
+            self._fetch_and_post(account_breakers=account_breakers),
+            {'bar': 100},
+        )
+        self.assertTrue(account_breakers.is_open('foo'))
+        self.assertFalse(account_breakers.is_open('bar'))
+
+    def test_rate_limited(
+        self, get_twitter_user_timeline_mock: MagicMock, _enqueue_tweets_mock: MagicMock
+    ) -> None:
+        rate_limited = tweepy.TooManyRequests(MagicMock(status_code=429, json=dict))
+
+        # Other tokens still have quota
+        get_twitter_user_timeline_mock.side_effect = [
+            rate_limited,
+            [NonCallableMagicMock(id=100)],
+        ]
+        self.assertEqual(
+            self._fetch_and_post(account_breakers=CircuitBreakers(name='account')),
+            {'bar': 100},
+        )
+
+        get_twitter_user_timeline_mock.side_effect = [rate_limited]
+        with self.assertRaises(_GlobalFetchError):
+            self._fetch_and_post(
+                account_breakers=CircuitBreakers(name='account'), has_quota=False
+            )
+
+
+@patch('twitter_discord_bot.twitter_discord_bot._enqueue_tweets')
+@patch('twitter_discord_bot.twitter_discord_bot.get_twitter_user_timeline')
+class TestControlCommands(unittest.TestCase):
+    def setUp(self) -> None:
+        self.delivery_queues = DeliveryQueues(max_depth=10)
+        self.paused_accounts: set = set()
+        self.save_state = MagicMock()
+
+    def _handle(self, command: ControlCommand) -> dict:
+        return _handle_control_command(
+            command=command,
+            twitter_clients=NonCallableMagicMock(),
+            twitter_accounts=[TwitterAccount(twitter='Foo', discord_channels=['channel'])],
+            twitter_users_infos={'Foo': NonCallableMagicMock()},
+            webhook_routes={'foo': [DISCORD_WEBHOOK_SAMPLE]},
+            discord_webhooks={'channel': DISCORD_WEBHOOK_SAMPLE},
+            last_fetched_posts={'foo': 50},
+            delivery_queues=self.delivery_queues,
+            paused_accounts=self.paused_accounts,
+            save_state=self.save_state,
+        )
+
+    def test_pause_and_resume_account(
+        self, get_twitter_user_timeline_mock: MagicMock, _enqueue_tweets_mock: MagicMock
+    ) -> None:
+        get_twitter_user_timeline_mock.return_value = [NonCallableMagicMock(id=100)]
+
+        command = ControlCommand(action='pause', account='FOO')
+        self.assertEqual(self._handle(command), {'foo': 50})
+        self.assertEqual(command.result, {'account': 'foo', 'paused': True})
+        self.assertEqual(self.paused_accounts, {'foo'})
+        get_twitter_user_timeline_mock.assert_not_called()
+
+        # Resuming fetches the account at once
+        command = ControlCommand(action='resume', account='foo')
+        self.assertEqual(self._handle(command), {'foo': 100})
+        self.assertEqual(command.result, {'account': 'foo', 'paused': False, 'last_id': 100})
+        self.assertEqual(self.paused_accounts, set())
+        self.assertEqual(get_twitter_user_timeline_mock.call_args.kwargs['since_id'], 50)
+
+    def test_pause_channel_and_inspect_queues(
+        self, _get_twitter_user_timeline_mock: MagicMock, _enqueue_tweets_mock: MagicMock
+    ) -> None:
+        command = ControlCommand(action='pause', channel='Channel')
+        self._handle(command)
+        self.assertIsNone(command.error)
+        self.assertTrue(self.delivery_queues.is_paused(DISCORD_WEBHOOK_SAMPLE))
+
+        command = ControlCommand(action='queues')
+        self._handle(command)
+        self.assertEqual(command.result['paused_accounts'], [])
+        self.assertEqual(len(command.result['webhooks']), 1)
+        self.assertEqual(command.result['webhooks'][0]['channels'], ['channel'])
+        self.assertTrue(command.result['webhooks'][0]['paused'])
+        self.assertEqual(command.result['webhooks'][0]['depth'], 0)
+
+    def test_invalid_command(
+        self, _get_twitter_user_timeline_mock: MagicMock, _enqueue_tweets_mock: MagicMock
+    ) -> None:
+        for command in [
+            ControlCommand(action='fetch', account='bar'),
+            ControlCommand(action='fetch', channel='channel'),
+            ControlCommand(action='resume', channel='unknown'),
+        ]:
+            self._handle(command)
+            self.assertTrue(command.done.is_set())
+            self.assertIsNotNone(command.error)
+        self.save_state.assert_not_called()
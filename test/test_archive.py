@@ -0,0 +1,110 @@
+"""Test"""
+# pylint: disable=C
+
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+
+import tweepy.models
+
+from twitter_discord_bot.archive import TweetArchive
+
+
+def _make_status(status_id: int, created_at: float) -> tweepy.models.Status:
+    status = tweepy.models.Status.parse(
+        None, {'id': status_id, 'id_str': str(status_id), 'full_text': f'tweet {status_id}'}
+    )
+    status.created_at = datetime.fromtimestamp(created_at, tz=timezone.utc)
+    return status
+
+
+class TestTweetArchive(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def _fill(self, archive: TweetArchive) -> None:
+        for status_id in range(10):
+            archive.append(
+                screen_name='Foo' if status_id % 2 else 'bar',
+                status=_make_status(status_id, created_at=1000 + status_id),
+            )
+
+    def test_segments(self) -> None:
+        archive = TweetArchive(directory=self.temp_dir.name, segment_size=4)
+        self._fill(archive)
+
+        self.assertEqual(
+            sorted(os.listdir(self.temp_dir.name)),
+            [
+                'index.bin',
+                'segment-000000.jsonl.gz',
+                'segment-000001.jsonl.gz',
+                'segment-000002.jsonl',
+            ],
+        )
+        self.assertEqual(len(archive), 10)
+        self.assertFalse(archive.append(screen_name='bar', status=_make_status(0, 1000)))
+
+    def test_query(self) -> None:
+        archive = TweetArchive(directory=self.temp_dir.name, segment_size=4)
+        self._fill(archive)
+
+        self.assertEqual(
+            [archived_tweet.status_id for archived_tweet in archive.query()],
+            list(range(10)),
+        )
+        self.assertEqual(
+            [
+                archived_tweet.status_id
+                for archived_tweet in archive.query(screen_names=['foo'], since=1003, until=1009)
+            ],
+            [3, 5, 7],
+        )
+
+        status = archive.query(since=1009)[0].to_status()
+        self.assertEqual(status.id, 9)
+        self.assertEqual(status.full_text, 'tweet 9')
+        self.assertEqual(status.created_at.timestamp(), 1009)
+
+    def test_reopen(self) -> None:
+        self._fill(TweetArchive(directory=self.temp_dir.name, segment_size=4))
+
+        archive = TweetArchive(directory=self.temp_dir.name, segment_size=4)
+        self.assertIn(9, archive)
+        self.assertTrue(archive.append(screen_name='foo', status=_make_status(10, 1010)))
+        self.assertTrue(archive.append(screen_name='foo', status=_make_status(11, 1011)))
+
+        self.assertEqual(len(archive.query(screen_names=['FOO'])), 7)
+        self.assertIn('segment-000002.jsonl.gz', os.listdir(self.temp_dir.name))
+
+    def test_read_only(self) -> None:
+        archive = TweetArchive(directory=self.temp_dir.name, segment_size=6)
+        self._fill(archive)
+        filenames = sorted(os.listdir(self.temp_dir.name))
+        self.assertIn('segment-000001.jsonl', filenames)
+
+        # The full segment is left to the writer even with a smaller size
+        reader = TweetArchive(directory=self.temp_dir.name, segment_size=4, read_only=True)
+        self.assertEqual(len(reader.query()), 10)
+        self.assertEqual(sorted(os.listdir(self.temp_dir.name)), filenames)
+        with self.assertRaises(ValueError):
+            reader.append(screen_name='foo', status=_make_status(10, 1010))
+
+    def test_reopen_after_crash(self) -> None:
+        self._fill(TweetArchive(directory=self.temp_dir.name, segment_size=4))
+        # Killed after writing a tweet but before indexing it, and in the middle of a line
+        with open(
+            os.path.join(self.temp_dir.name, 'segment-000002.jsonl'), 'a', encoding='utf-8'
+        ) as segment_file:
+            segment_file.write('{"id": 10, "screen_name": "foo"}\n{"id": 11, "scr')
+
+        archive = TweetArchive(directory=self.temp_dir.name, segment_size=4)
+        self.assertNotIn(10, archive)
+        self.assertTrue(archive.append(screen_name='foo', status=_make_status(12, 1012)))
+
+        self.assertEqual(
+            [archived_tweet.status_id for archived_tweet in archive.query(since=1008)],
+            [8, 9, 12],
+        )
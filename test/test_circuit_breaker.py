@@ -0,0 +1,74 @@
+"""Test"""
+# pylint: disable=C
+
+import logging
+import unittest
+from unittest.mock import MagicMock, patch
+
+from twitter_discord_bot.circuit_breaker import CircuitBreakers
+
+module_logger = logging.getLogger('twitter_discord_bot.circuit_breaker')
+module_logger.setLevel(logging.CRITICAL)
+
+
+@patch('twitter_discord_bot.circuit_breaker.time.time')
+class TestCircuitBreakers(unittest.TestCase):
+    def test_open_and_probe(self, time_mock: MagicMock) -> None:
+        breakers = CircuitBreakers(
+            name='account', failure_threshold=2, base_backoff_seconds=10, max_backoff_seconds=25
+        )
+        time_mock.return_value = 0
+
+        breakers.record_failure('foo')
+        self.assertTrue(breakers.allow('foo'))
+        breakers.record_failure('foo')
+        self.assertFalse(breakers.allow('foo'))
+        self.assertTrue(breakers.allow('bar'))
+
+        # Half-open after the backoff, and the backoff doubles if the probe fails
+        time_mock.return_value = 10
+        self.assertTrue(breakers.allow('foo'))
+        breakers.record_failure('foo')
+        time_mock.return_value = 29
+        self.assertFalse(breakers.allow('foo'))
+        time_mock.return_value = 30
+        self.assertTrue(breakers.allow('foo'))
+
+        # Capped by the max backoff
+        breakers.record_failure('foo')
+        time_mock.return_value = 55
+        self.assertTrue(breakers.allow('foo'))
+
+        breakers.record_success('foo')
+        breakers.record_failure('foo')
+        self.assertTrue(breakers.allow('foo'))
+
+    def test_restore_states(self, time_mock: MagicMock) -> None:
+        time_mock.return_value = 0
+        breakers = CircuitBreakers(name='webhook', failure_threshold=1)
+        breakers.record_failure('foo')
+
+        restored_breakers = CircuitBreakers(name='webhook', failure_threshold=1)
+        restored_breakers.restore_states(breakers.get_states())
+
+        self.assertFalse(restored_breakers.allow('foo'))
+        self.assertEqual(restored_breakers.get_states(), breakers.get_states())
+
+    def test_restore_invalid_states(self, time_mock: MagicMock) -> None:
+        time_mock.return_value = 0
+        breakers = CircuitBreakers(name='account')
+        breakers.restore_states({
+            'foo': {'failure_count': 1, 'bogus': 2},
+            'bar': {'opened_until': 'tomorrow'},
+            'baz': None,  # type: ignore
+            'qux': {'failure_count': 3, 'open_count': 1, 'opened_until': 100},
+        })
+
+        self.assertEqual(breakers.get_states(), {
+            'qux': {'failure_count': 3, 'open_count': 1, 'opened_until': 100.0},
+        })
+        self.assertFalse(breakers.allow('qux'))
+
+        breakers = CircuitBreakers(name='account')
+        breakers.restore_states([])  # type: ignore
+        self.assertEqual(breakers.get_states(), {})
@@ -0,0 +1,125 @@
+"""Test"""
+# pylint: disable=C
+
+import logging
+import time
+import unittest
+from threading import Lock
+from typing import Any, List, Optional
+
+import requests
+
+from twitter_discord_bot.concurrency import AIMDLimiter
+from twitter_discord_bot.delivery import is_discord_overloaded
+
+from .help import FakeHTTPServer, QuietHandler
+
+module_logger = logging.getLogger('twitter_discord_bot.concurrency')
+module_logger.setLevel(logging.CRITICAL)
+
+
+class _SlowServer(FakeHTTPServer):
+    """Answer after `delay_seconds` with `status_code`, and track the requests in flight"""
+
+    def __init__(self) -> None:
+        self.delay_seconds = 0.0
+        self.status_code = 204
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = Lock()
+        slow_server = self
+
+        class Handler(QuietHandler):
+            def do_POST(self) -> None:
+                with slow_server._lock:
+                    slow_server.in_flight += 1
+                    slow_server.max_in_flight = max(
+                        slow_server.max_in_flight, slow_server.in_flight
+                    )
+                time.sleep(slow_server.delay_seconds)
+                with slow_server._lock:
+                    slow_server.in_flight -= 1
+                self.send_response(slow_server.status_code)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+        super().__init__(Handler)
+
+
+def _post(url: str, timeout: float = 5) -> Optional[int]:
+    try:
+        return requests.post(url, timeout=timeout).status_code
+    except requests.RequestException:
+        return None
+
+
+class TestAIMDLimiter(unittest.TestCase):
+    def _create(self, **kwargs: Any) -> AIMDLimiter:
+        return AIMDLimiter(
+            name='test',
+            is_overloaded=is_discord_overloaded,
+            initial_limit=2,
+            max_limit=8,
+            latency_threshold_seconds=1,
+            **kwargs,
+        )
+
+    def _send(
+        self, limiter: AIMDLimiter, url: str, count: int, timeout: float = 5
+    ) -> List[Optional[int]]:
+        futures = [limiter.submit(_post, url, timeout=timeout) for _ in range(count)]
+        return [future.result() for future in futures]
+
+    def test_increase_when_fast(self) -> None:
+        limiter = self._create()
+        with _SlowServer() as slow_server:
+            slow_server.delay_seconds = 0.02
+            self.assertEqual(self._send(limiter, slow_server.url, 60), [204] * 60)
+
+        self.assertEqual(limiter.limit, 8)
+        self.assertLessEqual(slow_server.max_in_flight, 8)
+        self.assertGreater(slow_server.max_in_flight, 2)
+        self.assertEqual(limiter.get_stats()['request_count'], 60)
+        self.assertEqual(limiter.get_stats()['in_flight'], 0)
+
+    def test_decrease_when_overloaded(self) -> None:
+        limiter = self._create(min_limit=1)
+        with _SlowServer() as slow_server:
+            slow_server.delay_seconds = 0.01
+            self._send(limiter, slow_server.url, 60)
+            self.assertEqual(limiter.limit, 8)
+
+            # Server errors halve the limit, once per threshold
+            slow_server.status_code = 503
+            self._send(limiter, slow_server.url, 8)
+            self.assertEqual(limiter.limit, 4)
+
+            # So do timeouts
+            slow_server.status_code = 204
+            slow_server.delay_seconds = 1
+            time.sleep(1)
+            self.assertEqual(self._send(limiter, slow_server.url, 4, timeout=0.5), [None] * 4)
+            self.assertEqual(limiter.limit, 2)
+            self.assertEqual(limiter.get_stats()['overload_count'], 12)
+
+    def test_decrease_when_slow(self) -> None:
+        limiter = self._create()
+        with _SlowServer() as slow_server:
+            slow_server.delay_seconds = 1.2
+            self.assertEqual(self._send(limiter, slow_server.url, 2), [204, 204])
+        self.assertEqual(limiter.limit, 1)
+
+    def test_error_is_raised(self) -> None:
+        limiter = self._create()
+
+        def _fail() -> None:
+            raise ValueError('failed')
+
+        with self.assertRaises(ValueError):
+            limiter.submit(_fail).result()
+        self.assertEqual(limiter.get_stats()['overload_count'], 1)
+        self.assertEqual(limiter.in_flight, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
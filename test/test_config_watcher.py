@@ -0,0 +1,27 @@
+"""Test"""
+# pylint: disable=C
+
+import os
+import tempfile
+import unittest
+
+from twitter_discord_bot.config_watcher import ConfigWatcher
+
+
+class TestConfigWatcher(unittest.TestCase):
+    def test_has_changed(self) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'twitter_accounts.yml')
+            with open(path, 'w', encoding='utf-8') as config_file:
+                config_file.write('---\n')
+
+            watcher = ConfigWatcher(paths=[path])
+            self.assertFalse(watcher.has_changed())
+
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+            self.assertTrue(watcher.has_changed())
+            self.assertFalse(watcher.has_changed())
+
+            os.remove(path)
+            self.assertTrue(watcher.has_changed())
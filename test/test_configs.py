@@ -0,0 +1,53 @@
+"""Test"""
+# pylint: disable=C
+
+import os
+import tempfile
+import unittest
+
+from twitter_discord_bot.configs import (
+    DISCORD_WEBHOOKS_PATH,
+    TWITTER_ACCOUNTS_PATH,
+    TenantPaths,
+    get_tenants,
+)
+
+
+class TestGetTenants(unittest.TestCase):
+    def test_tenants(self) -> None:
+        with tempfile.TemporaryDirectory() as tenants_directory:
+            for name in ['b', 'a']:
+                os.mkdir(os.path.join(tenants_directory, name))
+            with open(os.path.join(tenants_directory, 'README'), 'w', encoding='utf-8'):
+                pass
+
+            tenants = get_tenants(tenants_directory=tenants_directory)
+
+        self.assertEqual(
+            tenants,
+            [
+                TenantPaths(
+                    name=name,
+                    twitter_accounts_path=os.path.join(
+                        tenants_directory, name, 'twitter_accounts.yml'
+                    ),
+                    discord_webhooks_path=os.path.join(
+                        tenants_directory, name, 'discord_webhooks.ini'
+                    ),
+                )
+                for name in ['a', 'b']
+            ],
+        )
+
+    def test_without_tenants(self) -> None:
+        with tempfile.TemporaryDirectory() as tenants_directory:
+            self.assertEqual(
+                get_tenants(tenants_directory=os.path.join(tenants_directory, 'tenants')),
+                [
+                    TenantPaths(
+                        name='',
+                        twitter_accounts_path=TWITTER_ACCOUNTS_PATH,
+                        discord_webhooks_path=DISCORD_WEBHOOKS_PATH,
+                    )
+                ],
+            )
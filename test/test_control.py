@@ -0,0 +1,100 @@
+"""Test"""
+# pylint: disable=C
+
+import json
+import logging
+import unittest
+import urllib.error
+import urllib.request
+from threading import Event, Thread
+from typing import Any, Dict, Tuple
+
+from twitter_discord_bot.control import ControlServer
+
+module_logger = logging.getLogger('twitter_discord_bot.control')
+module_logger.setLevel(logging.CRITICAL)
+
+
+class TestControlServer(unittest.TestCase):
+    def setUp(self) -> None:
+        self.wake_up = Event()
+        self.control_server = ControlServer(
+            wake_up=self.wake_up, port=0, reply_timeout_seconds=5
+        )
+        self.control_server.start()
+
+    def tearDown(self) -> None:
+        self.control_server.stop()
+
+    def _request(self, method: str, path: str) -> Tuple[int, Dict[str, Any]]:
+        request = urllib.request.Request(
+            f'http://127.0.0.1:{self.control_server.port}{path}', method=method
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return response.status, json.load(response)
+        except urllib.error.HTTPError as error:
+            with error:
+                return error.code, json.load(error)
+
+    def _serve_main_loop(self, result: Any = None, error: Any = None) -> Thread:
+        """Act as the main loop, reply to the first command after being woken up"""
+        def _main_loop() -> None:
+            self.assertTrue(self.wake_up.wait(5))
+            commands = self.control_server.take_commands()
+            self.commands.extend(commands)
+            for command in commands:
+                command.finish(result=result, error=error)
+
+        self.commands = []  # type: ignore
+        thread = Thread(target=_main_loop)
+        thread.start()
+        return thread
+
+    def test_command(self) -> None:
+        thread = self._serve_main_loop(result={'account': 'foo', 'paused': True})
+        code, body = self._request('POST', '/pause?account=Foo')
+        thread.join()
+
+        self.assertEqual(code, 200)
+        self.assertEqual(body, {'result': {'account': 'foo', 'paused': True}})
+        self.assertEqual(len(self.commands), 1)
+        self.assertEqual(self.commands[0].action, 'pause')
+        self.assertEqual(self.commands[0].account, 'Foo')
+        self.assertIsNone(self.commands[0].channel)
+
+    def test_command_error(self) -> None:
+        thread = self._serve_main_loop(error='Unknown Discord channel: bar')
+        code, body = self._request('POST', '/resume?channel=bar')
+        thread.join()
+
+        self.assertEqual(code, 400)
+        self.assertEqual(body, {'error': 'Unknown Discord channel: bar'})
+
+    def test_invalid_request(self) -> None:
+        self.assertEqual(self._request('POST', '/restart')[0], 404)
+        self.assertEqual(self._request('GET', '/fetch?account=foo')[0], 405)
+        self.assertEqual(self._request('POST', '/fetch')[0], 400)
+        # Rejected without bothering the main loop
+        self.assertFalse(self.wake_up.is_set())
+        self.assertEqual(self.control_server.take_commands(), [])
+
+    def test_stop_with_queued_command(self) -> None:
+        replies = []
+        thread = Thread(target=lambda: replies.append(self._request('GET', '/queues')))
+        thread.start()
+        self.assertTrue(self.wake_up.wait(5))
+
+        self.control_server.stop()
+        thread.join()
+
+        self.assertEqual(replies, [(400, {'error': 'The bot is stopping.'})])
+
+    def test_stop_not_started(self) -> None:
+        control_server = ControlServer(wake_up=Event(), port=0)
+        control_server.stop()
+        control_server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,320 @@
+"""Test"""
+# pylint: disable=C
+
+import logging
+import time
+import unittest
+from typing import List
+from unittest.mock import MagicMock, patch
+
+from twitter_discord_bot.concurrency import AIMDLimiter
+from twitter_discord_bot.delivery import (
+    DISCORD_CONTENT_LIMIT,
+    DeliveryQueues,
+    PendingDelivery,
+    is_discord_overloaded,
+)
+from twitter_discord_bot.discord_api import DiscordPost
+from twitter_discord_bot.models import TwitterAccount
+from twitter_discord_bot.webhook_health import WebhookRegistry
+
+from .help import DISCORD_WEBHOOK_SAMPLE, TWITTER_USER_SAMPLE
+
+module_logger = logging.getLogger('twitter_discord_bot.delivery')
+module_logger.setLevel(logging.CRITICAL)
+
+
+def _make_deliveries(
+    count: int,
+    screen_name: str = TWITTER_USER_SAMPLE['screen_name'],
+    created_at: float = 0.0,
+    enqueued_at: float = 0.0,
+) -> List[PendingDelivery]:
+    created_at = created_at or time.time()
+    enqueued_at = enqueued_at or time.time()
+    return [
+        PendingDelivery(
+            screen_name=screen_name,
+            status_id=1_000_000_000_000_000_000 + status_id,
+            post=DiscordPost(
+                username=TWITTER_USER_SAMPLE['name'],
+                avatar_url=TWITTER_USER_SAMPLE['profile_image_url_orig'],
+                content=str(status_id),
+            ),
+            created_at=created_at,
+            enqueued_at=enqueued_at,
+        )
+        for status_id in range(count)
+    ]
+
+
+@patch.object(DiscordPost, 'save', autospec=True, return_value=204)
+class TestDeliveryQueues(unittest.TestCase):
+    def test_deliver_in_order(self, save_mock: MagicMock) -> None:
+        delivery_queues = DeliveryQueues(max_depth=10)
+        deliveries = _make_deliveries(5)
+        for delivery in deliveries:
+            delivery_queues.enqueue(DISCORD_WEBHOOK_SAMPLE, delivery)
+
+        delivery_queues.deliver(sleep_seconds=0)
+
+        self.assertEqual(
+            [call.args[0] for call in save_mock.call_args_list],
+            [delivery.post for delivery in deliveries],
+        )
+        self.assertEqual(delivery_queues.get_pending(), {})
+
+    def test_deliver_round_robin(self, save_mock: MagicMock) -> None:
+        delivery_queues = DeliveryQueues(max_depth=10)
+        for delivery in _make_deliveries(3):
+            delivery_queues.enqueue('webhook_a', delivery)
+        delivery_queues.enqueue('webhook_b', _make_deliveries(1)[0])
+
+        delivery_queues.deliver(sleep_seconds=1)
+
+        self.assertEqual(
+            [
+                (call.kwargs['webhook_url'], call.kwargs['sleep_seconds'])
+                for call in save_mock.call_args_list
+            ],
+            [('webhook_a', 0.5), ('webhook_b', 0.5), ('webhook_a', 1), ('webhook_a', 1)],
+        )
+
+    def test_deliver_by_priority(self, save_mock: MagicMock) -> None:
+        delivery_queues = DeliveryQueues(max_depth=10)
+        delivery_queues.set_priorities([
+            TwitterAccount(twitter='bulk'),
+            TwitterAccount(twitter='News', priority=2),
+        ])
+        for delivery in _make_deliveries(6, screen_name='bulk'):
+            delivery_queues.enqueue(DISCORD_WEBHOOK_SAMPLE, delivery)
+        for delivery in _make_deliveries(3, screen_name='news'):
+            delivery_queues.enqueue(DISCORD_WEBHOOK_SAMPLE, delivery)
+
+        delivery_queues.deliver(sleep_seconds=0)
+
+        self.assertEqual(
+            [call.args[0].content for call in save_mock.call_args_list],
+            ['0', '1', '0', '2', '1', '2', '3', '4', '5'],
+        )
+
+    def test_retry_keeps_turn(self, save_mock: MagicMock) -> None:
+        delivery_queues = DeliveryQueues(max_depth=10)
+        delivery_queues.set_priorities([TwitterAccount(twitter='foo', priority=2)])
+        foo_deliveries = _make_deliveries(2, screen_name='foo')
+        bar_deliveries = _make_deliveries(2, screen_name='bar')
+        for delivery in foo_deliveries + bar_deliveries:
+            delivery_queues.enqueue(DISCORD_WEBHOOK_SAMPLE, delivery)
+
+        save_mock.side_effect = [204, 500, 204, 204, 204]
+        delivery_queues.deliver(sleep_seconds=0)
+        self.assertEqual(save_mock.call_count, 2)
+        delivery_queues.deliver(sleep_seconds=0)
+
+        self.assertEqual(
+            [call.args[0] for call in save_mock.call_args_list],
+            [delivery.post for delivery in foo_deliveries + foo_deliveries[1:] + bar_deliveries],
+        )
+
+    def test_split_long_post(self, save_mock: MagicMock) -> None:
+        delivery_queues = DeliveryQueues(max_depth=1)
+        delivery = _make_deliveries(1)[0]
+        delivery.post.content = '\n'.join(['a' * 1000] * 3)
+        delivery_queues.enqueue(DISCORD_WEBHOOK_SAMPLE, delivery)
+
+        delivery_queues.deliver(sleep_seconds=0)
+
+        # The parts of the same tweet count as one
+        posts = [call.args[0] for call in save_mock.call_args_list]
+        self.assertEqual([post.content for post in posts], ['a' * 1000] * 3)
+
+    def test_split_post_in_one_turn(self, save_mock: MagicMock) -> None:
+        delivery_queues = DeliveryQueues(max_depth=10)
+        foo_deliveries = _make_deliveries(1, screen_name='foo')
+        foo_deliveries[0].post.content = '\n'.join(['a' * 1000] * 3)
+        bar_deliveries = _make_deliveries(2, screen_name='bar')
+        for delivery in foo_deliveries + bar_deliveries:
+            delivery_queues.enqueue(DISCORD_WEBHOOK_SAMPLE, delivery)
+
+        save_mock.side_effect = [204, 500, 204, 204, 204, 204]
+        delivery_queues.deliver(sleep_seconds=0)
+        delivery_queues.deliver(sleep_seconds=0)
+
+        # The retried part keeps the turn too
+        self.assertEqual(
+            [call.args[0].content[-1] for call in save_mock.call_args_list],
+            ['a', 'a', 'a', 'a', '0', '1'],
+        )
+
+    def test_compact_split_post(self, save_mock: MagicMock) -> None:
+        delivery_queues = DeliveryQueues(max_depth=1)
+        deliveries = _make_deliveries(2)
+        deliveries[1].post.content = '\n'.join(['a' * 1000] * 3)
+        for delivery in deliveries:
+            delivery_queues.enqueue(DISCORD_WEBHOOK_SAMPLE, delivery)
+
+        delivery_queues.deliver(sleep_seconds=0)
+
+        posts = [call.args[0] for call in save_mock.call_args_list]
+        self.assertEqual(len(posts), 4)
+        self.assertTrue(posts[0].content.startswith('1 earlier tweet(s)'))
+        self.assertIn(deliveries[0].link, posts[0].content)
+        self.assertNotIn(deliveries[1].link, posts[0].content)
+        self.assertEqual([post.content for post in posts[1:]], ['a' * 1000] * 3)
+
+    def test_skip_quarantined_webhook(self, save_mock: MagicMock) -> None:
+        webhook_registry = WebhookRegistry()
+        delivery_queues = DeliveryQueues(max_depth=10, webhook_registry=webhook_registry)
+        webhook_a = f'{DISCORD_WEBHOOK_SAMPLE}/a/token'
+        webhook_b = f'{DISCORD_WEBHOOK_SAMPLE}/b/token'
+        for delivery in _make_deliveries(3):
+            delivery_queues.enqueue(webhook_a, delivery)
+            delivery_queues.enqueue(webhook_b, delivery)
+        save_mock.side_effect = lambda _post, webhook_url, **_kwargs: (
+            404 if webhook_url == webhook_a else 204
+        )
+
+        delivery_queues.deliver(sleep_seconds=0)
+
+        self.assertEqual(
+            [call.kwargs['webhook_url'] for call in save_mock.call_args_list],
+            [webhook_a, webhook_b, webhook_b, webhook_b],
+        )
+        self.assertTrue(webhook_registry.is_quarantined(webhook_a))
+
+    def test_deliver_concurrently(self, save_mock: MagicMock) -> None:
+        delivery_limiter = AIMDLimiter(
+            name='delivery', is_overloaded=is_discord_overloaded, initial_limit=3, max_limit=3
+        )
+        delivery_queues = DeliveryQueues(max_depth=10, delivery_limiter=delivery_limiter)
+        webhook_urls = [f'{DISCORD_WEBHOOK_SAMPLE}/{name}/token' for name in 'abc']
+        for webhook_url in webhook_urls:
+            for delivery in _make_deliveries(3):
+                delivery_queues.enqueue(webhook_url, delivery)
+        save_mock.side_effect = lambda _post, webhook_url, **_kwargs: (
+            500 if webhook_url == webhook_urls[2] else 204
+        )
+
+        delivery_queues.deliver(sleep_seconds=0)
+
+        # The posts to each webhook are still in order
+        for webhook_url in webhook_urls[:2]:
+            self.assertEqual(
+                [
+                    call.args[0].content for call in save_mock.call_args_list
+                    if call.kwargs['webhook_url'] == webhook_url
+                ],
+                ['0', '1', '2'],
+            )
+        self.assertEqual(list(delivery_queues.get_pending()), [webhook_urls[2]])
+        self.assertEqual(len(delivery_queues.get_pending()[webhook_urls[2]]), 3)
+        self.assertEqual(delivery_limiter.get_stats()['request_count'], 7)
+
+    def test_pause_webhook(self, save_mock: MagicMock) -> None:
+        delivery_queues = DeliveryQueues(max_depth=10)
+        deliveries = _make_deliveries(2, enqueued_at=time.time() - 30)
+        deliveries[0].post.files = ['100.mp4']
+        for delivery in deliveries:
+            delivery_queues.enqueue(DISCORD_WEBHOOK_SAMPLE, delivery)
+
+        delivery_queues.pause(DISCORD_WEBHOOK_SAMPLE)
+        delivery_queues.deliver(sleep_seconds=0)
+        save_mock.assert_not_called()
+        # Kept in the media cache while queued
+        self.assertEqual(delivery_queues.get_attachments(), {'100.mp4'})
+        stats = delivery_queues.get_stats()[DISCORD_WEBHOOK_SAMPLE]
+        self.assertEqual(stats['depth'], 2)
+        self.assertGreaterEqual(stats['backlog_age_seconds'], 30)
+
+        delivery_queues.resume(DISCORD_WEBHOOK_SAMPLE)
+        delivery_queues.deliver(sleep_seconds=0)
+        self.assertEqual(save_mock.call_count, 2)
+        self.assertEqual(delivery_queues.get_stats()[DISCORD_WEBHOOK_SAMPLE]['depth'], 0)
+
+    def test_compact_over_depth(self, save_mock: MagicMock) -> None:
+        delivery_queues = DeliveryQueues(max_depth=3)
+        deliveries = _make_deliveries(50)
+        for delivery in deliveries:
+            delivery_queues.enqueue(DISCORD_WEBHOOK_SAMPLE, delivery)
+
+        delivery_queues.deliver(sleep_seconds=0)
+
+        posts = [call.args[0] for call in save_mock.call_args_list]
+        # The newest ones are kept as they are
+        self.assertEqual(posts[-3:], [delivery.post for delivery in deliveries[-3:]])
+        digests = posts[:-3]
+        self.assertGreater(len(digests), 1)
+        for digest in digests:
+            self.assertLessEqual(len(digest.content), DISCORD_CONTENT_LIMIT)
+        digest_content = '\n'.join(digest.content for digest in digests)
+        self.assertTrue(digest_content.startswith('47 earlier tweet(s)'))
+        for delivery in deliveries[:-3]:
+            self.assertIn(f'<{delivery.link}>', digest_content)
+
+    def test_no_compaction(self, save_mock: MagicMock) -> None:
+        delivery_queues = DeliveryQueues(max_depth=None, max_age_seconds=float('inf'))
+        deliveries = _make_deliveries(5, enqueued_at=1.0)
+        deliveries[0].post.content = '\n'.join(['a' * 1000] * 3)
+        for delivery in deliveries:
+            delivery_queues.enqueue(DISCORD_WEBHOOK_SAMPLE, delivery)
+
+        delivery_queues.deliver(sleep_seconds=0)
+
+        self.assertEqual(
+            [call.args[0].content for call in save_mock.call_args_list],
+            ['a' * 1000] * 3 + ['1', '2', '3', '4'],
+        )
+
+    def test_compact_over_age(self, save_mock: MagicMock) -> None:
+        delivery_queues = DeliveryQueues(max_depth=10, max_age_seconds=60)
+        old_deliveries = _make_deliveries(2, screen_name='foo', enqueued_at=time.time() - 120)
+        # Tweets just fetched are posted however old they are
+        new_deliveries = _make_deliveries(2, screen_name='bar', created_at=time.time() - 120)
+        for delivery in old_deliveries + new_deliveries:
+            delivery_queues.enqueue(DISCORD_WEBHOOK_SAMPLE, delivery)
+
+        delivery_queues.deliver(sleep_seconds=0)
+
+        posts = [call.args[0] for call in save_mock.call_args_list]
+        self.assertEqual(len(posts), 3)
+        self.assertTrue(posts[0].content.startswith('2 earlier tweet(s) from foo:'))
+        self.assertEqual(posts[1:], [delivery.post for delivery in new_deliveries])
+
+    def test_stop_and_restore_pending(self, save_mock: MagicMock) -> None:
+        delivery_queues = DeliveryQueues(max_depth=10)
+        deliveries = _make_deliveries(3)
+        for delivery in deliveries:
+            delivery_queues.enqueue(DISCORD_WEBHOOK_SAMPLE, delivery)
+
+        delivery_queues.deliver(should_stop=lambda: save_mock.call_count >= 1, sleep_seconds=0)
+
+        restored_queues = DeliveryQueues()
+        restored_queues.restore_pending(delivery_queues.get_pending())
+        self.assertEqual(
+            restored_queues.get_pending()[DISCORD_WEBHOOK_SAMPLE][0]['enqueued_at'],
+            deliveries[1].enqueued_at,
+        )
+        restored_queues.deliver(sleep_seconds=0)
+
+        self.assertEqual(
+            [call.args[0] for call in save_mock.call_args_list],
+            [delivery.post for delivery in deliveries],
+        )
+
+    def test_restore_invalid_pending(self, save_mock: MagicMock) -> None:
+        delivery_dict = _make_deliveries(1)[0].to_dict()
+        delivery_queues = DeliveryQueues()
+        delivery_queues.restore_pending({
+            DISCORD_WEBHOOK_SAMPLE: [
+                {key: value for key, value in delivery_dict.items() if key != 'post'},
+                {**delivery_dict, 'bogus': 1},
+                {**delivery_dict, 'created_at': 'yesterday'},
+                {**delivery_dict, 'post': {**delivery_dict['post'], 'content': None}},
+                None,
+                delivery_dict,
+            ],
+            f'{DISCORD_WEBHOOK_SAMPLE}/2': None,  # type: ignore
+        })
+
+        self.assertEqual(delivery_queues.get_pending(), {DISCORD_WEBHOOK_SAMPLE: [delivery_dict]})
+        save_mock.assert_not_called()
@@ -6,6 +6,7 @@ import unittest
 from unittest.mock import MagicMock, NonCallableMagicMock, patch
 
 from twitter_discord_bot.discord_api import DiscordPost
+from twitter_discord_bot.hydration import TweetHydrator
 
 from .help import (
     DISCORD_WEBHOOK_SAMPLE,
@@ -148,6 +149,113 @@ class TestDiscordPost(unittest.TestCase):
         )
         self.assertIsNone(post.embeds)
 
+    def _get_hydrated_status_mock(self) -> NonCallableMagicMock:
+        original_status_mock = NonCallableMagicMock(
+            spec=['id', 'text', 'full_text', 'user', 'extended_entities']
+        )
+        original_status_mock.id = TWITTER_STATUS_SAMPLE_2['id']
+        original_status_mock.full_text = TWITTER_STATUS_SAMPLE_2['full_text']
+        original_status_mock.user.name = TWITTER_USER_SAMPLE_2['name']
+        original_status_mock.user.screen_name = TWITTER_USER_SAMPLE_2['screen_name']
+        original_status_mock.user.profile_image_url_https = (
+            TWITTER_USER_SAMPLE_2['profile_image_url']
+        )
+        original_status_mock.extended_entities = {
+            'media': [
+                {'media_url_https': TWITTER_STATUS_SAMPLE_2['media_url_https']},
+                {'media_url_https': TWITTER_STATUS_SAMPLE['media_url_https']},
+            ]
+        }
+        return original_status_mock
+
+    def _assert_hydrated_embeds(self, embeds: typing.List[typing.Dict[str, typing.Any]]) -> None:
+        url = (
+            f'https://twitter.com/{TWITTER_USER_SAMPLE_2["screen_name"]}/status/'
+            f'{TWITTER_STATUS_SAMPLE_2["id"]}'
+        )
+        self.assertEqual(
+            embeds,
+            [
+                {
+                    'author': {
+                        'name': (
+                            f'{TWITTER_USER_SAMPLE_2["name"]} '
+                            f'(@{TWITTER_USER_SAMPLE_2["screen_name"]})'
+                        ),
+                        'url': f'https://twitter.com/{TWITTER_USER_SAMPLE_2["screen_name"]}',
+                        'icon_url': TWITTER_USER_SAMPLE_2['profile_image_url'],
+                    },
+                    'description': TWITTER_STATUS_SAMPLE_2['full_text'],
+                    'url': url,
+                    'image': {'url': TWITTER_STATUS_SAMPLE_2['media_url_https']},
+                },
+                {'url': url, 'image': {'url': TWITTER_STATUS_SAMPLE['media_url_https']}},
+            ],
+        )
+
+    def test_generate_from_twitter_status_hydrated_retweet(self) -> None:
+
+        user_mock = get_user_mock()
+        original_status_mock = self._get_hydrated_status_mock()
+
+        status_mock = NonCallableMagicMock(spec=['id', 'text', 'retweeted_status'])
+        status_mock.id = TWITTER_STATUS_SAMPLE['id']
+        status_mock.text = TWITTER_STATUS_SAMPLE['text']
+        status_mock.retweeted_status = original_status_mock
+        hydrator_mock = NonCallableMagicMock(spec=TweetHydrator)
+        hydrator_mock.get.return_value = original_status_mock
+
+        post = DiscordPost.generate_from_twitter_status(
+            user=user_mock,
+            status=status_mock,
+            hydrator=hydrator_mock,
+        )
+
+        hydrator_mock.get.assert_called_once_with(TWITTER_STATUS_SAMPLE_2['id'])
+        self.assertEqual(
+            post.content,
+            (
+                f'RT: <http://twitter.com/{TWITTER_USER_SAMPLE["screen_name"]}/status/'
+                f'{TWITTER_STATUS_SAMPLE["id"]}>'
+            ),
+        )
+        self._assert_hydrated_embeds(post.embeds)
+
+        # Not looked up
+        hydrator_mock.get.return_value = None
+        post = DiscordPost.generate_from_twitter_status(
+            user=user_mock,
+            status=status_mock,
+            hydrator=hydrator_mock,
+        )
+        self.assertTrue(post.content.startswith('RT: http://twitter.com/_/status/'))
+        self.assertIsNone(post.embeds)
+
+    def test_generate_from_twitter_status_hydrated_quote(self) -> None:
+
+        user_mock = get_user_mock()
+        quoted_status_mock = self._get_hydrated_status_mock()
+
+        status_mock = NonCallableMagicMock(
+            spec=['id', 'text', 'full_text', 'is_quote_status', 'quoted_status_id']
+        )
+        status_mock.id = TWITTER_STATUS_SAMPLE['id']
+        status_mock.full_text = TWITTER_STATUS_SAMPLE['full_text']
+        status_mock.is_quote_status = True
+        status_mock.quoted_status_id = TWITTER_STATUS_SAMPLE_2['id']
+        hydrator_mock = NonCallableMagicMock(spec=TweetHydrator)
+        hydrator_mock.get.return_value = quoted_status_mock
+
+        post = DiscordPost.generate_from_twitter_status(
+            user=user_mock,
+            status=status_mock,
+            hydrator=hydrator_mock,
+        )
+
+        hydrator_mock.get.assert_called_once_with(TWITTER_STATUS_SAMPLE_2['id'])
+        self.assertTrue(post.content.endswith(TWITTER_STATUS_SAMPLE['full_text']))
+        self._assert_hydrated_embeds(post.embeds)
+
     def test_generate_from_twitter_status_has_video(self) -> None:
 
         user_mock = get_user_mock()
@@ -186,7 +294,7 @@ class TestDiscordPost(unittest.TestCase):
 
     @typing.no_type_check
     @patch('twitter_discord_bot.discord_api.sleep')
-    @patch('requests.post')
+    @patch('twitter_discord_bot.discord_api.HTTP_SESSION.post')
     def test_save_with_embeds(
         self,
         requests_post_mock: MagicMock,
@@ -232,7 +340,7 @@ class TestDiscordPost(unittest.TestCase):
 
     @typing.no_type_check
     @patch('twitter_discord_bot.discord_api.sleep')
-    @patch('requests.post')
+    @patch('twitter_discord_bot.discord_api.HTTP_SESSION.post')
     def test_save_without_embeds(
         self, requests_post_mock: MagicMock, sleep_mock: MagicMock
     ) -> None:
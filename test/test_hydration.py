@@ -0,0 +1,91 @@
+"""Test"""
+# pylint: disable=C
+
+import logging
+import unittest
+from typing import List
+from unittest.mock import MagicMock, NonCallableMagicMock, patch
+
+import tweepy
+
+from twitter_discord_bot.hydration import TweetHydrator, get_referenced_ids
+
+module_logger = logging.getLogger('twitter_discord_bot.hydration')
+module_logger.setLevel(logging.CRITICAL)
+
+
+def _get_retweet_mock(retweeted_id: int) -> NonCallableMagicMock:
+    status_mock = NonCallableMagicMock(spec=['id', 'retweeted_status'])
+    status_mock.retweeted_status.id = retweeted_id
+    return status_mock
+
+
+def _lookup_found(api: object, status_ids: List[int]) -> List[NonCallableMagicMock]:
+    # Odd ids are deleted
+    return [NonCallableMagicMock(id=status_id) for status_id in status_ids if status_id % 2 == 0]
+
+
+class TestGetReferencedIds(unittest.TestCase):
+    def test_retweet_and_quote(self) -> None:
+        quote_mock = NonCallableMagicMock(spec=['id', 'is_quote_status', 'quoted_status_id'])
+        quote_mock.is_quote_status = True
+        quote_mock.quoted_status_id = 20
+        plain_mock = NonCallableMagicMock(spec=['id'])
+
+        self.assertEqual(get_referenced_ids(_get_retweet_mock(10)), [10])
+        self.assertEqual(get_referenced_ids(quote_mock), [20])
+        self.assertEqual(get_referenced_ids(plain_mock), [])
+
+
+@patch('twitter_discord_bot.hydration.lookup_statuses', side_effect=_lookup_found)
+class TestTweetHydrator(unittest.TestCase):
+    def test_batches_and_dedupes(self, lookup_statuses_mock: MagicMock) -> None:
+        hydrator = TweetHydrator(get_api=MagicMock())
+
+        # Retweeted by two accounts
+        hydrator.hydrate(
+            [_get_retweet_mock(status_id) for status_id in range(250)] + [_get_retweet_mock(0)]
+        )
+
+        self.assertEqual(
+            [len(call.kwargs['status_ids']) for call in lookup_statuses_mock.call_args_list],
+            [100, 100, 50],
+        )
+        self.assertEqual(hydrator.lookup_count, 3)
+        self.assertEqual(hydrator.get(4).id, 4)
+
+        # Found or not, the cached tweets are not looked up again
+        hydrator.hydrate([_get_retweet_mock(4), _get_retweet_mock(5)])
+        self.assertEqual(lookup_statuses_mock.call_count, 3)
+        self.assertEqual(hydrator.hit_count, 2)
+        self.assertIn(5, hydrator)
+        self.assertIsNone(hydrator.get(5))
+
+    def test_evict_least_recently_used(self, lookup_statuses_mock: MagicMock) -> None:
+        hydrator = TweetHydrator(get_api=MagicMock(), max_size=2)
+
+        hydrator.hydrate([_get_retweet_mock(2)])
+        hydrator.hydrate([_get_retweet_mock(4)])
+        hydrator.get(2)
+        hydrator.hydrate([_get_retweet_mock(6)])
+
+        self.assertEqual(len(hydrator), 2)
+        self.assertIn(2, hydrator)
+        self.assertNotIn(4, hydrator)
+        self.assertEqual(lookup_statuses_mock.call_count, 3)
+
+    def test_failure_not_cached(self, lookup_statuses_mock: MagicMock) -> None:
+        hydrator = TweetHydrator(get_api=MagicMock())
+        lookup_statuses_mock.side_effect = tweepy.TweepyException('failed')
+
+        hydrator.hydrate([_get_retweet_mock(2)])
+        self.assertNotIn(2, hydrator)
+
+        lookup_statuses_mock.side_effect = _lookup_found
+        hydrator.hydrate([_get_retweet_mock(2)])
+        self.assertEqual(hydrator.get(2).id, 2)
+        self.assertEqual(hydrator.lookup_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+"""Test"""
+# pylint: disable=C
+
+import io
+import json
+import logging
+import queue
+import sys
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from twitter_discord_bot.logging_config import (
+    JsonFormatter,
+    RateLimitFilter,
+    _LazyQueueHandler,
+    parse_level,
+    setup_logging,
+)
+
+
+def _make_record(msg: str, *args: object, level: int = logging.ERROR) -> logging.LogRecord:
+    return logging.LogRecord('test', level, __file__, 1, msg, args, None)
+
+
+class TestRateLimitFilter(unittest.TestCase):
+    @patch('twitter_discord_bot.logging_config.time.monotonic')
+    def test_filter(self, monotonic_mock: MagicMock) -> None:
+        rate_limit_filter = RateLimitFilter(burst=2, period_seconds=60)
+        monotonic_mock.return_value = 0
+
+        results = [
+            rate_limit_filter.filter(_make_record('Failed %s', index)) for index in range(5)
+        ]
+        self.assertEqual(results, [True, True, False, False, False])
+        # Other messages and lower levels are not limited
+        self.assertTrue(rate_limit_filter.filter(_make_record('Other')))
+        for _ in range(5):
+            self.assertTrue(
+                rate_limit_filter.filter(_make_record('Failed %s', 0, level=logging.INFO))
+            )
+
+        monotonic_mock.return_value = 61
+        record = _make_record('Failed %s', 5)
+        self.assertTrue(rate_limit_filter.filter(record))
+        self.assertEqual(record.getMessage(), 'Failed 5 (suppressed 3 similar message(s))')
+
+    def test_from_threads(self) -> None:
+        rate_limit_filter = RateLimitFilter(burst=10, period_seconds=3600)
+        results = []
+
+        def _filter() -> None:
+            for _ in range(100):
+                results.append(rate_limit_filter.filter(_make_record('Failed')))
+
+        threads = [threading.Thread(target=_filter) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 10)
+        self.assertEqual(results.count(False), 790)
+
+
+class TestParseLevel(unittest.TestCase):
+    def test_parse_level(self) -> None:
+        self.assertEqual(parse_level('DEBUG'), logging.DEBUG)
+        self.assertEqual(parse_level('debug'), logging.DEBUG)
+        self.assertEqual(parse_level(' Warning '), logging.WARNING)
+        with self.assertRaisesRegex(ValueError, 'verbose'):
+            parse_level('verbose')
+
+
+class TestJsonFormatter(unittest.TestCase):
+    def test_format(self) -> None:
+        try:
+            raise ValueError('oops')
+        except ValueError:
+            record = logging.LogRecord(
+                'test', logging.ERROR, __file__, 1, 'Failed %d', (1,), sys.exc_info()
+            )
+
+        record_dict = json.loads(JsonFormatter().format(record))
+
+        self.assertEqual(record_dict['level'], 'ERROR')
+        self.assertEqual(record_dict['logger'], 'test')
+        self.assertEqual(record_dict['message'], 'Failed 1')
+        self.assertIn('ValueError: oops', record_dict['exception'])
+
+
+class TestLazyQueueHandler(unittest.TestCase):
+    def test_prepare(self) -> None:
+        try:
+            raise ValueError('oops')
+        except ValueError:
+            record = logging.LogRecord(
+                'test', logging.ERROR, __file__, 1, 'Failed %d', (1,), sys.exc_info()
+            )
+
+        prepared = _LazyQueueHandler(queue.SimpleQueue()).prepare(record)
+
+        self.assertEqual((prepared.msg, prepared.args), ('Failed 1', None))
+        # The traceback is left to the listener
+        self.assertIsNone(prepared.exc_text)
+        self.assertIs(prepared.exc_info, record.exc_info)
+
+
+class TestSetupLogging(unittest.TestCase):
+    def test_setup_logging(self) -> None:
+        root_logger = logging.getLogger()
+        old_handlers = root_logger.handlers[:]
+        old_level = root_logger.level
+        stderr = io.StringIO()
+
+        try:
+            with patch('sys.stderr', stderr):
+                listener = setup_logging(level=logging.INFO, json_output=True)
+            mutable_arg = ['before']
+            logging.getLogger('twitter_discord_bot.test').info('Value: %s', mutable_arg)
+            mutable_arg[0] = 'after'
+            logging.getLogger('twitter_discord_bot.test').debug('Hidden')
+            try:
+                raise ValueError('oops')
+            except ValueError:
+                logging.getLogger('twitter_discord_bot.test').exception('Failed')
+            listener.stop()
+        finally:
+            for handler in root_logger.handlers[:]:
+                root_logger.removeHandler(handler)
+            for handler in old_handlers:
+                root_logger.addHandler(handler)
+            root_logger.setLevel(old_level)
+
+        lines = stderr.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0])['message'], "Value: ['before']")
+        # The traceback is formatted by the listener
+        self.assertIn('ValueError: oops', json.loads(lines[1])['exception'])
@@ -0,0 +1,173 @@
+"""Test"""
+# pylint: disable=C
+
+import json
+import logging
+import os
+import tempfile
+import unittest
+from typing import Any, Dict, List
+from unittest.mock import NonCallableMagicMock, patch
+
+import requests
+
+from twitter_discord_bot.discord_api import DiscordPost
+from twitter_discord_bot.media import MediaCache, select_video_variant
+
+from .help import (
+    TWITTER_STATUS_SAMPLE,
+    TWITTER_USER_SAMPLE,
+    FakeHTTPServer,
+    QuietHandler,
+    get_user_mock,
+)
+
+module_logger = logging.getLogger('twitter_discord_bot.media')
+module_logger.setLevel(logging.CRITICAL)
+
+VIDEO_CONTENT = bytes(range(256)) * 1024
+
+
+class _FakeServer(FakeHTTPServer):
+    """Serve VIDEO_CONTENT on GET and record the bodies of POST requests"""
+
+    def __init__(self) -> None:
+        self.get_paths: List[str] = []
+        self.posted: List[Dict[str, Any]] = []
+        fake_server = self
+
+        class Handler(QuietHandler):
+            def do_GET(self) -> None:
+                fake_server.get_paths.append(self.path)
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(VIDEO_CONTENT)))
+                self.end_headers()
+                self.wfile.write(VIDEO_CONTENT)
+
+            def do_POST(self) -> None:
+                length = int(self.headers['Content-Length'])
+                fake_server.posted.append({
+                    'content_type': self.headers['Content-Type'],
+                    'body': self.rfile.read(length),
+                })
+                self.send_response(204)
+                self.end_headers()
+
+        super().__init__(Handler)
+
+
+def _video_entity(url: str, media_id: str = '100') -> Dict[str, Any]:
+    return {
+        'id_str': media_id,
+        'type': 'video',
+        'media_url_https': 'https://pbs.twimg.com/thumb.jpg',
+        'video_info': {
+            'duration_millis': 1000,
+            'variants': [
+                {'bitrate': 800_000, 'content_type': 'video/mp4', 'url': f'{url}/low.mp4'},
+                {'content_type': 'application/x-mpegURL', 'url': f'{url}/video.m3u8'},
+                {'bitrate': 2_000_000, 'content_type': 'video/mp4', 'url': f'{url}/high.mp4'},
+            ],
+        },
+    }
+
+
+class TestSelectVideoVariant(unittest.TestCase):
+    def test_select_highest_bitrate(self) -> None:
+        variant = select_video_variant(_video_entity('url'), size_limit=1_000_000)
+        self.assertEqual(variant['url'], 'url/high.mp4')  # type: ignore
+
+    def test_select_under_limit(self) -> None:
+        variant = select_video_variant(_video_entity('url'), size_limit=200_000)
+        self.assertEqual(variant['url'], 'url/low.mp4')  # type: ignore
+
+    def test_all_over_limit(self) -> None:
+        self.assertIsNone(select_video_variant(_video_entity('url'), size_limit=1000))
+
+
+class TestMediaCache(unittest.TestCase):
+    def test_download_once(self) -> None:
+        with _FakeServer() as server, tempfile.TemporaryDirectory() as cache_dir:
+            session = requests.Session()
+            self.addCleanup(session.close)
+            media_cache = MediaCache(cache_dir=cache_dir, size_limit=1_000_000, session=session)
+            media_entity = _video_entity(server.url)
+
+            with patch.object(session, 'get', wraps=session.get) as get_mock:
+                paths = {media_cache.get(media_entity) for _ in range(3)}
+
+            self.assertEqual(len(paths), 1)
+            self.assertEqual(server.get_paths, ['/high.mp4'])
+            get_mock.assert_called_once()
+            with open(paths.pop(), 'rb') as video_file:  # type: ignore
+                self.assertEqual(video_file.read(), VIDEO_CONTENT)
+
+    def test_download_too_large(self) -> None:
+        with _FakeServer() as server, tempfile.TemporaryDirectory() as cache_dir:
+            media_cache = MediaCache(cache_dir=cache_dir, size_limit=len(VIDEO_CONTENT) - 1)
+            media_entity = _video_entity(server.url)
+            del media_entity['video_info']['duration_millis']
+
+            self.assertIsNone(media_cache.get(media_entity))
+
+    def test_upload_video(self) -> None:
+        with _FakeServer() as server, tempfile.TemporaryDirectory() as cache_dir:
+            media_cache = MediaCache(cache_dir=cache_dir, size_limit=1_000_000)
+            status_mock = NonCallableMagicMock(spec=['id', 'full_text', 'extended_entities'])
+            status_mock.id = TWITTER_STATUS_SAMPLE['id']
+            status_mock.full_text = TWITTER_STATUS_SAMPLE['full_text']
+            status_mock.extended_entities = {'media': [_video_entity(server.url)]}
+
+            post = DiscordPost.generate_from_twitter_status(
+                user=get_user_mock(),
+                status=status_mock,
+                media_cache=media_cache,
+            )
+            self.assertEqual(
+                post.content,
+                f'<http://twitter.com/{TWITTER_USER_SAMPLE["screen_name"]}/status/'
+                f'{TWITTER_STATUS_SAMPLE["id"]}>\n{TWITTER_STATUS_SAMPLE["full_text"]}',
+            )
+            self.assertIsNone(post.embeds)
+            self.assertEqual(len(post.files), 1)  # type: ignore
+
+            status_code = post.save(webhook_url=f'{server.url}/webhook', sleep_seconds=0)
+
+            self.assertEqual(status_code, 204)
+            posted = server.posted[0]
+            boundary = posted['content_type'].split('boundary=')[1].encode()
+            self.assertTrue(posted['body'].startswith(b'--' + boundary + b'\r\n'))
+            self.assertTrue(posted['body'].endswith(b'--' + boundary + b'--\r\n'))
+            self.assertIn(b'name="payload_json"', posted['body'])
+            self.assertIn(b'name="files[0]"; filename="100.mp4"', posted['body'])
+            self.assertIn(b'\r\n\r\n' + VIDEO_CONTENT + b'\r\n', posted['body'])
+
+    def test_remove_expired(self) -> None:
+        with _FakeServer() as server, tempfile.TemporaryDirectory() as cache_dir:
+            media_cache = MediaCache(cache_dir=cache_dir, size_limit=1_000_000)
+            queued_path = media_cache.get(_video_entity(server.url, media_id='100'))
+            sent_path = media_cache.get(_video_entity(server.url, media_id='200'))
+            for path in [queued_path, sent_path]:
+                os.utime(path, (0, 0))  # type: ignore
+
+            media_cache.remove_expired(in_use={queued_path})  # type: ignore
+
+            self.assertTrue(os.path.exists(queued_path))  # type: ignore
+            self.assertFalse(os.path.exists(sent_path))  # type: ignore
+
+    def test_upload_removed_video(self) -> None:
+        with _FakeServer() as server, tempfile.TemporaryDirectory() as cache_dir:
+            post = DiscordPost(
+                username=TWITTER_USER_SAMPLE['name'],
+                avatar_url=TWITTER_USER_SAMPLE['profile_image_url_orig'],
+                content='content',
+                files=[os.path.join(cache_dir, '100.mp4')],
+            )
+
+            status_code = post.save(webhook_url=f'{server.url}/webhook', sleep_seconds=0)
+
+            # Not retried forever
+            self.assertEqual(status_code, 204)
+            posted = server.posted[0]
+            self.assertEqual(posted['content_type'], 'application/json')
+            self.assertEqual(json.loads(posted['body'])['content'], 'content')
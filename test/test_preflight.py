@@ -0,0 +1,139 @@
+"""Test"""
+# pylint: disable=C
+
+import random
+import string
+import unittest
+from typing import Any, Dict, List
+
+import tweepy.models
+
+from twitter_discord_bot.discord_api import DiscordPost
+from twitter_discord_bot.preflight import (
+    DISCORD_CONTENT_LIMIT,
+    check_post,
+    preflight,
+    split_content,
+)
+from twitter_discord_bot.twitter_api import TwitterUserWrapper
+
+from .help import TWITTER_USER_SAMPLE
+
+# Each property is checked against this many generated examples
+EXAMPLE_COUNT = 200
+
+_ALPHABET = string.ascii_letters + string.digits + '&<>ぁ字😀'
+# Words are cut from it, which is much faster than generating each character
+_CORPUS = ''.join(random.Random(0).choices(_ALPHABET, k=10_000))
+
+
+def _generate_text(rng: random.Random, max_length: int) -> str:
+    """Words of random lengths separated by spaces and line breaks, or nothing at all"""
+    length = rng.choice([0, rng.randint(0, 300), rng.randint(0, max_length)])
+    words: List[str] = []
+    while sum(len(word) + 1 for word in words) < length:
+        word_length = rng.choice([rng.randint(1, 12), rng.randint(1, 3000)])
+        start = rng.randrange(len(_CORPUS) - word_length)
+        words.append(_CORPUS[start:start + word_length])
+        words.append(rng.choice([' ', ' ', '\n', '\n\n']))
+    return ''.join(words)[:length]
+
+
+def _generate_status(rng: random.Random) -> tweepy.models.Status:
+    status_json: Dict[str, Any] = {
+        'id': rng.randint(1, 2 ** 63),
+        'full_text': _generate_text(rng, max_length=25_000),
+    }
+    photo_count = rng.randint(0, 24)
+    if photo_count:
+        status_json['extended_entities'] = {
+            'media': [
+                {'type': 'photo', 'media_url_https': f'https://pbs.twimg.com/media/{index}.jpg'}
+                for index in range(photo_count)
+            ]
+        }
+    return tweepy.models.Status.parse(None, status_json)
+
+
+def _generate_post(rng: random.Random) -> DiscordPost:
+    embeds = [
+        {
+            'title': _generate_text(rng, max_length=400),
+            'description': _generate_text(rng, max_length=6000),
+            'footer': {'text': _generate_text(rng, max_length=3000)},
+            'fields': [
+                {'name': _generate_text(rng, 300), 'value': _generate_text(rng, 1500)}
+                for _ in range(rng.randint(0, 30))
+            ],
+        }
+        for _ in range(rng.randint(0, 15))
+    ]
+    return DiscordPost(
+        username=_generate_text(rng, max_length=100) or 'name',
+        avatar_url='https://pbs.twimg.com/profile_images/123456/asf5464.jpg',
+        content=_generate_text(rng, max_length=5000),
+        embeds=embeds or None,
+        files=[f'/tmp/{index}.mp4' for index in range(rng.randint(0, 25))] or None,
+    )
+
+
+class TestPreflight(unittest.TestCase):
+    def test_split_content(self) -> None:
+        self.assertEqual(split_content('a\nb c', limit=3), ['a', 'b c'])
+        self.assertEqual(split_content('ab cd', limit=3), ['ab', 'cd'])
+        self.assertEqual(split_content('abcdefg', limit=3), ['abc', 'def', 'g'])
+
+    def test_valid_post_unchanged(self) -> None:
+        post = DiscordPost(username='name', avatar_url='url', content='a' * DISCORD_CONTENT_LIMIT)
+        self.assertEqual(preflight(post), [post])
+
+    def test_generated_tweets(self) -> None:
+        rng = random.Random(0)
+        user = TwitterUserWrapper._contruct_for_testing(
+            name=TWITTER_USER_SAMPLE['name'],
+            screen_name=TWITTER_USER_SAMPLE['screen_name'],
+            user_id=TWITTER_USER_SAMPLE['id'],
+            profile_image_url=TWITTER_USER_SAMPLE['profile_image_url'],
+        )
+
+        for _ in range(EXAMPLE_COUNT):
+            status = _generate_status(rng)
+            post = DiscordPost.generate_from_twitter_status(user=user, status=status)
+            with self.subTest(status=status.id):
+                parts = preflight(post)
+
+                for part in parts:
+                    self.assertEqual(check_post(part), [])
+                # The whole text is kept, only the separators at the splits are dropped
+                self.assertEqual(
+                    ''.join(''.join(part.content.split()) for part in parts),
+                    ''.join(post.content.split()),
+                )
+                self.assertEqual(
+                    [embed for part in parts for embed in part.embeds or []],
+                    post.embeds or [],
+                )
+
+    def test_generated_posts(self) -> None:
+        rng = random.Random(1)
+
+        for index in range(EXAMPLE_COUNT):
+            post = _generate_post(rng)
+            with self.subTest(index=index):
+                parts = preflight(post)
+
+                for part in parts:
+                    self.assertEqual(check_post(part), [])
+                    self.assertLessEqual(len(part.content), DISCORD_CONTENT_LIMIT)
+                self.assertEqual(
+                    ''.join(''.join(part.content.split()) for part in parts),
+                    ''.join(post.content.split()),
+                )
+                self.assertEqual(
+                    len([embed for part in parts for embed in part.embeds or []]),
+                    len(post.embeds or []),
+                )
+                self.assertEqual(
+                    [file for part in parts for file in part.files or []],
+                    post.files or [],
+                )
@@ -0,0 +1,123 @@
+"""Test"""
+# pylint: disable=C
+
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+from typing import List
+from unittest.mock import MagicMock, NonCallableMagicMock, patch
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from twitter_discord_bot.rate_limiter import (
+    DISCORD_WEBHOOK_PREFIX,
+    SharedRateLimiter,
+    mount_rate_limiter,
+)
+
+module_logger = logging.getLogger('twitter_discord_bot.rate_limiter')
+module_logger.setLevel(logging.CRITICAL)
+
+
+def _acquire_many(directory: str, count: int) -> None:
+    rate_limiter = SharedRateLimiter(
+        directory=directory, name='test', rate_per_second=20, burst=1
+    )
+    for _ in range(count):
+        rate_limiter.acquire('key')
+
+
+class TestSharedRateLimiter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.now = 1000.0
+        self.sleeps: List[float] = []
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def _sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def _create(self, rate_per_second: float = 2, burst: float = 3) -> SharedRateLimiter:
+        return SharedRateLimiter(
+            directory=self.temp_dir.name,
+            name='test',
+            rate_per_second=rate_per_second,
+            burst=burst,
+            clock=lambda: self.now,
+            sleep=self._sleep,
+        )
+
+    def test_burst_and_refill(self) -> None:
+        rate_limiter = self._create()
+        self.assertEqual([rate_limiter.try_acquire('key') for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(rate_limiter.try_acquire('key'), 0.5)
+
+        self.now += 0.5
+        self.assertEqual(rate_limiter.try_acquire('key'), 0)
+        # Refilled up to the burst only
+        self.now += 60
+        self.assertEqual([rate_limiter.try_acquire('key') for _ in range(3)], [0, 0, 0])
+        self.assertGreater(rate_limiter.try_acquire('key'), 0)
+
+        # Other keys have their own buckets
+        self.assertEqual(rate_limiter.try_acquire('another key'), 0)
+
+    def test_shared_between_instances(self) -> None:
+        self.assertEqual(self._create().acquire('key'), 0)
+        self.assertEqual(self._create().acquire('key'), 0)
+        self.assertEqual(self._create().acquire('key'), 0)
+
+        self.assertAlmostEqual(self._create().acquire('key'), 0.5)
+        self.assertEqual(len(self.sleeps), 1)
+
+    def test_secret_key_not_in_filename(self) -> None:
+        self._create().acquire('secret token')
+        filenames = os.listdir(self.temp_dir.name)
+        self.assertEqual(len(filenames), 1)
+        self.assertNotIn('secret', filenames[0])
+
+    def test_shared_between_processes(self) -> None:
+        started_at = time.monotonic()
+        processes = [
+            multiprocessing.Process(target=_acquire_many, args=(self.temp_dir.name, 10))
+            for _ in range(2)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(timeout=30)
+            self.assertEqual(process.exitcode, 0)
+
+        # 20 requests at 20 per second with a burst of 1
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.9)
+
+
+class TestRateLimitedAdapter(unittest.TestCase):
+    @patch.object(HTTPAdapter, 'send', autospec=True)
+    def test_mount(self, send_mock: MagicMock) -> None:
+        send_mock.return_value = requests.Response()
+        rate_limiter = NonCallableMagicMock(spec=SharedRateLimiter)
+        session = requests.Session()
+        mount_rate_limiter(
+            session=session,
+            prefix=DISCORD_WEBHOOK_PREFIX,
+            rate_limiter=rate_limiter,
+            get_key=lambda request: request.url.split('/')[-2],
+        )
+
+        session.post(f'{DISCORD_WEBHOOK_PREFIX}123/token', json={})
+        session.get('https://video.twimg.com/video.mp4')
+
+        rate_limiter.acquire.assert_called_once_with('123')
+        self.assertEqual(send_mock.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""Test"""
+# pylint: disable=C
+
+import logging
+import os
+import tempfile
+import unittest
+
+from twitter_discord_bot.state import (
+    AccountStats,
+    RuntimeState,
+    read_runtime_state,
+    save_runtime_state,
+)
+
+from .help import TWITTER_USER_SAMPLE
+
+module_logger = logging.getLogger('twitter_discord_bot.state')
+module_logger.setLevel(logging.CRITICAL)
+
+
+class TestRuntimeState(unittest.TestCase):
+    def test_save_and_read_runtime_state(self) -> None:
+        runtime_state = RuntimeState(
+            interval_count=42,
+            profiles={
+                TWITTER_USER_SAMPLE['screen_name']: {
+                    'name': TWITTER_USER_SAMPLE['name'],
+                    'user_id': TWITTER_USER_SAMPLE['id'],
+                    'profile_image_url': TWITTER_USER_SAMPLE['profile_image_url_orig'],
+                    'synced_at': 1234.5,
+                }
+            },
+            account_stats={
+                TWITTER_USER_SAMPLE['screen_name']: AccountStats(
+                    last_fetched_at=1234.5,
+                    last_fetch_seconds=0.25,
+                    fetch_count=3,
+                    tweet_count=7,
+                )
+            },
+        )
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, 'runtime_state.json')
+            save_runtime_state(filename=filename, runtime_state=runtime_state)
+
+            self.assertEqual(read_runtime_state(filename=filename), runtime_state)
+            self.assertEqual(os.listdir(temp_dir), ['runtime_state.json'])
+
+    def test_read_runtime_state_not_exists(self) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, 'runtime_state.json')
+
+            self.assertEqual(read_runtime_state(filename=filename), RuntimeState())
+
+    def test_read_runtime_state_corrupted(self) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, 'runtime_state.json')
+            with open(filename, 'w', encoding='utf-8') as state_file:
+                state_file.write('{"version": 1, "interval_count": ')
+
+            self.assertEqual(read_runtime_state(filename=filename), RuntimeState())
+
+    def test_read_runtime_state_invalid(self) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, 'runtime_state.json')
+
+            for content in [
+                '[1, 2]',
+                '{"version": 1, "interval_count": 1, "profiles": [], "account_stats": {}}',
+                (
+                    '{"version": 1, "interval_count": 1, "account_stats": {},'
+                    ' "profiles": {"foo": {"name": "foo", "user_id": 1}}}'
+                ),
+                (
+                    '{"version": 1, "interval_count": 1, "account_stats": {},'
+                    ' "profiles": {"foo": {"name": "foo", "user_id": "id",'
+                    ' "profile_image_url": "url"}}}'
+                ),
+            ]:
+                with open(filename, 'w', encoding='utf-8') as state_file:
+                    state_file.write(content)
+
+                self.assertEqual(read_runtime_state(filename=filename), RuntimeState())
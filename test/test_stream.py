@@ -0,0 +1,187 @@
+"""Test"""
+# pylint: disable=C
+
+import json
+import logging
+import unittest
+from threading import Event
+from typing import Any, Dict, List
+
+from requests.adapters import HTTPAdapter
+
+from twitter_discord_bot.models import TwitterAccount
+from twitter_discord_bot.stream import (
+    RULE_MAX_LENGTH,
+    RULE_TAG,
+    TweetStream,
+    generate_rules,
+)
+
+from .help import TWITTER_STATUS_SAMPLE, TWITTER_USER_SAMPLE, FakeHTTPServer, QuietHandler
+
+module_logger = logging.getLogger('twitter_discord_bot.stream')
+module_logger.setLevel(logging.CRITICAL)
+logging.getLogger('tweepy').setLevel(logging.CRITICAL)
+
+STREAMED_TWEET = {
+    'data': {
+        'id': str(TWITTER_STATUS_SAMPLE['id']),
+        'text': TWITTER_STATUS_SAMPLE['full_text'],
+        'author_id': str(TWITTER_USER_SAMPLE['id']),
+        'attachments': {'media_keys': ['3_100']},
+    },
+    'includes': {
+        'media': [
+            {'media_key': '3_100', 'type': 'photo', 'url': TWITTER_STATUS_SAMPLE['media_url_https']},
+        ],
+        'users': [
+            {
+                'id': str(TWITTER_USER_SAMPLE['id']),
+                'name': TWITTER_USER_SAMPLE['name'],
+                'username': TWITTER_USER_SAMPLE['screen_name'],
+                'profile_image_url': TWITTER_USER_SAMPLE['profile_image_url'],
+            },
+        ],
+    },
+    'matching_rules': [{'id': '1', 'tag': RULE_TAG}],
+}
+
+
+class _FakeStreamServer(FakeHTTPServer):
+    """A stand-in of the filtered stream endpoints of Twitter API v2"""
+
+    def __init__(self, rules: List[Dict[str, str]]) -> None:
+        self.rules = rules
+        self.rule_requests: List[Dict[str, Any]] = []
+        self.close_stream = Event()
+        fake_server = self
+
+        class Handler(QuietHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _send_json(self, data: Any) -> None:
+                body = json.dumps(data).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_chunk(self, data: bytes) -> None:
+                self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+                self.wfile.flush()
+
+            def do_GET(self) -> None:
+                if self.path.startswith('/2/tweets/search/stream/rules'):
+                    self._send_json({'data': fake_server.rules})
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                self._send_chunk(b'\r\n')  # keep-alive
+                self._send_chunk(json.dumps(STREAMED_TWEET).encode() + b'\r\n')
+                fake_server.close_stream.wait(5)
+                self.wfile.write(b'0\r\n\r\n')
+                self.close_connection = True
+
+            def do_POST(self) -> None:
+                length = int(self.headers['Content-Length'])
+                fake_server.rule_requests.append(json.loads(self.rfile.read(length)))
+                self._send_json({'meta': {}})
+
+        super().__init__(Handler)
+
+    def __exit__(self, *args: Any) -> None:
+        self.close_stream.set()
+        super().__exit__(*args)
+
+
+class _RedirectAdapter(HTTPAdapter):
+    """Send the requests to Twitter API to the fake server instead"""
+
+    def __init__(self, url: str) -> None:
+        super().__init__()
+        self.url = url
+
+    def send(self, request: Any, *args: Any, **kwargs: Any) -> Any:
+        request.url = request.url.replace('https://api.twitter.com', self.url)
+        return super().send(request, *args, **kwargs)
+
+
+def _create_stream(server: _FakeStreamServer, wake_up: Event) -> TweetStream:
+    tweet_stream = TweetStream(bearer_token='token', wake_up=wake_up)
+    tweet_stream.session.mount('https://api.twitter.com', _RedirectAdapter(server.url))
+    return tweet_stream
+
+
+class TestGenerateRules(unittest.TestCase):
+    def test_generate_rules(self) -> None:
+        twitter_accounts = [TwitterAccount(twitter=f'Account_{index:03}') for index in range(100)]
+
+        rules = generate_rules(twitter_accounts)
+
+        self.assertGreater(len(rules), 1)
+        for rule in rules:
+            self.assertLessEqual(len(rule), RULE_MAX_LENGTH)
+            self.assertTrue(rule.endswith(' -is:reply'))
+        all_rules = ' '.join(rules)
+        for index in range(100):
+            self.assertIn(f'from:account_{index:03}', all_rules)
+
+
+class TestTweetStream(unittest.TestCase):
+    def test_sync_rules(self) -> None:
+        rules = [
+            {'id': '1', 'value': '(from:removed) -is:reply', 'tag': RULE_TAG},
+            {'id': '2', 'value': '(from:foo) -is:reply', 'tag': RULE_TAG},
+            {'id': '3', 'value': 'from:others', 'tag': 'someone_else'},
+        ]
+        with _FakeStreamServer(rules=rules) as server:
+            tweet_stream = _create_stream(server, Event())
+
+            tweet_stream.sync_rules([TwitterAccount(twitter='foo'), TwitterAccount(twitter='bar')])
+
+        self.assertEqual(
+            server.rule_requests,
+            [
+                {'delete': {'ids': ['1', '2']}},
+                {'add': [{'value': '(from:bar OR from:foo) -is:reply', 'tag': RULE_TAG}]},
+            ],
+        )
+
+    def test_receive_tweets(self) -> None:
+        with _FakeStreamServer(rules=[]) as server:
+            wake_up = Event()
+            tweet_stream = _create_stream(server, wake_up)
+            self.assertTrue(tweet_stream.take_gap_fill_request())
+
+            tweet_stream.ensure_running()
+            for _ in range(10):
+                self.assertTrue(wake_up.wait(5))
+                wake_up.clear()
+                received = tweet_stream.get_received()
+                if received:
+                    break
+
+            self.assertTrue(tweet_stream.is_connected)
+            # Fill the gap once after connecting
+            self.assertTrue(tweet_stream.take_gap_fill_request())
+            self.assertFalse(tweet_stream.take_gap_fill_request())
+
+            user_data, status = received[0]
+            self.assertEqual(user_data['username'], TWITTER_USER_SAMPLE['screen_name'])
+            self.assertEqual(status.id, TWITTER_STATUS_SAMPLE['id'])
+            self.assertEqual(status.full_text, TWITTER_STATUS_SAMPLE['full_text'])
+            self.assertEqual(
+                status.extended_entities['media'][0]['media_url_https'],
+                TWITTER_STATUS_SAMPLE['media_url_https'],
+            )
+
+            tweet_stream.disconnect()
+            server.close_stream.set()
+            tweet_stream.thread.join(5)  # type: ignore
+
+            self.assertFalse(tweet_stream.is_connected)
+            self.assertTrue(tweet_stream.take_gap_fill_request())
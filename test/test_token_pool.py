@@ -0,0 +1,128 @@
+"""Test"""
+# pylint: disable=C
+
+import logging
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from unittest.mock import MagicMock, NonCallableMagicMock, patch
+
+import requests
+
+from twitter_discord_bot.rate_limiter import RateLimitedAdapter, SharedRateLimiter
+from twitter_discord_bot.token_pool import TwitterClientPool, get_endpoint
+
+module_logger = logging.getLogger('twitter_discord_bot.token_pool')
+module_logger.setLevel(logging.CRITICAL)
+
+TIMELINE_URL = 'https://api.twitter.com/1.1/statuses/user_timeline.json'
+LOOKUP_URL = 'https://api.twitter.com/1.1/statuses/lookup.json'
+
+
+def _make_response(
+    status_code: int = 200,
+    remaining: Optional[int] = None,
+    reset_at: Optional[int] = None,
+    url: str = f'{TIMELINE_URL}?screen_name=foo',
+) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = url
+    if remaining is not None and reset_at is not None:
+        response.headers['x-rate-limit-remaining'] = str(remaining)
+        response.headers['x-rate-limit-reset'] = str(reset_at)
+    return response
+
+
+@patch('twitter_discord_bot.token_pool.time.time', return_value=1000)
+class TestTwitterClientPool(unittest.TestCase):
+    def _respond(self, pool: TwitterClientPool, screen_name: str, **kwargs: object) -> None:
+        client = pool.get_client(screen_name)
+        for hook in client.session.hooks['response']:
+            hook(_make_response(**kwargs))
+
+    def test_pin_to_most_remaining(self, _time_mock: MagicMock) -> None:
+        pool = TwitterClientPool(bearer_tokens=['a', 'b', 'c'])
+
+        # Spread over the tokens without known quota
+        self._respond(pool, 'alice', remaining=100, reset_at=1900)
+        self._respond(pool, 'bob', remaining=50, reset_at=1900)
+        self._respond(pool, 'carol', remaining=10, reset_at=1900)
+        self.assertEqual(
+            [pool.get_client(name) for name in ['alice', 'bob', 'carol']],
+            list(pool._clients),
+        )
+
+        self.assertIs(pool.get_client('dave'), pool._clients[0])
+        # Pinned even if another token has more quota now
+        self._respond(pool, 'Alice', remaining=1, reset_at=1900)
+        self.assertIs(pool.get_client('alice'), pool._clients[0])
+        self.assertIs(pool.get_client(), pool._clients[1])
+
+    def test_bench_exhausted(self, time_mock: MagicMock) -> None:
+        pool = TwitterClientPool(bearer_tokens=['a', 'b'])
+
+        self._respond(pool, 'alice', status_code=429)
+        self.assertIs(pool.get_client('alice'), pool._clients[1])
+        self.assertTrue(pool.has_quota())
+
+        self._respond(pool, 'alice', remaining=0, reset_at=1100)
+        self.assertFalse(pool.has_quota())
+        # The token back the soonest
+        self.assertIs(pool.get_client('bob'), pool._clients[1])
+
+        time_mock.return_value = 1100
+        self.assertTrue(pool.has_quota())
+        self.assertEqual(pool._usages[0].request_count, 1)
+        self.assertEqual(pool._usages[0].rate_limited_count, 1)
+        self.assertEqual(pool._usages[1].request_count, 1)
+
+    def test_only_timeline_quota(self, _time_mock: MagicMock) -> None:
+        pool = TwitterClientPool(bearer_tokens=['a', 'b'])
+
+        self._respond(pool, 'alice', remaining=100, reset_at=1900)
+        self._respond(pool, 'bob', remaining=50, reset_at=1900)
+        # Another endpoint running out neither benches the token nor ranks it lower
+        self._respond(pool, 'alice', remaining=0, reset_at=1900, url=LOOKUP_URL)
+
+        self.assertTrue(pool.has_quota())
+        self.assertIs(pool.get_client('alice'), pool._clients[0])
+        self.assertIs(pool.get_client(), pool._clients[0])
+        self.assertEqual(pool._usages[0].get_exhausted(1000), ['/1.1/statuses/lookup.json'])
+
+    def test_from_threads(self, _time_mock: MagicMock) -> None:
+        pool = TwitterClientPool(bearer_tokens=['a', 'b', 'c'])
+
+        def _fetch(number: int) -> None:
+            for remaining in range(100):
+                self._respond(
+                    pool, f'user{number}-{remaining}', remaining=remaining, reset_at=1900
+                )
+                pool.has_quota()
+                pool.log_usage()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for future in [executor.submit(_fetch, number) for number in range(8)]:
+                future.result()
+
+        self.assertEqual(len(pool._pins), 800)
+        self.assertEqual(sum(usage.request_count for usage in pool._usages), 800)
+
+    def test_get_endpoint(self, _time_mock: MagicMock) -> None:
+        self.assertEqual(
+            get_endpoint('https://api.twitter.com/2/users/12345/tweets?max_results=10'),
+            '/2/users/:id/tweets',
+        )
+        self.assertEqual(get_endpoint(TIMELINE_URL), '/1.1/statuses/user_timeline.json')
+
+    def test_share_rate_limit(self, _time_mock: MagicMock) -> None:
+        rate_limiter = NonCallableMagicMock(spec=SharedRateLimiter)
+        pool = TwitterClientPool(bearer_tokens=['a', 'b'], rate_limiter=rate_limiter)
+
+        keys = []
+        for client in pool._clients:
+            adapter = client.session.get_adapter(TIMELINE_URL)
+            self.assertIsInstance(adapter, RateLimitedAdapter)
+            keys.append(adapter.get_key(requests.Request('GET', TIMELINE_URL).prepare()))
+        self.assertEqual(keys, ['a', 'b'])
+
@@ -0,0 +1,88 @@
+"""Test"""
+# pylint: disable=C
+
+import logging
+import typing
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, NonCallableMagicMock, patch
+
+from twitter_discord_bot.delivery import DeliveryQueues, PendingDelivery
+from twitter_discord_bot.discord_api import DiscordPost
+from twitter_discord_bot.tracing import LatencyHistogram, LatencyTracer, get_trace
+from twitter_discord_bot.twitter_api import get_twitter_user_timeline
+
+from .help import TWITTER_STATUS_SAMPLE, get_user_mock
+
+WEBHOOK_URL = 'https://discord.com/api/webhooks/1234/token'
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_histogram(self) -> None:
+        histogram = LatencyHistogram(max_samples=4)
+        for latency in (100.0, 1.0, 7.0, 20.0, 4000.0):
+            histogram.add(latency)
+
+        self.assertEqual(len(histogram), 4)
+        counts = histogram.get_counts(buckets=(5, 10, 30))
+        self.assertEqual(counts, {'<=5s': 1, '<=10s': 1, '<=30s': 1, '>30s': 1})
+        self.assertEqual(histogram.get_percentile(50), 20.0)
+        self.assertEqual(histogram.get_percentile(100), 4000.0)
+
+
+class TestLatencyTracer(unittest.TestCase):
+    @typing.no_type_check
+    @patch('twitter_discord_bot.discord_api.sleep')
+    @patch('twitter_discord_bot.discord_api.HTTP_SESSION.post')
+    def test_trace_tweet(self, requests_post_mock: MagicMock, _sleep_mock: MagicMock) -> None:
+        tracer = LatencyTracer(slow_threshold_seconds=60)
+        tracer.set_channel_names({'channel': WEBHOOK_URL})
+        user_mock = get_user_mock()
+        status_mock = NonCallableMagicMock(spec=['id', 'full_text', 'created_at'])
+        status_mock.id = TWITTER_STATUS_SAMPLE['id']
+        status_mock.full_text = TWITTER_STATUS_SAMPLE['full_text']
+        status_mock.created_at = datetime.now(timezone.utc) - timedelta(minutes=10)
+        api_mock = NonCallableMagicMock()
+        api_mock.user_timeline.return_value = [status_mock]
+
+        statuses = get_twitter_user_timeline(
+            api=api_mock, user=user_mock, since_id=1, tracer=tracer
+        )
+        post = DiscordPost.generate_from_twitter_status(user=user_mock, status=statuses[0])
+        delivery_queues = DeliveryQueues()
+        delivery_queues.enqueue(
+            WEBHOOK_URL,
+            PendingDelivery.from_status(user=user_mock, status=statuses[0], post=post),
+        )
+        requests_post_mock.return_value.status_code = 500
+        with self.assertLogs('twitter_discord_bot.tracing', logging.WARNING) as logs:
+            # Retried in the next cycle
+            delivery_queues.deliver(sleep_seconds=0)
+            requests_post_mock.return_value.status_code = 204
+            delivery_queues.deliver(sleep_seconds=0)
+
+        trace = get_trace(status_mock)
+        self.assertIs(post.trace, trace)
+        self.assertLessEqual(trace.created_at, trace.fetched_at)
+        self.assertLessEqual(trace.fetched_at, trace.rendered_at)
+        self.assertLessEqual(trace.rendered_at, trace.enqueued_at)
+        self.assertEqual(
+            [attempt.status_code for attempt in trace.attempts], [500, 204]
+        )
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('Slow delivery of tweet 12345 from screen_name to channel', logs.output[0])
+        self.assertIn('with 2 attempt(s)', logs.output[0])
+
+        with self.assertLogs('twitter_discord_bot.tracing', logging.INFO) as logs:
+            tracer.log_summary()
+        self.assertIn('Latency of account screen_name: 1 sample(s)', logs.output[0])
+        self.assertIn('Latency of channel channel: 1 sample(s)', logs.output[1])
+
+    def test_untraced(self) -> None:
+        status_mock = NonCallableMagicMock(spec=['id', 'text'])
+        status_mock.id = TWITTER_STATUS_SAMPLE['id']
+        status_mock.text = TWITTER_STATUS_SAMPLE['text']
+
+        post = DiscordPost.generate_from_twitter_status(user=get_user_mock(), status=status_mock)
+
+        self.assertIsNone(post.trace)
@@ -3,12 +3,17 @@
 
 import logging
 import unittest
-from unittest.mock import NonCallableMagicMock
+from unittest.mock import MagicMock, NonCallableMagicMock
 
+import tweepy
+
+from twitter_discord_bot.discord_api import DiscordPost
 from twitter_discord_bot.twitter_api import (TwitterUserWrapper,
-                                             get_twitter_user_timeline)
+                                             get_twitter_user_timeline,
+                                             is_token_authorized)
 
-from .help import TWITTER_USER_SAMPLE
+from .help import (TWITTER_STATUS_SAMPLE, TWITTER_STATUS_SAMPLE_2,
+                   TWITTER_USER_SAMPLE)
 
 module_logger = logging.getLogger('twitter_discord_bot.twitter_api')
 module_logger.setLevel(logging.CRITICAL)
@@ -75,3 +80,116 @@ class TestTwitterHelpingFuctions(unittest.TestCase):
             since_id=since_id,
             exclude_replies=True,
         )
+
+    def test_is_token_authorized(self) -> None:
+        api_mock = NonCallableMagicMock(spec=tweepy.API)
+        self.assertTrue(is_token_authorized(api=api_mock, screen_name='foo'))
+
+        api_mock.rate_limit_status.side_effect = tweepy.Unauthorized(
+            MagicMock(status_code=401, json=dict)
+        )
+        self.assertFalse(is_token_authorized(api=api_mock, screen_name='foo'))
+
+        # Not known to be revoked
+        api_mock.rate_limit_status.side_effect = tweepy.TwitterServerError(
+            MagicMock(status_code=503, json=dict)
+        )
+        self.assertTrue(is_token_authorized(api=api_mock, screen_name='foo'))
+
+
+class TestTwitterAPIV2(unittest.TestCase):
+
+    user_data = {
+        'id': str(TWITTER_USER_SAMPLE['id']),
+        'name': TWITTER_USER_SAMPLE['name'],
+        'username': TWITTER_USER_SAMPLE['screen_name'],
+        'profile_image_url': TWITTER_USER_SAMPLE['profile_image_url'],
+    }
+
+    def test_init(self) -> None:
+        client_mock = NonCallableMagicMock(spec=tweepy.Client)
+        client_mock.get_user.return_value = {'data': self.user_data}
+
+        user = TwitterUserWrapper(client_mock, TWITTER_USER_SAMPLE['screen_name'])  # type: ignore
+
+        self.assertEqual(user.name, TWITTER_USER_SAMPLE['name'])
+        self.assertEqual(user.user_id, TWITTER_USER_SAMPLE['id'])
+        self.assertEqual(user.profile_image_url, TWITTER_USER_SAMPLE['profile_image_url_orig'])
+
+    def test_get_twitter_user_timeline(self) -> None:
+        client_mock = NonCallableMagicMock(spec=tweepy.Client)
+        client_mock.get_users_tweets.return_value = {
+            'data': [
+                {
+                    'id': str(TWITTER_STATUS_SAMPLE_2['id']),
+                    'text': TWITTER_STATUS_SAMPLE_2['full_text'],
+                    'created_at': '2022-01-02T03:04:05.000Z',
+                    'attachments': {'media_keys': ['3_100']},
+                },
+                {
+                    'id': str(TWITTER_STATUS_SAMPLE['id']),
+                    'text': TWITTER_STATUS_SAMPLE['text'],
+                    'referenced_tweets': [{'type': 'retweeted', 'id': '999'}],
+                },
+            ],
+            'includes': {
+                'media': [
+                    {
+                        'media_key': '3_100',
+                        'type': 'photo',
+                        'url': TWITTER_STATUS_SAMPLE_2['media_url_https'],
+                    },
+                ],
+                'users': [dict(self.user_data, name='new_name')],
+            },
+        }
+        user = TwitterUserWrapper._contruct_for_testing(  # pylint: disable=protected-access
+            name=TWITTER_USER_SAMPLE['name'],
+            screen_name=TWITTER_USER_SAMPLE['screen_name'],
+            user_id=TWITTER_USER_SAMPLE['id'],
+            profile_image_url=TWITTER_USER_SAMPLE['profile_image_url_orig'],
+        )
+
+        statuses = get_twitter_user_timeline(api=client_mock, user=user, since_id=123)
+
+        client_mock.get_users_tweets.assert_called_once()
+        self.assertEqual(client_mock.get_users_tweets.call_args.args, (TWITTER_USER_SAMPLE['id'],))
+        self.assertEqual(client_mock.get_users_tweets.call_args.kwargs['since_id'], 123)
+        # The author is included in the same response
+        self.assertEqual(user.name, 'new_name')
+        client_mock.get_user.assert_not_called()
+
+        self.assertEqual([status.id for status in statuses],
+                         [TWITTER_STATUS_SAMPLE_2['id'], TWITTER_STATUS_SAMPLE['id']])
+        self.assertEqual(statuses[0].created_at.year, 2022)
+
+        photo_post = DiscordPost.generate_from_twitter_status(user=user, status=statuses[0])
+        self.assertEqual(
+            photo_post.content,
+            f'<http://twitter.com/{TWITTER_USER_SAMPLE["screen_name"]}/status/'
+            f'{TWITTER_STATUS_SAMPLE_2["id"]}>\n{TWITTER_STATUS_SAMPLE_2["full_text"]}',
+        )
+        self.assertEqual(
+            photo_post.embeds,
+            [{'image': {'url': TWITTER_STATUS_SAMPLE_2['media_url_https']}}],
+        )
+
+        retweet_post = DiscordPost.generate_from_twitter_status(user=user, status=statuses[1])
+        self.assertEqual(
+            retweet_post.content,
+            'RT: http://twitter.com/_/status/999\n'
+            f'http://twitter.com/{TWITTER_USER_SAMPLE["screen_name"]}/status/'
+            f'{TWITTER_STATUS_SAMPLE["id"]}',
+        )
+
+    def test_get_twitter_user_timeline_empty(self) -> None:
+        client_mock = NonCallableMagicMock(spec=tweepy.Client)
+        client_mock.get_users_tweets.return_value = {'meta': {'result_count': 0}}
+        user = TwitterUserWrapper._contruct_for_testing(  # pylint: disable=protected-access
+            name='name', screen_name='screen_name', user_id=1, profile_image_url='url',
+        )
+
+        statuses = get_twitter_user_timeline(api=client_mock, user=user, since_id=-1)
+
+        self.assertEqual(statuses, [])
+        self.assertEqual(client_mock.get_users_tweets.call_args.kwargs['max_results'], 10)
@@ -0,0 +1,77 @@
+"""Test"""
+# pylint: disable=C
+
+import logging
+import unittest
+from unittest.mock import MagicMock, patch
+
+from twitter_discord_bot.webhook_health import WebhookRegistry
+
+from .help import DISCORD_WEBHOOK_SAMPLE
+
+module_logger = logging.getLogger('twitter_discord_bot.webhook_health')
+module_logger.setLevel(logging.CRITICAL)
+
+
+@patch('twitter_discord_bot.webhook_health.time.time', return_value=1000)
+class TestWebhookRegistry(unittest.TestCase):
+    def test_quarantine_and_probe(self, time_mock: MagicMock) -> None:
+        probe_mock = MagicMock(return_value=404)
+        registry = WebhookRegistry(probe_interval_seconds=100, probe=probe_mock)
+
+        registry.record(DISCORD_WEBHOOK_SAMPLE, 500)
+        self.assertFalse(registry.is_quarantined(DISCORD_WEBHOOK_SAMPLE))
+        registry.record(DISCORD_WEBHOOK_SAMPLE, 404)
+        self.assertTrue(registry.is_quarantined(DISCORD_WEBHOOK_SAMPLE))
+
+        registry.probe_due()
+        probe_mock.assert_not_called()
+
+        time_mock.return_value = 1100
+        registry.probe_due()
+        self.assertTrue(registry.is_quarantined(DISCORD_WEBHOOK_SAMPLE))
+        self.assertEqual(registry.get_health(DISCORD_WEBHOOK_SAMPLE).next_probe_at, 1200)
+
+        # No response is not a proof of being back
+        probe_mock.return_value = None
+        time_mock.return_value = 1200
+        registry.probe_due()
+        self.assertTrue(registry.is_quarantined(DISCORD_WEBHOOK_SAMPLE))
+
+        probe_mock.return_value = 200
+        time_mock.return_value = 1300
+        registry.probe_due()
+        self.assertFalse(registry.is_quarantined(DISCORD_WEBHOOK_SAMPLE))
+        self.assertEqual(probe_mock.call_count, 3)
+
+    def test_restore_states(self, _time_mock: MagicMock) -> None:
+        registry = WebhookRegistry()
+        registry.record(DISCORD_WEBHOOK_SAMPLE, 401)
+        registry.record(f'{DISCORD_WEBHOOK_SAMPLE}/2', 204)
+
+        restored_registry = WebhookRegistry()
+        restored_registry.restore_states(registry.get_states())
+
+        self.assertTrue(restored_registry.is_quarantined(DISCORD_WEBHOOK_SAMPLE))
+        self.assertEqual(
+            restored_registry.log_quarantined({
+                'foo': DISCORD_WEBHOOK_SAMPLE,
+                'bar': f'{DISCORD_WEBHOOK_SAMPLE}/2',
+            }),
+            1,
+        )
+
+    def test_restore_invalid_states(self, _time_mock: MagicMock) -> None:
+        registry = WebhookRegistry()
+        registry.restore_states({
+            DISCORD_WEBHOOK_SAMPLE: {'status_code': 404, 'quarantined_at': 'yesterday'},
+            f'{DISCORD_WEBHOOK_SAMPLE}/2': {'status_code': 404, 'unknown': 1},
+            f'{DISCORD_WEBHOOK_SAMPLE}/3': None,  # type: ignore
+            f'{DISCORD_WEBHOOK_SAMPLE}/4': {'status_code': 404, 'quarantined_at': 900},
+        })
+
+        self.assertEqual(registry.get_states(), {
+            f'{DISCORD_WEBHOOK_SAMPLE}/4': {
+                'status_code': 404, 'quarantined_at': 900.0, 'next_probe_at': 0.0
+            },
+        })
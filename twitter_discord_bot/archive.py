@@ -0,0 +1,271 @@
+"""Keep the fetched tweets on disk to post them again without calling Twitter"""
+
+import gzip
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import tweepy.models
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# Tweet id, hash of the account, created at, segment number, line number in the segment
+INDEX_ENTRY = struct.Struct('<QQdII')
+INDEX_FILENAME = 'index.bin'
+
+
+def _hash_screen_name(screen_name: str) -> int:
+    """Hash the casefolded screen name to fit in the fixed size index entry"""
+    digest = hashlib.blake2b(screen_name.casefold().encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+@dataclass
+class ArchivedTweet:
+    """A tweet in the archive, normalized to the JSON of a status of Twitter API v1.1"""
+    status_id: int
+    screen_name: str
+    created_at: float
+    status_json: Dict[str, Any]
+
+    def to_status(self) -> tweepy.models.Status:
+        """Restore the status to generate the Discord post"""
+        status = tweepy.models.Status.parse(None, self.status_json)
+        status.created_at = datetime.fromtimestamp(self.created_at, tz=timezone.utc)
+        return status
+
+
+class TweetArchive:
+    """
+    An append-only archive of tweets, split into segments of `segment_size` tweets
+
+    The segment being written is plain JSON lines, and it is compressed with gzip once
+    full. Each tweet has a fixed size entry in the index file, which is memory-mapped to
+    find the tweets of an account or in a time range without reading the segments.
+
+    With `read_only`, e.g. for another process reading the archive of the running bot,
+    nothing is appended or compressed.
+    """
+
+    directory: str
+    segment_size: int
+    read_only: bool
+
+    _archived_ids: Set[int]
+    _segment_number: int
+    _segment_line_count: int
+
+    def __init__(
+        self, directory: str, segment_size: int = 1000, read_only: bool = False
+    ) -> None:
+        self.directory = directory
+        self.segment_size = segment_size
+        self.read_only = read_only
+        if not read_only:
+            os.makedirs(directory, exist_ok=True)
+
+        self._archived_ids = set()
+        self._segment_number = 0
+        self._segment_line_count = 0
+        for status_id, _, _, segment_number, line_number in self._iter_index():
+            self._archived_ids.add(status_id)
+            if segment_number >= self._segment_number:
+                self._segment_number = segment_number
+                self._segment_line_count = line_number + 1
+
+        # The segment may still be written by the process appending to the archive
+        if not read_only:
+            if self._segment_line_count >= self.segment_size:
+                self._seal_segment()
+            self._truncate_segment()
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, INDEX_FILENAME)
+
+    def _get_segment_path(self, segment_number: int, is_sealed: bool) -> str:
+        return os.path.join(
+            self.directory,
+            f'segment-{segment_number:06d}.jsonl{".gz" if is_sealed else ""}',
+        )
+
+    def __len__(self) -> int:
+        return len(self._archived_ids)
+
+    def __contains__(self, status_id: object) -> bool:
+        return status_id in self._archived_ids
+
+    def _iter_index(self) -> Iterator[Tuple[int, int, float, int, int]]:
+        try:
+            index_file = open(self._index_path, 'rb')  # pylint: disable=consider-using-with
+        except FileNotFoundError:
+            return
+        with index_file:
+            size = os.fstat(index_file.fileno()).st_size
+            # Ignore an entry partially written when the process was killed
+            size -= size % INDEX_ENTRY.size
+            if size == 0:
+                return
+            with mmap.mmap(index_file.fileno(), size, access=mmap.ACCESS_READ) as index:
+                yield from INDEX_ENTRY.iter_unpack(index)
+
+    def _seal_segment(self) -> None:
+        """Compress the full segment and start the next one"""
+        plain_path = self._get_segment_path(self._segment_number, is_sealed=False)
+        sealed_path = self._get_segment_path(self._segment_number, is_sealed=True)
+        if os.path.exists(plain_path):
+            with open(plain_path, 'rb') as plain_file, \
+                    gzip.open(f'{sealed_path}.tmp', 'wb') as sealed_file:
+                sealed_file.write(plain_file.read())
+            os.replace(f'{sealed_path}.tmp', sealed_path)
+            os.remove(plain_path)
+            logger.debug('Compressed segment %d of the archive.', self._segment_number)
+
+        self._segment_number += 1
+        self._segment_line_count = 0
+
+    def _truncate_segment(self) -> None:
+        """
+        Remove the lines after the last indexed one from the segment being written
+
+        They are left if the process is killed before the index entry is written, and
+        the line numbers of the next tweets would point to them.
+        """
+        segment_path = self._get_segment_path(self._segment_number, is_sealed=False)
+        try:
+            segment_file = open(segment_path, 'r+b')  # pylint: disable=consider-using-with
+        except FileNotFoundError:
+            return
+        with segment_file:
+            content = segment_file.read()
+            size = 0
+            for _ in range(self._segment_line_count):
+                size = content.find(b'\n', size) + 1
+                # Shorter than indexed, nothing to remove
+                if size == 0:
+                    return
+            if size < len(content):
+                logger.warning(
+                    'Remove %d byte(s) not indexed from segment %d of the archive.',
+                    len(content) - size,
+                    self._segment_number,
+                )
+                segment_file.truncate(size)
+
+    def append(self, screen_name: str, status: tweepy.models.Status) -> bool:
+        """Archive the status, return False if it has been archived"""
+        if self.read_only:
+            raise ValueError('The archive is opened read-only.')
+        if status.id in self._archived_ids:
+            return False
+
+        created_at = getattr(status, 'created_at', None)
+        archived_tweet = ArchivedTweet(
+            status_id=status.id,
+            screen_name=screen_name,
+            created_at=(
+                created_at.timestamp() if isinstance(created_at, datetime) else time.time()
+            ),
+            status_json=status._json,  # pylint: disable=protected-access
+        )
+
+        line = json.dumps(
+            {
+                'id': archived_tweet.status_id,
+                'screen_name': archived_tweet.screen_name,
+                'created_at': archived_tweet.created_at,
+                'status': archived_tweet.status_json,
+            },
+            ensure_ascii=False,
+        )
+        segment_path = self._get_segment_path(self._segment_number, is_sealed=False)
+        with open(segment_path, 'a', encoding='utf-8') as segment_file:
+            segment_file.write(f'{line}\n')
+        # The index is written after the tweet so that every entry points to a tweet
+        with open(self._index_path, 'ab') as index_file:
+            index_file.write(
+                INDEX_ENTRY.pack(
+                    archived_tweet.status_id,
+                    _hash_screen_name(screen_name),
+                    archived_tweet.created_at,
+                    self._segment_number,
+                    self._segment_line_count,
+                )
+            )
+
+        self._archived_ids.add(status.id)
+        self._segment_line_count += 1
+        if self._segment_line_count >= self.segment_size:
+            self._seal_segment()
+        return True
+
+    def _read_segment(self, segment_number: int) -> List[str]:
+        sealed_path = self._get_segment_path(segment_number, is_sealed=True)
+        if os.path.exists(sealed_path):
+            with gzip.open(sealed_path, 'rt', encoding='utf-8') as segment_file:
+                return segment_file.readlines()
+        with open(
+            self._get_segment_path(segment_number, is_sealed=False), encoding='utf-8'
+        ) as segment_file:
+            return segment_file.readlines()
+
+    def query(
+        self,
+        screen_names: Optional[Iterable[str]] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> List[ArchivedTweet]:
+        """
+        Find the tweets of the accounts, created in [since, until), oldest first
+
+        Only the segments with the matched tweets are read.
+        """
+        casefolded_names = (
+            None if screen_names is None
+            else {screen_name.casefold() for screen_name in screen_names}
+        )
+        account_hashes = (
+            None if casefolded_names is None
+            else {_hash_screen_name(screen_name) for screen_name in casefolded_names}
+        )
+
+        # Segment number -> line numbers
+        matched_lines: Dict[int, Set[int]] = {}
+        for _, account_hash, created_at, segment_number, line_number in self._iter_index():
+            if account_hashes is not None and account_hash not in account_hashes:
+                continue
+            if since is not None and created_at < since:
+                continue
+            if until is not None and created_at >= until:
+                continue
+            matched_lines.setdefault(segment_number, set()).add(line_number)
+
+        archived_tweets: List[ArchivedTweet] = []
+        for segment_number, line_numbers in sorted(matched_lines.items()):
+            lines = self._read_segment(segment_number)
+            for line_number in sorted(line_numbers):
+                tweet_dict = json.loads(lines[line_number])
+                # Rule out the collisions of the hashes
+                if (
+                    casefolded_names is not None
+                    and tweet_dict['screen_name'].casefold() not in casefolded_names
+                ):
+                    continue
+                archived_tweets.append(
+                    ArchivedTweet(
+                        status_id=tweet_dict['id'],
+                        screen_name=tweet_dict['screen_name'],
+                        created_at=tweet_dict['created_at'],
+                        status_json=tweet_dict['status'],
+                    )
+                )
+
+        archived_tweets.sort(key=lambda archived_tweet: archived_tweet.created_at)
+        return archived_tweets
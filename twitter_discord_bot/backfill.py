@@ -0,0 +1,142 @@
+"""Post the archived tweets to Discord channels again
+
+python -m twitter_discord_bot.backfill --channel {Channel} [--account {Account}]
+    [--since {ISO 8601 time}] [--until {ISO 8601 time}]
+"""
+
+import argparse
+import logging
+import sys
+from datetime import datetime
+from typing import List, Optional
+
+from .archive import TweetArchive
+from .configs import (
+    ARCHIVE_DIRECTORY,
+    RUNTIME_STATE_PATH,
+    SETTINGS_PATH,
+    TWITTER_SECRETS_PATH,
+    get_tenants,
+)
+from .delivery import DeliveryQueues
+from .hydration import TweetHydrator
+from .models import TwitterAccount
+from .state import read_runtime_state
+from .token_pool import TwitterClientPool
+from .twitter_api import get_twitter_users_infos
+from .twitter_discord_bot import (
+    _enqueue_tweets,
+    _get_settings,
+    _get_twitter_bearer_tokens,
+    _read_configuration,
+    _restore_runtime_state,
+    _share_rate_limits,
+)
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def _parse_time(value: str) -> float:
+    """Parse the time in ISO 8601, in the local time zone if not specified"""
+    return datetime.fromisoformat(value).timestamp()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Queue the archived tweets for the channels and deliver them like the bot does"""
+
+    parser = argparse.ArgumentParser(
+        prog='python -m twitter_discord_bot.backfill',
+        description=__doc__.splitlines()[0],
+    )
+    parser.add_argument(
+        '--channel', action='append', required=True,
+        help='Discord channel in discord_webhooks.ini, as tenant/channel with tenants',
+    )
+    parser.add_argument(
+        '--account', action='append',
+        help='Twitter account to post the tweets from, all accounts if not specified',
+    )
+    parser.add_argument('--since', type=_parse_time, help='Post the tweets since then')
+    parser.add_argument('--until', type=_parse_time, help='Post the tweets before then')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    settings = _get_settings(path=SETTINGS_PATH)
+    configuration = _read_configuration(tenants=get_tenants())
+    if configuration is None:
+        sys.exit(-1)
+    _, discord_webhooks = configuration
+
+    webhook_urls: List[str] = []
+    for discord_channel in args.channel:
+        if discord_channel.lower() not in discord_webhooks:
+            parser.error(f'Unknown Discord channel: {discord_channel}')
+        webhook_urls.append(discord_webhooks[discord_channel.lower()])
+
+    # The bot may be appending to the archive at the same time
+    archive = TweetArchive(
+        directory=settings.get('Archive', 'Directory', fallback=ARCHIVE_DIRECTORY),
+        segment_size=settings.getint('Archive', 'SegmentSize', fallback=1000),
+        read_only=True,
+    )
+    archived_tweets = archive.query(
+        screen_names=args.account,
+        since=args.since,
+        until=args.until,
+    )
+    if not archived_tweets:
+        logger.info('No archived tweet is found.')
+        return
+
+    # The profiles are restored from the snapshot, Twitter is called only if it is stale
+    twitter_clients = TwitterClientPool(
+        bearer_tokens=_get_twitter_bearer_tokens(path=TWITTER_SECRETS_PATH),
+        api_version=settings.get('Twitter', 'APIVersion', fallback='v1'),
+        rate_limiter=_share_rate_limits(settings),
+    )
+    twitter_users_infos = get_twitter_users_infos(
+        api=twitter_clients.get_client(),
+        twitter_accounts=[
+            TwitterAccount(twitter=screen_name)
+            for screen_name in dict.fromkeys(
+                archived_tweet.screen_name for archived_tweet in archived_tweets
+            )
+        ],
+    )
+    _restore_runtime_state(
+        runtime_state=read_runtime_state(filename=RUNTIME_STATE_PATH),
+        twitter_users_infos=twitter_users_infos,
+    )
+
+    hydrator = None
+    if settings.getboolean('Twitter', 'HydrateReferencedTweets', fallback=False):
+        hydrator = TweetHydrator(get_api=twitter_clients.get_client)
+        hydrator.hydrate(archived_tweet.to_status() for archived_tweet in archived_tweets)
+
+    # Post every tweet in full instead of compacting the old ones into digests
+    delivery_queues = DeliveryQueues(max_depth=None, max_age_seconds=float('inf'))
+    for archived_tweet in archived_tweets:
+        _enqueue_tweets(
+            user=twitter_users_infos[archived_tweet.screen_name],
+            statuses=[archived_tweet.to_status()],
+            webhook_urls=webhook_urls,
+            delivery_queues=delivery_queues,
+            hydrator=hydrator,
+        )
+
+    logger.info(
+        'Post %d archived tweet(s) to %d Discord channel(s).',
+        len(archived_tweets),
+        len(webhook_urls),
+    )
+    delivery_queues.deliver()
+
+    pending_count = sum(len(pending) for pending in delivery_queues.get_pending().values())
+    if pending_count:
+        logger.error('Failed to post %d archived tweet(s).', pending_count)
+        sys.exit(-1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Stop calling what keeps failing for a while, and probe it again later"""
+
+import logging
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Mapping
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+@dataclass
+class CircuitState:
+    """The state of a circuit breaker"""
+    # Consecutive failures
+    failure_count: int = 0
+    # Consecutive times of being opened, to back off exponentially
+    open_count: int = 0
+    # Calls are rejected until this time (epoch)
+    opened_until: float = 0.0
+
+
+class CircuitBreakers:
+    """
+    Circuit breakers of accounts or webhooks, identified by keys
+
+    After `failure_threshold` consecutive failures, the circuit is opened and calls are
+    rejected for a backoff period which doubles every time it is opened again. After the
+    period, one call is let through as a probe (half-open): a success closes the circuit
+    and a failure opens it again.
+    """
+
+    name: str
+    describe: Callable[[str], str]
+    failure_threshold: int
+    base_backoff_seconds: float
+    max_backoff_seconds: float
+
+    _states: Dict[str, CircuitState]
+
+    def __init__(
+        self,
+        name: str,
+        describe: Callable[[str], str] = str,
+        failure_threshold: int = 3,
+        base_backoff_seconds: float = 120,
+        max_backoff_seconds: float = 60 * 60,
+    ) -> None:
+        self.name = name
+        # How the keys are shown in the logs
+        self.describe = describe
+        self.failure_threshold = failure_threshold
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self._states = {}
+
+    def allow(self, key: str) -> bool:
+        """Whether a call is allowed: closed, or half-open for a probe"""
+        state = self._states.get(key)
+        return state is None or time.time() >= state.opened_until
+
+    def is_open(self, key: str) -> bool:
+        """Whether calls are being rejected"""
+        return not self.allow(key)
+
+    def record_success(self, key: str) -> None:
+        """Close the circuit"""
+        state = self._states.pop(key, None)
+        if state is not None and state.open_count:
+            logger.info('The circuit of %s %s is closed.', self.name, self.describe(key))
+
+    def record_failure(self, key: str) -> None:
+        """Count the failure, and open the circuit if there are too many"""
+        state = self._states.setdefault(key, CircuitState())
+        state.failure_count += 1
+        if state.failure_count < self.failure_threshold:
+            return
+
+        backoff_seconds = min(
+            self.base_backoff_seconds * 2 ** state.open_count,
+            self.max_backoff_seconds,
+        )
+        state.open_count += 1
+        state.opened_until = time.time() + backoff_seconds
+        logger.warning(
+            'The circuit of %s %s is opened for %.0fs after %d failure(s).',
+            self.name,
+            self.describe(key),
+            backoff_seconds,
+            state.failure_count,
+        )
+
+    def get_states(self) -> Dict[str, Dict[str, Any]]:
+        """Return the states to be saved in the snapshot"""
+        return {key: asdict(state) for key, state in self._states.items()}
+
+    def restore_states(self, states: Mapping[str, Mapping[str, Any]]) -> None:
+        """Restore the states from the snapshot, ignoring the invalid ones"""
+        if not isinstance(states, Mapping):
+            logger.warning(
+                'The circuits of %s in the snapshot are invalid, ignore them.', self.name
+            )
+            return
+
+        for key, state in states.items():
+            try:
+                circuit_state = CircuitState(**state)
+                circuit_state.failure_count = int(circuit_state.failure_count)
+                circuit_state.open_count = int(circuit_state.open_count)
+                circuit_state.opened_until = float(circuit_state.opened_until)
+            except (TypeError, ValueError):
+                logger.warning(
+                    'The circuit of %s %s in the snapshot is invalid, ignore it.',
+                    self.name,
+                    self.describe(key),
+                )
+                continue
+            self._states[key] = circuit_state
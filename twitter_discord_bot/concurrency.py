@@ -0,0 +1,146 @@
+"""Adapt the number of requests in flight to how Twitter and Discord respond"""
+
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Condition
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+_T = TypeVar('_T')
+
+
+class AIMDLimiter:
+    """
+    A limit of the concurrent requests, by additive increase and multiplicative decrease
+
+    Each request answered within `latency_threshold_seconds` adds `1 / limit` to the
+    limit, which is one more request after a whole window of them. A request that
+    `is_overloaded` judges from its result or error, e.g. timed out, rate limited or
+    answered with a server error, or that is slower than the threshold, multiplies the
+    limit by `decrease_factor`. It is decreased at most once per threshold, since the
+    requests already in flight were sent under the old limit.
+    """
+
+    name: str
+    is_overloaded: Callable[[Any, Optional[BaseException]], bool]
+    min_limit: int
+    max_limit: int
+    decrease_factor: float
+    latency_threshold_seconds: float
+
+    request_count: int
+    overload_count: int
+
+    _limit: float
+    _in_flight: int
+    _decreased_at: float
+    _condition: Condition
+    _executor: ThreadPoolExecutor
+
+    def __init__(
+        self,
+        name: str,
+        is_overloaded: Callable[[Any, Optional[BaseException]], bool],
+        initial_limit: int = 2,
+        min_limit: int = 1,
+        max_limit: int = 8,
+        decrease_factor: float = 0.5,
+        latency_threshold_seconds: float = 10,
+    ) -> None:
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise ValueError('The limits must be 1 <= min <= initial <= max.')
+        self.name = name
+        self.is_overloaded = is_overloaded
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_threshold_seconds = latency_threshold_seconds
+        self.request_count = 0
+        self.overload_count = 0
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._decreased_at = float('-inf')
+        self._condition = Condition()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_limit, thread_name_prefix=f'{name}-limiter'
+        )
+
+    @property
+    def limit(self) -> int:
+        """The number of requests allowed in flight now"""
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        """The number of requests in flight now"""
+        return self._in_flight
+
+    def acquire(self) -> None:
+        """Wait until there is room for another request"""
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self, latency_seconds: float, is_overloaded: bool) -> None:
+        """Adjust the limit from the finished request and let the next one go"""
+        with self._condition:
+            self._in_flight -= 1
+            self.request_count += 1
+            old_limit = int(self._limit)
+
+            if is_overloaded or latency_seconds > self.latency_threshold_seconds:
+                self.overload_count += 1
+                now = time.monotonic()
+                if now - self._decreased_at >= self.latency_threshold_seconds:
+                    self._limit = max(float(self.min_limit), self._limit * self.decrease_factor)
+                    self._decreased_at = now
+            else:
+                self._limit = min(float(self.max_limit), self._limit + 1 / self._limit)
+
+            new_limit = int(self._limit)
+            self._condition.notify_all()
+
+        if new_limit < old_limit:
+            logger.info(
+                'Requests of %s are overloaded, lower the concurrency from %d to %d.',
+                self.name,
+                old_limit,
+                new_limit,
+            )
+        elif new_limit > old_limit:
+            logger.debug(
+                'Raise the concurrency of %s from %d to %d.', self.name, old_limit, new_limit
+            )
+
+    def _run(self, function: Callable[..., _T], *args: Any, **kwargs: Any) -> _T:
+        self.acquire()
+        started_at = time.perf_counter()
+        result = None
+        error: Optional[BaseException] = None
+        try:
+            result = function(*args, **kwargs)
+            return result
+        except BaseException as raised:
+            error = raised
+            raise
+        finally:
+            self.release(
+                latency_seconds=time.perf_counter() - started_at,
+                is_overloaded=self.is_overloaded(result, error),
+            )
+
+    def submit(self, function: Callable[..., _T], *args: Any, **kwargs: Any) -> 'Future[_T]':
+        """Call the function in a worker thread once there is room for it"""
+        return self._executor.submit(self._run, function, *args, **kwargs)
+
+    def get_stats(self) -> Dict[str, int]:
+        """The current limit and the counts of the requests, for the metrics"""
+        return {
+            'limit': self.limit,
+            'in_flight': self.in_flight,
+            'request_count': self.request_count,
+            'overload_count': self.overload_count,
+        }
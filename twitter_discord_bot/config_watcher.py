@@ -0,0 +1,36 @@
+"""Detect modifications of the configuration files"""
+
+import os
+from typing import Dict, Iterable, List, Optional
+
+
+class ConfigWatcher:
+    """
+    Watch the given files by polling their modification time
+
+    The main loop only wakes up once per cycle, so checking a couple of `stat()` results
+    per cycle is as responsive as an event-based watcher and works on every platform.
+    """
+
+    _paths: List[str]
+    _mtimes: Dict[str, Optional[int]]
+
+    def __init__(self, paths: Iterable[str]) -> None:
+        self._paths = list(paths)
+        self._mtimes = self._get_mtimes()
+
+    def _get_mtimes(self) -> Dict[str, Optional[int]]:
+        mtimes: Dict[str, Optional[int]] = {}
+        for path in self._paths:
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    def has_changed(self) -> bool:
+        """Whether any of the files was modified, created or removed since the last check"""
+        mtimes = self._get_mtimes()
+        has_changed = mtimes != self._mtimes
+        self._mtimes = mtimes
+        return has_changed
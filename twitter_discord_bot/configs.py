@@ -1,6 +1,56 @@
 """Shared configs"""
 
+import os
+from dataclasses import dataclass
+from typing import List
+
 TWITTER_ACCOUNTS_PATH = 'configs/twitter_accounts.yml'
 TWITTER_SECRETS_PATH = 'configs/twitter_secrets.ini'
 LAST_FETECHED_POSTS_PATH = 'configs/last_fetched_posts.ini'
 DISCORD_WEBHOOKS_PATH = 'configs/discord_webhooks.ini'
+RUNTIME_STATE_PATH = 'configs/runtime_state.json'
+SETTINGS_PATH = 'configs/settings.ini'
+ARCHIVE_DIRECTORY = 'configs/archive'
+# Each subdirectory holds the twitter_accounts.yml and discord_webhooks.ini of a tenant
+TENANTS_DIRECTORY = 'configs/tenants'
+
+
+@dataclass(frozen=True)
+class TenantPaths:
+    """Paths of the configuration of a tenant"""
+    # Empty for the configuration directly in configs/
+    name: str
+    twitter_accounts_path: str
+    discord_webhooks_path: str
+
+
+def get_tenants(tenants_directory: str = TENANTS_DIRECTORY) -> List[TenantPaths]:
+    """Find the tenants, or use configs/ as the only one if there is none"""
+    try:
+        names = sorted(
+            entry.name for entry in os.scandir(tenants_directory) if entry.is_dir()
+        )
+    except OSError:
+        names = []
+
+    if not names:
+        return [
+            TenantPaths(
+                name='',
+                twitter_accounts_path=TWITTER_ACCOUNTS_PATH,
+                discord_webhooks_path=DISCORD_WEBHOOKS_PATH,
+            )
+        ]
+
+    return [
+        TenantPaths(
+            name=name,
+            twitter_accounts_path=os.path.join(
+                tenants_directory, name, os.path.basename(TWITTER_ACCOUNTS_PATH)
+            ),
+            discord_webhooks_path=os.path.join(
+                tenants_directory, name, os.path.basename(DISCORD_WEBHOOKS_PATH)
+            ),
+        )
+        for name in names
+    ]
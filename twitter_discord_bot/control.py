@@ -0,0 +1,157 @@
+"""Control the running bot through HTTP on localhost"""
+
+import json
+import logging
+import queue
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Thread
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# Action -> (HTTP method, whether an account or a channel is required)
+CONTROL_ACTIONS: Dict[str, Tuple[str, bool]] = {
+    'fetch': ('POST', True),
+    'pause': ('POST', True),
+    'resume': ('POST', True),
+    'queues': ('GET', False),
+    'flush': ('POST', False),
+}
+
+
+@dataclass
+class ControlCommand:
+    """A request from the control endpoint, to be handled by the main loop"""
+    action: str
+    account: Optional[str] = None
+    channel: Optional[str] = None
+    # Set by the main loop, with `done` set after it
+    result: Any = None
+    error: Optional[str] = None
+    done: Event = field(default_factory=Event, repr=False, compare=False)
+
+    def finish(self, result: Any = None, error: Optional[str] = None) -> None:
+        """Reply to the waiting request"""
+        self.result = result
+        self.error = error
+        self.done.set()
+
+
+class ControlServer:
+    """
+    An HTTP endpoint on localhost to control the bot
+
+        POST /fetch?account=NAME              fetch the account now
+        POST /pause?account=NAME|channel=NAME stop fetching the account or posting to
+        POST /resume?account=NAME|channel=NAME  the channel, and undo it
+        GET  /queues                          depth and backlog age of each channel
+        POST /flush                           save the state files now
+
+    The server thread only queues the commands and sets `wake_up`, the main loop takes
+    them with `take_commands` while it is idle, so nothing is shared between threads
+    and the cycles do not check anything.
+    """
+
+    wake_up: Event
+    reply_timeout_seconds: float
+
+    _commands: 'queue.Queue[ControlCommand]'
+    _server: ThreadingHTTPServer
+    _thread: Thread
+
+    def __init__(
+        self,
+        wake_up: Event,
+        port: int = 8750,
+        reply_timeout_seconds: float = 30,
+    ) -> None:
+        self.wake_up = wake_up
+        self.reply_timeout_seconds = reply_timeout_seconds
+        self._commands = queue.Queue()
+
+        control_server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:  # pylint: disable=invalid-name
+                control_server._handle(self, 'GET')
+
+            def do_POST(self) -> None:  # pylint: disable=invalid-name
+                control_server._handle(self, 'POST')
+
+            def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=W0622
+                logger.debug('Control request: ' + format, *args)
+
+        # Only reachable from the same host
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        """The port listened to, useful when it is chosen by the system"""
+        return self._server.server_address[1]
+
+    def start(self) -> None:
+        """Serve in a background thread"""
+        self._thread.start()
+        logger.info('Listen to control requests on 127.0.0.1:%d.', self.port)
+
+    def stop(self) -> None:
+        """Stop serving and reply to the commands never handled, safe to call again"""
+        # Shutting down a server not serving would wait forever
+        if self._thread.is_alive():
+            self._server.shutdown()
+        for command in self.take_commands():
+            command.finish(error='The bot is stopping.')
+        # Also close the socket bound even if the server was never started
+        self._server.server_close()
+
+    def take_commands(self) -> List[ControlCommand]:
+        """Take the queued commands without waiting"""
+        commands = []
+        while True:
+            try:
+                commands.append(self._commands.get_nowait())
+            except queue.Empty:
+                return commands
+
+    @staticmethod
+    def _reply(handler: BaseHTTPRequestHandler, code: int, body: Dict[str, Any]) -> None:
+        content = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        handler.send_response(code)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(content)))
+        handler.end_headers()
+        handler.wfile.write(content)
+
+    def _handle(self, handler: BaseHTTPRequestHandler, method: str) -> None:
+        url = urlparse(handler.path)
+        action = url.path.strip('/')
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        if action not in CONTROL_ACTIONS:
+            self._reply(handler, 404, {'error': f'Unknown action: {action}'})
+            return
+        expected_method, needs_target = CONTROL_ACTIONS[action]
+        if method != expected_method:
+            self._reply(handler, 405, {'error': f'Use {expected_method} for {action}'})
+            return
+        if needs_target and not (params.get('account') or params.get('channel')):
+            self._reply(handler, 400, {'error': 'An account or a channel is required'})
+            return
+
+        command = ControlCommand(
+            action=action,
+            account=params.get('account'),
+            channel=params.get('channel'),
+        )
+        self._commands.put(command)
+        self.wake_up.set()
+
+        if not command.done.wait(self.reply_timeout_seconds):
+            self._reply(handler, 504, {'error': 'The bot is busy, the command is queued'})
+        elif command.error is not None:
+            self._reply(handler, 400, {'error': command.error})
+        else:
+            self._reply(handler, 200, {'result': command.result})
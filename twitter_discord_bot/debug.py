@@ -11,10 +11,15 @@ from pprint import pprint
 import tweepy
 import tweepy.models
 
-from .configs import TWITTER_SECRETS_PATH
+from .configs import SETTINGS_PATH, TWITTER_SECRETS_PATH
 from .discord_api import DiscordPost
+from .rate_limiter import TWITTER_API_PREFIX, mount_rate_limiter
 from .twitter_api import TwitterUserWrapper
-from .twitter_discord_bot import _get_twitter_bearer_token
+from .twitter_discord_bot import (
+    _get_settings,
+    _get_twitter_bearer_tokens,
+    _share_rate_limits,
+)
 
 # pylint: disable=protected-access
 
@@ -22,8 +27,17 @@ from .twitter_discord_bot import _get_twitter_bearer_token
 def main() -> None:
     """Fetch the tweet and print the information to post to Discord"""
 
-    twitter_bearer_token = _get_twitter_bearer_token(path=TWITTER_SECRETS_PATH)
+    twitter_bearer_token = _get_twitter_bearer_tokens(path=TWITTER_SECRETS_PATH)[0]
     api = tweepy.API(auth=tweepy.OAuth2BearerHandler(bearer_token=twitter_bearer_token))
+    # Do not take the quota away from the running bot
+    rate_limiter = _share_rate_limits(_get_settings(path=SETTINGS_PATH))
+    if rate_limiter is not None:
+        mount_rate_limiter(
+            session=api.session,
+            prefix=TWITTER_API_PREFIX,
+            rate_limiter=rate_limiter,
+            get_key=lambda _request: twitter_bearer_token,
+        )
 
     tweet_id = sys.argv[1]
 
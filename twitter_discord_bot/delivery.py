@@ -0,0 +1,519 @@
+"""Queue the posts for each Discord webhook and deliver them"""
+
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field, fields, replace
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+import requests
+import tweepy.models
+
+from .circuit_breaker import CircuitBreakers
+from .concurrency import AIMDLimiter
+from .discord_api import DiscordPost
+from .models import TwitterAccount, get_webhook_id
+from .preflight import DISCORD_CONTENT_LIMIT, check_post, preflight
+from .twitter_api import TwitterUserWrapper
+from .webhook_health import WebhookRegistry
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def is_retryable(response_code: Optional[int]) -> bool:
+    """Whether the failure is temporary: no response, rate limited or a server error"""
+    return response_code is None or response_code == 429 or response_code >= 500
+
+
+def is_webhook_failure(response_code: Optional[int]) -> bool:
+    """Whether the failure is caused by the webhook rather than the post"""
+    return is_retryable(response_code) or response_code in (401, 403, 404)
+
+
+def is_discord_overloaded(
+    response_code: Optional[int], error: Optional[BaseException]
+) -> bool:
+    """Whether the failure is caused by the load of Discord, for the concurrency limiter"""
+    return error is not None or is_retryable(response_code)
+
+
+@dataclass
+class PendingDelivery:
+    """A post waiting to be sent to a Discord webhook"""
+    screen_name: str
+    status_id: int
+    post: DiscordPost
+    # When the tweet was created, to keep the digests in order
+    created_at: float
+    is_digest: bool = False
+    # When the post was queued, to measure the age of the backlog
+    enqueued_at: float = field(default_factory=time.time)
+
+    @classmethod
+    def from_status(
+        cls,
+        user: TwitterUserWrapper,
+        status: tweepy.models.Status,
+        post: DiscordPost,
+    ) -> 'PendingDelivery':
+        """Create from the status and the post generated from it"""
+        created_at = getattr(status, 'created_at', None)
+        return cls(
+            screen_name=user.screen_name,
+            status_id=status.id,
+            post=post,
+            created_at=(
+                created_at.timestamp() if isinstance(created_at, datetime) else time.time()
+            ),
+        )
+
+    @classmethod
+    def from_dict(cls, delivery_dict: Mapping[str, Any]) -> 'PendingDelivery':
+        """Restore from the result of `to_dict`, raise KeyError, TypeError or ValueError"""
+        delivery = cls(**{**delivery_dict, 'post': DiscordPost(**delivery_dict['post'])})
+        delivery.status_id = int(delivery.status_id)
+        delivery.created_at = float(delivery.created_at)
+        delivery.enqueued_at = float(delivery.enqueued_at)
+        if not isinstance(delivery.post.content, str) or delivery.post.trace is not None:
+            raise TypeError('The post is invalid.')
+        return delivery
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to a JSON serializable dict, the trace is not kept"""
+        delivery_dict = {
+            delivery_field.name: getattr(self, delivery_field.name)
+            for delivery_field in fields(self)
+        }
+        delivery_dict['post'] = {
+            post_field.name: getattr(self.post, post_field.name)
+            for post_field in fields(self.post)
+            if post_field.name != 'trace'
+        }
+        return delivery_dict
+
+    @property
+    def link(self) -> str:
+        """Link to the tweet"""
+        return f'http://twitter.com/{self.screen_name}/status/{self.status_id}'
+
+
+def _generate_digests(deliveries: Iterable[PendingDelivery]) -> List[PendingDelivery]:
+    """Compact the deliveries into messages listing the links, one or more per account"""
+
+    deliveries_by_account: Dict[str, List[PendingDelivery]] = {}
+    for delivery in deliveries:
+        account_deliveries = deliveries_by_account.setdefault(delivery.screen_name, [])
+        # A tweet split into several messages is listed once
+        if not account_deliveries or account_deliveries[-1].status_id != delivery.status_id:
+            account_deliveries.append(delivery)
+
+    digests: List[PendingDelivery] = []
+    for screen_name, account_deliveries in deliveries_by_account.items():
+        header = f'{len(account_deliveries)} earlier tweet(s) from {screen_name}:'
+        lines: List[str] = [header]
+        length = len(header)
+
+        for index, delivery in enumerate(account_deliveries):
+            line = f'<{delivery.link}>'
+            lines.append(line)
+            length += len(line) + 1
+
+            is_last = index == len(account_deliveries) - 1
+            next_length = 0 if is_last else len(account_deliveries[index + 1].link) + 3
+            if is_last or length + next_length > DISCORD_CONTENT_LIMIT:
+                digests.append(
+                    PendingDelivery(
+                        screen_name=screen_name,
+                        status_id=delivery.status_id,
+                        post=DiscordPost(
+                            username=delivery.post.username,
+                            avatar_url=delivery.post.avatar_url,
+                            content='\n'.join(lines),
+                        ),
+                        created_at=delivery.created_at,
+                        is_digest=True,
+                        enqueued_at=delivery.enqueued_at,
+                    )
+                )
+                lines = []
+                length = -1
+
+    digests.sort(key=lambda digest: digest.created_at)
+    return digests
+
+
+def _is_last_part(queue: Iterable[PendingDelivery], delivery: PendingDelivery) -> bool:
+    """Whether no other message of the same tweet is left in the queue"""
+    return not any(
+        queued is not delivery
+        and queued.screen_name == delivery.screen_name
+        and queued.status_id == delivery.status_id
+        for queued in queue
+    )
+
+
+class DeliveryQueues:
+    """
+    Queues of posts for each Discord webhook
+
+    When a queue holds more than `max_depth` posts, or posts queued for longer than
+    `max_age_seconds`, those older posts are compacted into digest messages so that the
+    newest tweets are still posted in time and the queue stays bounded. With `max_depth`
+    None and `max_age_seconds` infinite, every post is sent in full.
+
+    Posts that fail temporarily are put back to be retried. With `webhook_breakers`,
+    webhooks that keep failing are skipped until their circuits allow a probe. With
+    `webhook_registry`, quarantined webhooks are skipped until a probe finds them back.
+
+    The posts to each webhook are shared between the accounts by deficit round-robin:
+    every turn an account may send as many tweets as its priority, so a chatty account
+    can not starve the others, and accounts with higher priority go first. All the
+    messages of a split tweet are sent in the same turn.
+
+    With `delivery_limiter`, the posts to different webhooks are sent concurrently, as
+    many as the limiter allows, while the posts to each webhook are still sent in order.
+    """
+
+    max_depth: Optional[int]
+    max_age_seconds: float
+    webhook_breakers: Optional[CircuitBreakers]
+    webhook_registry: Optional[WebhookRegistry]
+    delivery_limiter: Optional[AIMDLimiter]
+
+    _queues: Dict[str, Deque[PendingDelivery]]
+    # Casefolded screen name -> priority
+    _priorities: Dict[str, int]
+    # Webhook url -> deficit of the accounts with queued posts, in the order of turns
+    _deficits: Dict[str, Dict[str, float]]
+    # Webhook urls not to post to for now, the posts are still queued
+    _paused: Set[str]
+
+    def __init__(
+        self,
+        max_depth: Optional[int] = 10,
+        max_age_seconds: float = 60 * 60,
+        webhook_breakers: Optional[CircuitBreakers] = None,
+        webhook_registry: Optional[WebhookRegistry] = None,
+        delivery_limiter: Optional[AIMDLimiter] = None,
+    ) -> None:
+        self.max_depth = max_depth
+        self.max_age_seconds = max_age_seconds
+        self.webhook_breakers = webhook_breakers
+        self.webhook_registry = webhook_registry
+        self.delivery_limiter = delivery_limiter
+        self._queues = {}
+        self._priorities = {}
+        self._deficits = {}
+        self._paused = set()
+
+    def set_priorities(self, twitter_accounts: Iterable[TwitterAccount]) -> None:
+        """Update the priorities of the accounts, also for the posts already queued"""
+        self._priorities = {
+            twitter_account.twitter.casefold(): max(twitter_account.priority, 1)
+            for twitter_account in twitter_accounts
+        }
+
+    def _get_priority(self, screen_name: str) -> int:
+        return self._priorities.get(screen_name.casefold(), 1)
+
+    def enqueue(self, webhook_url: str, delivery: PendingDelivery) -> None:
+        """
+        Add the post to the end of the queue of the webhook
+
+        The post is split into several messages if it exceeds the limits of Discord.
+        """
+        if delivery.post.trace is not None:
+            delivery.post.trace.mark_enqueued()
+
+        queue = self._queues.setdefault(webhook_url, deque())
+        for post in preflight(delivery.post):
+            problems = check_post(post)
+            if problems:
+                logger.error(
+                    'Drop the post of twitter id %d from %s: %s.',
+                    delivery.status_id,
+                    delivery.screen_name,
+                    ', '.join(problems),
+                )
+                continue
+            queue.append(delivery if post is delivery.post else replace(delivery, post=post))
+
+    def _compact(self, webhook_url: str) -> None:
+        queue = self._queues[webhook_url]
+        expired_before = time.time() - self.max_age_seconds
+
+        digests = [delivery for delivery in queue if delivery.is_digest]
+        deliveries = [delivery for delivery in queue if not delivery.is_digest]
+        # The messages of a split tweet are counted and compacted together
+        tweets: Dict[Tuple[str, int], List[PendingDelivery]] = {}
+        for delivery in deliveries:
+            tweets.setdefault((delivery.screen_name, delivery.status_id), []).append(delivery)
+        max_depth = len(tweets) + len(digests) if self.max_depth is None else self.max_depth
+        overflow_count = max(len(tweets) - max_depth, 0)
+        compacted_tweets = [
+            tweet for index, tweet in enumerate(tweets.values())
+            if index < overflow_count
+            or any(delivery.enqueued_at < expired_before for delivery in tweet)
+        ]
+        to_compact = [delivery for tweet in compacted_tweets for delivery in tweet]
+        if not to_compact and len(digests) <= max_depth:
+            return
+
+        # Digests pile up only if the webhook has been unavailable for a long time
+        if len(digests) > max_depth:
+            logger.warning(
+                'Drop %d digest(s) to the unavailable Discord channel.',
+                len(digests) - max_depth,
+            )
+            digests = digests[-max_depth:]
+
+        if to_compact:
+            logger.info(
+                'Compact %d post(s) to the Discord channel into digests.',
+                len(to_compact),
+            )
+        compacted_ids = {id(delivery) for delivery in to_compact}
+        to_keep = [delivery for delivery in deliveries if id(delivery) not in compacted_ids]
+        self._queues[webhook_url] = deque(
+            digests + _generate_digests(to_compact) + to_keep
+        )
+
+    def _take_next(self, webhook_url: str) -> PendingDelivery:
+        """Take the next post to the webhook by deficit round-robin between the accounts"""
+        queue = self._queues[webhook_url]
+
+        first_deliveries: Dict[str, PendingDelivery] = {}
+        for delivery in queue:
+            first_deliveries.setdefault(delivery.screen_name, delivery)
+
+        deficits = {
+            screen_name: deficit
+            for screen_name, deficit in self._deficits.get(webhook_url, {}).items()
+            if screen_name in first_deliveries
+        }
+        # Accounts joining take their turns after the others, higher priorities first
+        new_screen_names = sorted(
+            (screen_name for screen_name in first_deliveries if screen_name not in deficits),
+            key=self._get_priority,
+            reverse=True,
+        )
+        for screen_name in new_screen_names:
+            deficits[screen_name] = self._get_priority(screen_name)
+        self._deficits[webhook_url] = deficits
+
+        while True:
+            screen_name = next(iter(deficits))
+            if deficits[screen_name] >= 1:
+                break
+            # The turn is over, move to the end and save up for the next turn
+            deficits[screen_name] = deficits.pop(screen_name) + self._get_priority(screen_name)
+
+        delivery = first_deliveries[screen_name]
+        queue.remove(delivery)
+        # The account keeps the turn until the last message of the tweet is taken
+        if _is_last_part(queue, delivery):
+            deficits[screen_name] -= 1
+        if not any(queued.screen_name == screen_name for queued in queue):
+            del deficits[screen_name]
+        return delivery
+
+    def _put_back(self, webhook_url: str, delivery: PendingDelivery) -> None:
+        """Put back the post taken by `_take_next` to be retried first"""
+        queue = self._queues[webhook_url]
+        refund = 1 if _is_last_part(queue, delivery) else 0
+        queue.appendleft(delivery)
+        deficits = self._deficits[webhook_url]
+        self._deficits[webhook_url] = {
+            delivery.screen_name: deficits.pop(delivery.screen_name, 0) + refund,
+            **deficits,
+        }
+
+    @staticmethod
+    def _send(
+        webhook_url: str,
+        delivery: PendingDelivery,
+        sleep_seconds: float,
+    ) -> Optional[int]:
+        """Send the post, return the response code or None if there is no response"""
+        try:
+            response_code = delivery.post.save(
+                webhook_url=webhook_url,
+                sleep_seconds=sleep_seconds,
+            )
+        except (OSError, requests.RequestException):
+            logger.exception(
+                'Failed to post twitter id %d from %s to the Discord channel.',
+                delivery.status_id,
+                delivery.screen_name,
+            )
+            return None
+
+        if response_code in [200, 201, 204]:
+            logger.info(
+                'Successfully post twitter id %d from %s to the Discord channel.',
+                delivery.status_id,
+                delivery.screen_name,
+            )
+        else:
+            logger.error(
+                'Failed to post twitter id %d from %s to the Discord channel. Code: %d',
+                delivery.status_id,
+                delivery.screen_name,
+                response_code,
+            )
+        return response_code
+
+    def pause(self, webhook_url: str) -> None:
+        """Keep the posts to the webhook in the queue until `resume`"""
+        self._paused.add(webhook_url)
+
+    def resume(self, webhook_url: str) -> None:
+        """Post to the webhook again"""
+        self._paused.discard(webhook_url)
+
+    def is_paused(self, webhook_url: str) -> bool:
+        """Whether the webhook is paused"""
+        return webhook_url in self._paused
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """The number of queued posts and how long the oldest has waited, of each webhook"""
+        now = time.time()
+        return {
+            webhook_url: {
+                'depth': len(queue),
+                'backlog_age_seconds': (
+                    now - min(delivery.enqueued_at for delivery in queue) if queue else 0.0
+                ),
+            }
+            for webhook_url, queue in self._queues.items()
+        }
+
+    def _is_available(self, webhook_url: str) -> bool:
+        if webhook_url in self._paused:
+            return False
+        if self.webhook_registry is not None and self.webhook_registry.is_quarantined(
+            webhook_url
+        ):
+            return False
+        return self.webhook_breakers is None or self.webhook_breakers.allow(webhook_url)
+
+    def deliver(
+        self,
+        should_stop: Callable[[], bool] = lambda: False,
+        sleep_seconds: float = 0.5,
+    ) -> None:
+        """
+        Send the queued posts, taking turns between the webhooks
+
+        Each webhook still waits `sleep_seconds` between its own posts, but one channel
+        with a long queue does not hold up the others. The posts left when `should_stop`
+        returns True, or for unavailable webhooks, stay in the queues.
+        """
+        for webhook_url in self._queues:
+            self._compact(webhook_url)
+
+        # Webhooks that failed in this call are retried in the next one
+        failed_webhook_urls: Set[str] = set()
+
+        while not should_stop():
+            webhook_urls = [
+                url for url, queue in self._queues.items()
+                if queue and url not in failed_webhook_urls and self._is_available(url)
+            ]
+            if not webhook_urls:
+                break
+
+            if self.delivery_limiter is not None:
+                # One post to each webhook at once, each waits the whole sleep_seconds
+                deliveries = {url: self._take_next(url) for url in webhook_urls}
+                futures = {
+                    url: self.delivery_limiter.submit(
+                        self._send,
+                        webhook_url=url,
+                        delivery=delivery,
+                        sleep_seconds=sleep_seconds,
+                    )
+                    for url, delivery in deliveries.items()
+                }
+                for webhook_url, future in futures.items():
+                    self._record_result(
+                        webhook_url=webhook_url,
+                        delivery=deliveries[webhook_url],
+                        response_code=future.result(),
+                        failed_webhook_urls=failed_webhook_urls,
+                    )
+                continue
+
+            for webhook_url in webhook_urls:
+                if should_stop():
+                    break
+                delivery = self._take_next(webhook_url)
+                response_code = self._send(
+                    webhook_url=webhook_url,
+                    delivery=delivery,
+                    sleep_seconds=sleep_seconds / len(webhook_urls),
+                )
+                self._record_result(
+                    webhook_url=webhook_url,
+                    delivery=delivery,
+                    response_code=response_code,
+                    failed_webhook_urls=failed_webhook_urls,
+                )
+
+    def _record_result(
+        self,
+        webhook_url: str,
+        delivery: PendingDelivery,
+        response_code: Optional[int],
+        failed_webhook_urls: Set[str],
+    ) -> None:
+        """Put back the post to be retried if needed, and track the health of the webhook"""
+        if is_retryable(response_code):
+            self._put_back(webhook_url, delivery)
+            failed_webhook_urls.add(webhook_url)
+
+        if self.webhook_registry is not None:
+            self.webhook_registry.record(webhook_url, response_code)
+        if self.webhook_breakers is not None:
+            if is_webhook_failure(response_code):
+                self.webhook_breakers.record_failure(webhook_url)
+            else:
+                self.webhook_breakers.record_success(webhook_url)
+
+    def get_attachments(self) -> Set[str]:
+        """The paths of the files to upload with the queued posts"""
+        return {
+            path
+            for queue in self._queues.values()
+            for delivery in queue
+            for path in delivery.post.files or []
+        }
+
+    def get_pending(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Return the undelivered posts to be saved in the snapshot"""
+        return {
+            webhook_url: [delivery.to_dict() for delivery in queue]
+            for webhook_url, queue in self._queues.items()
+            if queue
+        }
+
+    def restore_pending(self, pending: Mapping[str, Iterable[Mapping[str, Any]]]) -> None:
+        """Put back the undelivered posts from the snapshot, dropping the invalid ones"""
+        for webhook_url, delivery_dicts in pending.items():
+            if not isinstance(delivery_dicts, list):
+                logger.warning(
+                    'The pending posts to webhook %s in the snapshot are invalid, drop them.',
+                    get_webhook_id(webhook_url),
+                )
+                continue
+            for delivery_dict in delivery_dicts:
+                try:
+                    delivery = PendingDelivery.from_dict(delivery_dict)
+                except (AttributeError, KeyError, TypeError, ValueError):
+                    logger.warning(
+                        'A pending post to webhook %s in the snapshot is invalid, drop it.',
+                        get_webhook_id(webhook_url),
+                    )
+                    continue
+                self.enqueue(webhook_url, delivery)
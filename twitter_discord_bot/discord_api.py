@@ -1,15 +1,90 @@
 """Helping functions that related to Discord API"""
 import html
-from dataclasses import dataclass
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
 from time import sleep
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, Iterator, List, Optional, Union
 
 import requests
 import tweepy
 import tweepy.models
 
+from .hydration import TweetHydrator
+from .media import CHUNK_SIZE, MediaCache, get_video_entities
+from .tracing import TweetTrace, get_trace
 from .twitter_api import TwitterUserWrapper
 
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# Keep the connections to Discord alive between the posts of all the channels
+HTTP_SESSION = requests.Session()
+
+
+def get_webhook_status(webhook_url: str) -> Optional[int]:
+    """Check the webhook without posting, return the response code or None if no response"""
+    try:
+        return HTTP_SESSION.get(webhook_url, timeout=10).status_code
+    except (OSError, requests.RequestException):
+        return None
+
+
+class _MultipartStream:
+    """
+    A multipart/form-data body which reads the files chunk by chunk when being sent
+
+    `requests` sends an iterable body with a known length without loading it at once.
+    """
+
+    boundary: str
+    _parts: List[Union[bytes, str]]
+
+    def __init__(self, payload_json: str, file_paths: List[str]) -> None:
+        self.boundary = uuid.uuid4().hex
+        self._parts = [
+            (
+                f'--{self.boundary}\r\n'
+                'Content-Disposition: form-data; name="payload_json"\r\n'
+                'Content-Type: application/json\r\n\r\n'
+                f'{payload_json}\r\n'
+            ).encode('utf-8')
+        ]
+        for index, file_path in enumerate(file_paths):
+            self._parts.append(
+                (
+                    f'--{self.boundary}\r\n'
+                    f'Content-Disposition: form-data; name="files[{index}]"; '
+                    f'filename="{os.path.basename(file_path)}"\r\n'
+                    'Content-Type: application/octet-stream\r\n\r\n'
+                ).encode('utf-8')
+            )
+            self._parts.append(file_path)
+            self._parts.append(b'\r\n')
+        self._parts.append(f'--{self.boundary}--\r\n'.encode('utf-8'))
+
+    @property
+    def content_type(self) -> str:
+        """The value of the Content-Type header"""
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self) -> int:
+        return sum(
+            len(part) if isinstance(part, bytes) else os.path.getsize(part)
+            for part in self._parts
+        )
+
+    def __iter__(self) -> Iterator[bytes]:
+        for part in self._parts:
+            if isinstance(part, bytes):
+                yield part
+                continue
+            with open(part, 'rb') as part_file:
+                while chunk := part_file.read(CHUNK_SIZE):
+                    yield chunk
+
 
 @dataclass
 class DiscordPost:
@@ -19,6 +94,10 @@ class DiscordPost:
     avatar_url: str
     content: str = ''
     embeds: Optional[List[Dict[str, Any]]] = None
+    # Paths of the files to upload as attachments
+    files: Optional[List[str]] = None
+    # Only set when the latency is being traced
+    trace: Optional[TweetTrace] = field(default=None, repr=False, compare=False)
 
     class _HasVideoException(Exception):
         pass
@@ -41,40 +120,120 @@ class DiscordPost:
             medias.append({'image': {'url': media['media_url_https']}})
         return medias
 
+    @staticmethod
+    def _get_videos_from_twitter_status(
+        status: tweepy.models.Status,
+        media_cache: MediaCache,
+    ) -> Optional[List[str]]:
+        """Download the videos, return None if any of them can't be uploaded"""
+        files = []
+        for media in get_video_entities(status):
+            path = media_cache.get(media)
+            if path is None:
+                return None
+            files.append(path)
+        return files
+
+    @staticmethod
+    def _get_text_from_twitter_status(status: tweepy.models.Status) -> str:
+        try:
+            return html.unescape(status.full_text)
+        except AttributeError:
+            return html.unescape(status.text)
+
+    @classmethod
+    def _get_embeds_of_other_status(
+        cls,
+        status: Optional[tweepy.models.Status],
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Show the tweet of another user with its author, text and photos, None if it is
+        not looked up. The embeds of the photos share the url to be shown together.
+        """
+        author = getattr(status, 'user', None)
+        if status is None or not hasattr(author, 'screen_name'):
+            return None
+
+        url = f'https://twitter.com/{author.screen_name}/status/{status.id}'
+        embed: Dict[str, Any] = {
+            'author': {
+                'name': f'{author.name} (@{author.screen_name})',
+                'url': f'https://twitter.com/{author.screen_name}',
+            },
+            'description': cls._get_text_from_twitter_status(status),
+            'url': url,
+        }
+        icon_url = getattr(author, 'profile_image_url_https', '')
+        if icon_url:
+            embed['author']['icon_url'] = icon_url
+
+        # The previews of the videos are shown as well
+        image_urls = [
+            media['media_url_https']
+            for media in getattr(status, 'extended_entities', {}).get('media', [])
+            if media.get('media_url_https')
+        ]
+        if image_urls:
+            embed['image'] = {'url': image_urls[0]}
+        return [embed] + [
+            {'url': url, 'image': {'url': image_url}} for image_url in image_urls[1:]
+        ]
+
     @classmethod
     def generate_from_twitter_status(
         cls,
         user: TwitterUserWrapper,
         status: tweepy.models.Status,
+        media_cache: Optional[MediaCache] = None,
+        hydrator: Optional[TweetHydrator] = None,
     ) -> 'DiscordPost':
-        """Generate DiscordPost from a TwitterUserWrapper and a tweepy.models.Status"""
+        """
+        Generate DiscordPost from a TwitterUserWrapper and a tweepy.models.Status
+
+        Videos are uploaded as attachments if `media_cache` is given, otherwise only the
+        link to the tweet is posted. The retweeted and the quoted tweets are shown in full
+        if they have been looked up by `hydrator`.
+        """
 
         # Whether the tweet is a retweet
         is_retweet = hasattr(status, 'retweeted_status')
         has_video = False
+        files = None
 
         if is_retweet:
-            # Currently Discord fails to show preview of retweets
-            embeds = None
             retweet_id = status.retweeted_status.id
-            content = (
-                f'RT: http://twitter.com/_/status/{retweet_id}\n'
-                f'http://twitter.com/{user.screen_name}/status/{status.id}'
+            embeds = cls._get_embeds_of_other_status(
+                hydrator.get(retweet_id) if hydrator is not None else None
             )
+            if embeds is not None:
+                content = f'RT: <http://twitter.com/{user.screen_name}/status/{status.id}>'
+            else:
+                # Currently Discord fails to show preview of retweets
+                content = (
+                    f'RT: http://twitter.com/_/status/{retweet_id}\n'
+                    f'http://twitter.com/{user.screen_name}/status/{status.id}'
+                )
         else:
             # Discord api does not accept videos in the embeds
             try:
                 embeds = cls._get_medias_from_twitter_status(status=status)
             except cls._HasVideoException:
-                has_video = True
-                embeds = None
-                content = f'http://twitter.com/{user.screen_name}/status/{status.id}'
+                if media_cache is not None:
+                    files = cls._get_videos_from_twitter_status(status, media_cache)
+
+                if files is None:
+                    has_video = True
+                    embeds = None
+                    content = f'http://twitter.com/{user.screen_name}/status/{status.id}'
+                else:
+                    embeds = [
+                        {'image': {'url': media['media_url_https']}}
+                        for media in status.extended_entities['media']
+                        if media['type'] == 'photo'
+                    ] or None
 
         if not (has_video or is_retweet):
-            try:
-                text = html.unescape(status.full_text)
-            except AttributeError:
-                text = html.unescape(status.text)
+            text = cls._get_text_from_twitter_status(status)
 
             contents: List[str] = []
 
@@ -85,17 +244,34 @@ class DiscordPost:
 
             content = '\n'.join(contents)
 
+            if hydrator is not None and getattr(status, 'is_quote_status', False):
+                quoted_embeds = cls._get_embeds_of_other_status(
+                    hydrator.get(getattr(status, 'quoted_status_id', 0))
+                )
+                if quoted_embeds is not None:
+                    embeds = (embeds or []) + quoted_embeds
+
         post = DiscordPost(
             username=user.name,
             avatar_url=user.profile_image_url,
             content=content,
             embeds=embeds,
+            files=files,
         )
 
+        post.trace = get_trace(status)
+        if post.trace is not None:
+            post.trace.mark_rendered()
+
         return post
 
     def save(self, webhook_url: str, sleep_seconds: float = 0.5) -> int:
-        """Post the content to Discord with the webhook"""
+        """
+        Post the content to Discord with the webhook
+
+        Attachments no longer in the media cache are left out, the post still has the
+        link to the tweet.
+        """
 
         payload: Dict[str, Union[str, List[Dict[str, Any]]]] = {
             'username': self.username,
@@ -105,7 +281,34 @@ class DiscordPost:
         if self.embeds is not None:
             payload['embeds'] = self.embeds
 
-        response = requests.post(webhook_url, json=payload, timeout=10)
+        files = [path for path in self.files or [] if os.path.exists(path)]
+        if len(files) < len(self.files or []):
+            logger.warning(
+                'Post without %d attachment(s) removed from the media cache.',
+                len(self.files or []) - len(files),
+            )
+
+        sent_at = time.time()
+        try:
+            if files:
+                body = _MultipartStream(payload_json=json.dumps(payload), file_paths=files)
+                response = HTTP_SESSION.post(
+                    webhook_url,
+                    data=body,
+                    headers={'Content-Type': body.content_type},
+                    timeout=60,
+                )
+            else:
+                response = HTTP_SESSION.post(webhook_url, json=payload, timeout=10)
+        except (OSError, requests.RequestException):
+            if self.trace is not None:
+                self.trace.record_attempt(webhook_url, sent_at=sent_at, status_code=None)
+            raise
+
+        if self.trace is not None:
+            self.trace.record_attempt(
+                webhook_url, sent_at=sent_at, status_code=response.status_code
+            )
 
         sleep(sleep_seconds)
 
@@ -0,0 +1,100 @@
+"""Look up the original tweets of the retweets and the quotes in batches"""
+
+import logging
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional
+
+import requests
+import tweepy
+import tweepy.models
+
+from .twitter_api import LOOKUP_BATCH_SIZE, TwitterAPI, lookup_statuses
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def get_referenced_ids(status: tweepy.models.Status) -> List[int]:
+    """The ids of the tweets retweeted or quoted by the status"""
+    referenced_ids = []
+    retweeted_status = getattr(status, 'retweeted_status', None)
+    if retweeted_status is not None:
+        referenced_ids.append(retweeted_status.id)
+    quoted_status_id = getattr(status, 'quoted_status_id', None)
+    if getattr(status, 'is_quote_status', False) and quoted_status_id is not None:
+        referenced_ids.append(quoted_status_id)
+    return referenced_ids
+
+
+class TweetHydrator:
+    """
+    A bounded cache of the tweets referenced by the retweets and the quotes
+
+    `hydrate` collects the referenced ids of the tweets fetched in a cycle, and looks up
+    those not cached in requests of up to LOOKUP_BATCH_SIZE ids. An original retweeted
+    by several accounts is looked up once. The least recently used tweets are evicted
+    over `max_size`, and the tweets not found are cached as missing so that they are not
+    looked up again.
+    """
+
+    get_api: Callable[[], TwitterAPI]
+    max_size: int
+
+    lookup_count: int
+    hit_count: int
+
+    # Status id -> the status, or None if it is not found
+    _cache: 'OrderedDict[int, Optional[tweepy.models.Status]]'
+
+    def __init__(self, get_api: Callable[[], TwitterAPI], max_size: int = 1000) -> None:
+        self.get_api = get_api
+        self.max_size = max_size
+        self.lookup_count = 0
+        self.hit_count = 0
+        self._cache = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def __contains__(self, status_id: object) -> bool:
+        return status_id in self._cache
+
+    def _put(self, status_id: int, status: Optional[tweepy.models.Status]) -> None:
+        self._cache[status_id] = status
+        self._cache.move_to_end(status_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def get(self, status_id: int) -> Optional[tweepy.models.Status]:
+        """The cached tweet, None if it is not found or not looked up"""
+        status = self._cache.get(status_id)
+        if status_id in self._cache:
+            self._cache.move_to_end(status_id)
+        return status
+
+    def hydrate(self, statuses: Iterable[tweepy.models.Status]) -> None:
+        """Look up the tweets referenced by the statuses which are not cached"""
+        missing_ids: List[int] = []
+        for status in statuses:
+            for referenced_id in get_referenced_ids(status):
+                if referenced_id in self._cache:
+                    self._cache.move_to_end(referenced_id)
+                    self.hit_count += 1
+                elif referenced_id not in missing_ids:
+                    missing_ids.append(referenced_id)
+
+        for start in range(0, len(missing_ids), LOOKUP_BATCH_SIZE):
+            batch_ids = missing_ids[start:start + LOOKUP_BATCH_SIZE]
+            try:
+                found_statuses = lookup_statuses(api=self.get_api(), status_ids=batch_ids)
+            except (tweepy.TweepyException, requests.RequestException) as error:
+                # Posted with the links only, and looked up again next time
+                logger.warning('Failed to look up %d tweet(s): %r', len(batch_ids), error)
+                continue
+
+            self.lookup_count += 1
+            found = {found_status.id: found_status for found_status in found_statuses}
+            for status_id in batch_ids:
+                self._put(status_id, found.get(status_id))
+            logger.debug(
+                'Looked up %d of %d referenced tweet(s).', len(found), len(batch_ids)
+            )
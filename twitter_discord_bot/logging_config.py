@@ -0,0 +1,150 @@
+"""Logging that does not block the fetching and posting thread"""
+
+import copy
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Tuple
+
+LOG_FORMAT = '%(asctime)s:%(levelname)-7s:%(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+SUPPRESSED_LOGGERS = (
+    'urllib3',
+    'oauthlib',
+    'requests_oauthlib',
+    'tweepy',
+)
+
+
+class JsonFormatter(logging.Formatter):
+    """Format the records as JSON lines"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        record_dict: Dict[str, Any] = {
+            'time': self.formatTime(record, LOG_DATE_FORMAT),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            record_dict['exception'] = record.exc_text
+        return json.dumps(record_dict, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most `burst` records of the same message in every `period_seconds`
+
+    Only warnings and errors are limited. The number of the dropped records is appended
+    to the next record of the message that is let through.
+    """
+
+    burst: int
+    period_seconds: float
+
+    # (logger name, message template) -> (start of the period, count in the period)
+    _periods: Dict[Tuple[str, Any], Tuple[float, int]]
+    _suppressed: Dict[Tuple[str, Any], int]
+    # The records are filtered on the fetching and the delivery threads
+    _lock: threading.Lock
+
+    def __init__(self, burst: int = 5, period_seconds: float = 60) -> None:
+        super().__init__()
+        self.burst = burst
+        self.period_seconds = period_seconds
+        self._periods = {}
+        self._suppressed = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+
+        key = (record.name, record.msg)
+        with self._lock:
+            now = time.monotonic()
+            period_start, count = self._periods.get(key, (now, 0))
+            if now - period_start >= self.period_seconds:
+                period_start, count = now, 0
+
+            count += 1
+            self._periods[key] = (period_start, count)
+            if count > self.burst:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return False
+
+            suppressed_count = self._suppressed.pop(key, 0)
+            if suppressed_count:
+                record.msg = f'{record.msg} (suppressed {suppressed_count} similar message(s))'
+        return True
+
+
+class _LazyQueueHandler(QueueHandler):
+    """
+    Put the records into the queue with the message merged, but not formatted
+
+    Formatting, including the timestamps and the tracebacks, is left to the listener
+    thread. The exception is kept on the record, since the queue never leaves the
+    process.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        # Merge the arguments now, since they may be modified after returning
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def parse_level(level_name: str) -> int:
+    """Return the level of the name in any case, raise ValueError if it is unknown"""
+    level = logging.getLevelName(level_name.strip().upper())
+    if not isinstance(level, int):
+        raise ValueError(f'Unknown logging level: {level_name!r}')
+    return level
+
+
+def setup_logging(
+    level: int = logging.INFO,
+    json_output: bool = False,
+    rate_limit_burst: int = 5,
+    rate_limit_period_seconds: float = 60,
+) -> QueueListener:
+    """
+    Send the records to stderr through a queue, written by a background thread
+
+    Return the started listener, which should be stopped before exiting to flush the
+    queue.
+    """
+    for logger_to_suppressed in SUPPRESSED_LOGGERS:
+        logging.getLogger(logger_to_suppressed).setLevel(logging.WARNING)
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    if json_output:
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+
+    log_queue: 'queue.SimpleQueue[logging.LogRecord]' = queue.SimpleQueue()
+    queue_handler = _LazyQueueHandler(log_queue)
+    if rate_limit_burst > 0:
+        queue_handler.addFilter(
+            RateLimitFilter(burst=rate_limit_burst, period_seconds=rate_limit_period_seconds)
+        )
+
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(queue_handler)
+    root_logger.setLevel(level)
+
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
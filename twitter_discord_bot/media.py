@@ -0,0 +1,179 @@
+"""Download videos from Twitter so that they can be uploaded to Discord"""
+
+import logging
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import AbstractSet, Any, Dict, List, Mapping, Optional
+
+import requests
+import tweepy.models
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# The default upload size limit of Discord
+DISCORD_UPLOAD_SIZE_LIMIT = 10 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+VIDEO_MEDIA_TYPES = ('video', 'animated_gif')
+
+
+def get_video_entities(status: tweepy.models.Status) -> List[Dict[str, Any]]:
+    """Get the media entities of the videos and GIFs in the status"""
+    try:
+        media_entities = status.extended_entities['media']
+    except AttributeError:
+        return []
+
+    return [media for media in media_entities if media['type'] in VIDEO_MEDIA_TYPES]
+
+
+def select_video_variant(
+        media_entity: Mapping[str, Any],
+        size_limit: int = DISCORD_UPLOAD_SIZE_LIMIT,
+) -> Optional[Dict[str, Any]]:
+    """
+    Select the MP4 variant with the highest bitrate whose estimated size is in the limit
+
+    GIFs have no duration, so their size can only be checked while downloading.
+    """
+    video_info = media_entity.get('video_info', {})
+    duration_millis = video_info.get('duration_millis')
+    variants = sorted(
+        (
+            variant for variant in video_info.get('variants', [])
+            if variant.get('content_type') == 'video/mp4'
+        ),
+        key=lambda variant: variant.get('bitrate', 0),
+        reverse=True,
+    )
+
+    for variant in variants:
+        if not duration_millis or not variant.get('bitrate'):
+            return variant
+        estimated_size = variant['bitrate'] * duration_millis / 1000 / 8
+        if estimated_size <= size_limit:
+            return variant
+
+    return None
+
+
+class MediaCache:
+    """
+    Download videos into a directory, at most once for each media id
+
+    Downloads run in a bounded thread pool and are streamed to the disk chunk by chunk,
+    so the whole file is never kept in memory. They go through `session`, e.g. the one
+    shared with the Discord posts, to reuse the connections.
+    """
+
+    _cache_dir: str
+    _size_limit: int
+    _session: requests.Session
+    _executor: ThreadPoolExecutor
+    _futures: Dict[str, 'Future[Optional[str]]']
+    _lock: Lock
+
+    def __init__(
+            self,
+            cache_dir: str,
+            size_limit: int = DISCORD_UPLOAD_SIZE_LIMIT,
+            max_workers: int = 2,
+            session: Optional[requests.Session] = None,
+    ) -> None:
+        os.makedirs(cache_dir, exist_ok=True)
+        self._cache_dir = cache_dir
+        self._size_limit = size_limit
+        self._session = session if session is not None else requests.Session()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='media-download',
+        )
+        self._futures = {}
+        self._lock = Lock()
+
+    def _get_path(self, media_id: str) -> str:
+        return os.path.join(self._cache_dir, f'{media_id}.mp4')
+
+    def prefetch(self, media_entity: Mapping[str, Any]) -> 'Future[Optional[str]]':
+        """Start downloading the video if it is not downloaded or being downloaded"""
+        media_id = str(media_entity['id_str'])
+        with self._lock:
+            future = self._futures.get(media_id)
+            if future is None:
+                future = self._executor.submit(self._download, media_id, media_entity)
+                self._futures[media_id] = future
+            return future
+
+    def prefetch_status(self, status: tweepy.models.Status) -> None:
+        """Start downloading all videos in the status"""
+        for media_entity in get_video_entities(status):
+            self.prefetch(media_entity)
+
+    def get(self, media_entity: Mapping[str, Any]) -> Optional[str]:
+        """Return the path of the downloaded video, None if it can't be uploaded"""
+        return self.prefetch(media_entity).result()
+
+    def _download(self, media_id: str, media_entity: Mapping[str, Any]) -> Optional[str]:
+        path = self._get_path(media_id)
+        if os.path.exists(path):
+            return path
+
+        variant = select_video_variant(media_entity, size_limit=self._size_limit)
+        if variant is None:
+            logger.info('All variants of media %s are too large to upload.', media_id)
+            return None
+
+        temp_path = f'{path}.part'
+        try:
+            with self._session.get(variant['url'], stream=True, timeout=30) as response:
+                response.raise_for_status()
+                if int(response.headers.get('Content-Length', 0)) > self._size_limit:
+                    logger.info('Media %s is too large to upload.', media_id)
+                    return None
+
+                size = 0
+                with open(temp_path, 'wb') as media_file:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > self._size_limit:
+                            logger.info('Media %s is too large to upload.', media_id)
+                            break
+                        media_file.write(chunk)
+                    else:
+                        os.replace(temp_path, path)
+                        return path
+        except (OSError, requests.RequestException):
+            logger.exception('Failed to download media %s.', media_id)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        return None
+
+    def remove_expired(
+            self,
+            max_age_seconds: float = 24 * 60 * 60,
+            in_use: AbstractSet[str] = frozenset(),
+    ) -> None:
+        """
+        Remove the videos downloaded earlier than `max_age_seconds` ago
+
+        The paths `in_use`, e.g. the attachments of the posts still queued, are kept.
+        """
+        expired_before = time.time() - max_age_seconds
+        kept_paths = {os.path.abspath(path) for path in in_use}
+        with self._lock:
+            for filename in os.listdir(self._cache_dir):
+                path = os.path.join(self._cache_dir, filename)
+                if os.path.abspath(path) in kept_paths:
+                    continue
+                try:
+                    if os.stat(path).st_mtime < expired_before:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+            for media_id, future in list(self._futures.items()):
+                if future.done() and not os.path.exists(self._get_path(media_id)):
+                    del self._futures[media_id]
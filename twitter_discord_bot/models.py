@@ -10,3 +10,10 @@ class TwitterAccount:
     twitter: str
     discord_channels: Optional[List[str]] = None
     interval: int = 1
+    # Share of the Discord channels' capacity relative to the other accounts
+    priority: int = 1
+
+
+def get_webhook_id(webhook_url: str) -> str:
+    """Get the id part of the webhook url, which is safe to be logged unlike the token"""
+    return webhook_url.rstrip('/').split('/')[-2]
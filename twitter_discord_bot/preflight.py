@@ -0,0 +1,202 @@
+"""Check the posts against the limits of Discord before sending them"""
+
+import itertools
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, TypeVar
+
+from .discord_api import DiscordPost
+
+DISCORD_CONTENT_LIMIT = 2000
+DISCORD_USERNAME_LIMIT = 80
+DISCORD_EMBED_COUNT_LIMIT = 10
+# The sum of the text of all the embeds in a message
+DISCORD_EMBED_TOTAL_LIMIT = 6000
+DISCORD_FILE_COUNT_LIMIT = 10
+DISCORD_EMBED_FIELD_COUNT_LIMIT = 25
+
+# Limits of the text of an embed, the key of a nested object is joined with a dot
+_EMBED_TEXT_LIMITS = {
+    'title': 256,
+    'description': 4096,
+    'author.name': 256,
+    'footer.text': 2048,
+}
+_EMBED_FIELD_NAME_LIMIT = 256
+_EMBED_FIELD_VALUE_LIMIT = 1024
+
+_T = TypeVar('_T')
+
+
+def _get_text(embed: Mapping[str, Any], key: str) -> str:
+    value: Any = embed
+    for part in key.split('.'):
+        if not isinstance(value, Mapping):
+            return ''
+        value = value.get(part)
+    return value if isinstance(value, str) else ''
+
+
+def _set_text(embed: Dict[str, Any], key: str, text: str) -> None:
+    """Set the text in the embed, the nested object is copied instead of modified"""
+    if '.' in key:
+        parent, child = key.split('.')
+        embed[parent] = {**embed[parent], child: text}
+    else:
+        embed[key] = text
+
+
+def get_embed_size(embed: Mapping[str, Any]) -> int:
+    """The number of characters counted toward the total limit of the embeds"""
+    return sum(len(_get_text(embed, key)) for key in _EMBED_TEXT_LIMITS) + sum(
+        len(embed_field.get('name', '')) + len(embed_field.get('value', ''))
+        for embed_field in embed.get('fields', [])
+    )
+
+
+def check_post(post: DiscordPost) -> List[str]:
+    """Return the reasons why Discord would reject the post, empty if it is fine"""
+    problems = []
+
+    if len(post.username) > DISCORD_USERNAME_LIMIT:
+        problems.append(f'username is longer than {DISCORD_USERNAME_LIMIT}')
+    if len(post.content) > DISCORD_CONTENT_LIMIT:
+        problems.append(f'content is longer than {DISCORD_CONTENT_LIMIT}')
+    if not (post.content or post.embeds or post.files):
+        problems.append('nothing to post')
+    if post.files is not None and len(post.files) > DISCORD_FILE_COUNT_LIMIT:
+        problems.append(f'more than {DISCORD_FILE_COUNT_LIMIT} files')
+
+    embeds = post.embeds or []
+    if len(embeds) > DISCORD_EMBED_COUNT_LIMIT:
+        problems.append(f'more than {DISCORD_EMBED_COUNT_LIMIT} embeds')
+    if sum(get_embed_size(embed) for embed in embeds) > DISCORD_EMBED_TOTAL_LIMIT:
+        problems.append(f'embeds are longer than {DISCORD_EMBED_TOTAL_LIMIT} in total')
+    for embed in embeds:
+        for key, limit in _EMBED_TEXT_LIMITS.items():
+            if len(_get_text(embed, key)) > limit:
+                problems.append(f'{key} of an embed is longer than {limit}')
+        embed_fields = embed.get('fields', [])
+        if len(embed_fields) > DISCORD_EMBED_FIELD_COUNT_LIMIT:
+            problems.append(f'more than {DISCORD_EMBED_FIELD_COUNT_LIMIT} fields in an embed')
+        for embed_field in embed_fields:
+            if (
+                len(embed_field.get('name', '')) > _EMBED_FIELD_NAME_LIMIT
+                or len(embed_field.get('value', '')) > _EMBED_FIELD_VALUE_LIMIT
+            ):
+                problems.append('a field of an embed is too long')
+
+    return problems
+
+
+def _truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else f'{text[:limit - 1]}…'
+
+
+def _truncate_embed(embed: Mapping[str, Any]) -> Dict[str, Any]:
+    """Shorten the text of the embed to fit the limits, the rest is kept as is"""
+    truncated: Dict[str, Any] = dict(embed)
+    for key, limit in _EMBED_TEXT_LIMITS.items():
+        text = _get_text(embed, key)
+        if len(text) > limit:
+            _set_text(truncated, key, _truncate(text, limit))
+
+    if 'fields' in embed:
+        truncated['fields'] = [
+            {
+                **embed_field,
+                'name': _truncate(embed_field.get('name', ''), _EMBED_FIELD_NAME_LIMIT),
+                'value': _truncate(embed_field.get('value', ''), _EMBED_FIELD_VALUE_LIMIT),
+            }
+            for embed_field in embed['fields'][:DISCORD_EMBED_FIELD_COUNT_LIMIT]
+        ]
+
+    # Even alone the embed may be over the total limit, drop the last fields first
+    while get_embed_size(truncated) > DISCORD_EMBED_TOTAL_LIMIT and truncated.get('fields'):
+        truncated['fields'] = truncated['fields'][:-1]
+    for key in ['description', 'footer.text']:
+        excess = get_embed_size(truncated) - DISCORD_EMBED_TOTAL_LIMIT
+        text = _get_text(truncated, key)
+        if excess > 0 and text:
+            _set_text(truncated, key, _truncate(text, max(len(text) - excess, 1)))
+    return truncated
+
+
+def split_content(content: str, limit: int = DISCORD_CONTENT_LIMIT) -> List[str]:
+    """Split the content at line breaks, or spaces if a line is too long"""
+    chunks = []
+    while len(content) > limit:
+        cut = content.rfind('\n', 0, limit + 1)
+        if cut <= 0:
+            cut = content.rfind(' ', 0, limit + 1)
+        if cut <= 0:
+            chunks.append(content[:limit])
+            content = content[limit:]
+        else:
+            # The line break or the space is dropped
+            chunks.append(content[:cut])
+            content = content[cut + 1:]
+    chunks.append(content)
+    return chunks
+
+
+def _chunk_embeds(embeds: Sequence[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Group the embeds by the count and the total size allowed in one message"""
+    chunks: List[List[Dict[str, Any]]] = []
+    chunk_size = 0
+    for embed in embeds:
+        embed_size = get_embed_size(embed)
+        if (
+            not chunks
+            or len(chunks[-1]) >= DISCORD_EMBED_COUNT_LIMIT
+            or chunk_size + embed_size > DISCORD_EMBED_TOTAL_LIMIT
+        ):
+            chunks.append([])
+            chunk_size = 0
+        chunks[-1].append(embed)
+        chunk_size += embed_size
+    return chunks
+
+
+def _chunk(items: Sequence[_T], size: int) -> List[List[_T]]:
+    return [list(items[start:start + size]) for start in range(0, len(items), size)]
+
+
+def preflight(post: DiscordPost) -> List[DiscordPost]:
+    """
+    Split the post into messages that Discord accepts
+
+    Long content continues in the following messages. The embeds and the files are
+    attached from the last part of the content, as many as one message allows, and the
+    rest follow in messages of their own. The trace stays with the first message.
+    """
+    if not check_post(post):
+        return [post]
+
+    username = _truncate(post.username, DISCORD_USERNAME_LIMIT)
+    contents = [
+        content for content in split_content(post.content) if content.strip()
+    ] or ['']
+    attachments: List[
+        Tuple[Optional[List[Dict[str, Any]]], Optional[List[str]]]
+    ] = list(itertools.zip_longest(
+        _chunk_embeds([_truncate_embed(embed) for embed in post.embeds or []]),
+        _chunk(post.files or [], DISCORD_FILE_COUNT_LIMIT),
+    ))
+
+    parts = [
+        DiscordPost(
+            username=username,
+            avatar_url=post.avatar_url,
+            content=content,
+        )
+        for content in contents
+    ]
+    for index, (embeds, files) in enumerate(attachments):
+        if index > 0:
+            parts.append(
+                DiscordPost(username=username, avatar_url=post.avatar_url, content='')
+            )
+        parts[-1].embeds = embeds
+        parts[-1].files = files
+
+    parts[0].trace = post.trace
+    return parts
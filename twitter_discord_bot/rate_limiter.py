@@ -0,0 +1,140 @@
+"""Share the rate limits of Twitter and Discord between the processes on the host"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import struct
+import time
+from typing import Any, Callable
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# Tokens left, when they were counted (epoch)
+BUCKET = struct.Struct('<dd')
+
+TWITTER_API_PREFIX = 'https://api.twitter.com/'
+DISCORD_WEBHOOK_PREFIX = 'https://discord.com/api/webhooks/'
+
+
+class SharedRateLimiter:
+    """
+    Token buckets in files shared by all the processes using the same directory
+
+    Each bucket is a small file holding the tokens left, refilled at `rate_per_second` up
+    to `burst`. A token is taken under an exclusive lock of the file, so the processes
+    together stay under the limit while each may use all of it when the others are idle.
+    The files are named by the hashes of the keys, which may be secrets like tokens.
+    """
+
+    directory: str
+    name: str
+    rate_per_second: float
+    burst: float
+    clock: Callable[[], float]
+    sleep: Callable[[float], Any]
+
+    def __init__(
+        self,
+        directory: str,
+        name: str,
+        rate_per_second: float,
+        burst: float = 1,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], Any] = time.sleep,
+    ) -> None:
+        if rate_per_second <= 0 or burst < 1:
+            raise ValueError('The rate must be positive and the burst at least 1.')
+        self.directory = directory
+        self.name = name
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        os.makedirs(directory, exist_ok=True)
+
+    def _get_path(self, key: str) -> str:
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()
+        return os.path.join(self.directory, f'{self.name}-{digest}.bucket')
+
+    def try_acquire(self, key: str) -> float:
+        """Take a token of the key, return 0 if taken or else the seconds to wait"""
+        try:
+            bucket_fd = os.open(self._get_path(key), os.O_RDWR | os.O_CREAT, 0o666)
+        except OSError:
+            # Do not stop the requests for a broken directory
+            logger.warning('Failed to open the %s rate limit bucket, ignore it.', self.name)
+            return 0.0
+
+        try:
+            # Released when the file is closed
+            fcntl.flock(bucket_fd, fcntl.LOCK_EX)
+            now = self.clock()
+            data = os.pread(bucket_fd, BUCKET.size, 0)
+            if len(data) == BUCKET.size:
+                tokens, counted_at = BUCKET.unpack(data)
+                tokens = min(
+                    self.burst, tokens + max(now - counted_at, 0.0) * self.rate_per_second
+                )
+            else:
+                tokens = self.burst
+
+            if tokens >= 1:
+                tokens -= 1
+                wait_seconds = 0.0
+            else:
+                wait_seconds = (1 - tokens) / self.rate_per_second
+            os.pwrite(bucket_fd, BUCKET.pack(tokens, now), 0)
+            return wait_seconds
+        finally:
+            os.close(bucket_fd)
+
+    def acquire(self, key: str) -> float:
+        """Wait until a token of the key is taken, return the seconds waited"""
+        waited_seconds = 0.0
+        while True:
+            wait_seconds = self.try_acquire(key)
+            if wait_seconds <= 0:
+                if waited_seconds > 0:
+                    logger.debug(
+                        'Waited %.2fs for the %s rate limit.', waited_seconds, self.name
+                    )
+                return waited_seconds
+            self.sleep(wait_seconds)
+            waited_seconds += wait_seconds
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """Take a token from the limiter before sending each request"""
+
+    rate_limiter: SharedRateLimiter
+    get_key: Callable[[requests.PreparedRequest], str]
+
+    def __init__(
+        self,
+        rate_limiter: SharedRateLimiter,
+        get_key: Callable[[requests.PreparedRequest], str],
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.rate_limiter = rate_limiter
+        self.get_key = get_key
+
+    def send(  # pylint: disable=arguments-differ
+        self, request: requests.PreparedRequest, **kwargs: Any
+    ) -> requests.Response:
+        self.rate_limiter.acquire(self.get_key(request))
+        return super().send(request, **kwargs)
+
+
+def mount_rate_limiter(
+    session: requests.Session,
+    prefix: str,
+    rate_limiter: SharedRateLimiter,
+    get_key: Callable[[requests.PreparedRequest], str],
+) -> None:
+    """Limit the requests of the session to the urls starting with the prefix"""
+    session.mount(prefix, RateLimitedAdapter(rate_limiter=rate_limiter, get_key=get_key))
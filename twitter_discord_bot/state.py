@@ -0,0 +1,97 @@
+"""Snapshot of the runtime state, restored on the next start to avoid a cold start"""
+
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Mapping
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+RUNTIME_STATE_VERSION = 1
+
+
+@dataclass
+class AccountStats:
+    """Timing statistics of fetching a Twitter account"""
+    last_fetched_at: float = 0.0
+    last_fetch_seconds: float = 0.0
+    fetch_count: int = 0
+    tweet_count: int = 0
+
+
+@dataclass
+class RuntimeState:
+    """Everything that is expensive to rebuild after a restart"""
+    interval_count: int = 0
+    # screen name (casefolded) -> keyword arguments of TwitterUserWrapper.set_profile
+    profiles: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # screen name (casefolded) -> stats
+    account_stats: Dict[str, AccountStats] = field(default_factory=dict)
+    # webhook url -> results of PendingDelivery.to_dict
+    pending_deliveries: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)
+    # 'accounts' or 'webhooks' -> results of CircuitBreakers.get_states
+    circuit_breakers: Dict[str, Dict[str, Dict[str, Any]]] = field(default_factory=dict)
+    # webhook url -> results of WebhookRegistry.get_states
+    webhook_health: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+
+def _read_profile(profile: Mapping[str, Any]) -> Dict[str, Any]:
+    """Keep the keyword arguments of TwitterUserWrapper.set_profile, checking their types"""
+    profile_kwargs: Dict[str, Any] = {
+        'name': str(profile['name']),
+        'user_id': int(profile['user_id']),
+        'profile_image_url': str(profile['profile_image_url']),
+    }
+    if profile.get('synced_at') is not None:
+        profile_kwargs['synced_at'] = float(profile['synced_at'])
+    return profile_kwargs
+
+
+def read_runtime_state(filename: str) -> RuntimeState:
+    """Read the snapshot, return an empty state if it is missing or unreadable"""
+
+    try:
+        with open(filename, encoding='utf-8') as state_file:
+            state_dict = json.load(state_file)
+    except OSError:
+        return RuntimeState()
+    except ValueError:
+        logger.warning('The runtime state in %s is corrupted, ignore it.', filename)
+        return RuntimeState()
+
+    try:
+        if not isinstance(state_dict, dict):
+            raise TypeError('The runtime state is not an object.')
+        if state_dict.get('version') != RUNTIME_STATE_VERSION:
+            logger.warning('The runtime state in %s is outdated, ignore it.', filename)
+            return RuntimeState()
+
+        return RuntimeState(
+            interval_count=int(state_dict['interval_count']),
+            profiles={
+                screen_name: _read_profile(profile)
+                for screen_name, profile in state_dict['profiles'].items()
+            },
+            account_stats={
+                screen_name: AccountStats(**stats)
+                for screen_name, stats in state_dict['account_stats'].items()
+            },
+            pending_deliveries=dict(state_dict.get('pending_deliveries', {})),
+            circuit_breakers=dict(state_dict.get('circuit_breakers', {})),
+            webhook_health=dict(state_dict.get('webhook_health', {})),
+        )
+    except (AttributeError, KeyError, TypeError, ValueError):
+        logger.warning('The runtime state in %s is corrupted, ignore it.', filename)
+        return RuntimeState()
+
+
+def save_runtime_state(filename: str, runtime_state: RuntimeState) -> None:
+    """Write the snapshot atomically so that a crash never leaves a partial file"""
+
+    state_dict = {'version': RUNTIME_STATE_VERSION, **asdict(runtime_state)}
+
+    temp_filename = f'{filename}.tmp'
+    with open(temp_filename, 'w', encoding='utf-8') as state_file:
+        json.dump(state_dict, state_file)
+    os.replace(temp_filename, filename)
@@ -0,0 +1,191 @@
+"""Receive tweets from the filtered stream of Twitter API v2"""
+
+import json
+import logging
+import queue
+import time
+from threading import Event
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import tweepy
+import tweepy.models
+
+from .models import TwitterAccount
+from .twitter_api import (
+    MEDIA_FIELDS_V2,
+    TWEET_FIELDS_V2,
+    USER_FIELDS_V2,
+    convert_tweet_v2_to_status,
+)
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+RULE_TAG = 'twitter_discord_bot'
+RULE_MAX_LENGTH = 512
+RESTART_WAIT_SECONDS = 5.0
+RESTART_WAIT_MAX_SECONDS = 320.0
+
+
+def generate_rules(twitter_accounts: Iterable[TwitterAccount]) -> List[str]:
+    """Generate as few `from:` rules as possible to match the tweets of the accounts"""
+
+    rules: List[str] = []
+    operators: List[str] = []
+
+    def _build_rule(operators: List[str]) -> str:
+        return f'({" OR ".join(operators)}) -is:reply'
+
+    for screen_name in sorted({account.twitter.casefold() for account in twitter_accounts}):
+        operator = f'from:{screen_name}'
+        if operators and len(_build_rule(operators + [operator])) > RULE_MAX_LENGTH:
+            rules.append(_build_rule(operators))
+            operators = []
+        operators.append(operator)
+
+    if operators:
+        rules.append(_build_rule(operators))
+
+    return rules
+
+
+class TweetStream(tweepy.StreamingClient):
+    """
+    Receive tweets of the tracked accounts in real time
+
+    The tweets are converted to v1.1 statuses and queued for the main loop, which is
+    woken up with `wake_up`. While the stream is disconnected, and once after each
+    connection, the main loop should fetch the timelines to fill the gap.
+    """
+
+    tweets: 'queue.Queue[Tuple[Dict[str, Any], tweepy.models.Status]]'
+
+    _wake_up: Event
+    _is_connected: bool
+    _needs_gap_fill: bool
+    _restart_wait: float
+    _restart_at: float
+
+    def __init__(self, bearer_token: str, wake_up: Event, **kwargs: Any) -> None:
+        super().__init__(bearer_token, return_type=dict, daemon=True, **kwargs)
+        self.tweets = queue.Queue()
+        self._wake_up = wake_up
+        self._is_connected = False
+        self._needs_gap_fill = True
+        self._restart_wait = RESTART_WAIT_SECONDS
+        self._restart_at = 0.0
+
+    @property
+    def is_connected(self) -> bool:
+        """Whether tweets are being received"""
+        return self._is_connected
+
+    def take_gap_fill_request(self) -> bool:
+        """Whether the timelines should be fetched to fill the gap, only once for each"""
+        needs_gap_fill = self._needs_gap_fill or not self._is_connected
+        self._needs_gap_fill = False
+        return needs_gap_fill
+
+    def sync_rules(self, twitter_accounts: Iterable[TwitterAccount]) -> None:
+        """Update the rules of the stream to match the accounts"""
+        expected_rules = set(generate_rules(twitter_accounts))
+        current_rules = {
+            rule['value']: rule['id']
+            for rule in self.get_rules().get('data', [])
+            if rule.get('tag') == RULE_TAG
+        }
+
+        to_delete = [
+            rule_id for value, rule_id in current_rules.items() if value not in expected_rules
+        ]
+        to_add = [value for value in expected_rules if value not in current_rules]
+
+        if to_delete:
+            self.delete_rules(to_delete)
+        if to_add:
+            self.add_rules([tweepy.StreamRule(value=value, tag=RULE_TAG) for value in to_add])
+        logger.info('Stream rules synced, %d added, %d deleted.', len(to_add), len(to_delete))
+
+    def ensure_running(self) -> None:
+        """Connect to the stream, or reconnect with backoff if the connection was lost"""
+        if self.running or time.monotonic() < self._restart_at:
+            return
+
+        if self._restart_at:
+            self._restart_wait = min(self._restart_wait * 2, RESTART_WAIT_MAX_SECONDS)
+        self._restart_at = time.monotonic() + self._restart_wait
+
+        logger.info('Connecting to the filtered stream...')
+        self.filter(
+            threaded=True,
+            expansions=['author_id', 'attachments.media_keys'],
+            tweet_fields=TWEET_FIELDS_V2,
+            media_fields=MEDIA_FIELDS_V2,
+            user_fields=USER_FIELDS_V2,
+        )
+
+    def _set_disconnected(self) -> None:
+        # Wake up the main loop only once, not on every failed reconnection
+        if self._is_connected:
+            logger.warning('Disconnected from the filtered stream, fall back to polling.')
+            self._is_connected = False
+            self._wake_up.set()
+
+    def on_connect(self) -> None:
+        logger.info('Connected to the filtered stream.')
+        self._is_connected = True
+        self._needs_gap_fill = True
+        self._restart_wait = RESTART_WAIT_SECONDS
+        self._wake_up.set()
+
+    def on_data(self, raw_data: bytes) -> None:
+        data = json.loads(raw_data)
+        if 'data' not in data:
+            logger.warning('Unexpected data from the filtered stream: %s', data)
+            return
+
+        tweet = data['data']
+        includes = data.get('includes', {})
+        authors = [
+            user_data for user_data in includes.get('users', [])
+            if user_data['id'] == tweet.get('author_id')
+        ]
+        if not authors:
+            logger.warning('The author of tweet %s is not included.', tweet['id'])
+            return
+
+        medias = {media['media_key']: media for media in includes.get('media', [])}
+        self.tweets.put((authors[0], convert_tweet_v2_to_status(tweet=tweet, medias=medias)))
+        self._wake_up.set()
+
+    def on_closed(self, response: Any) -> None:
+        self._set_disconnected()
+
+    def on_connection_error(self) -> None:
+        self._set_disconnected()
+
+    def on_request_error(self, status_code: int) -> None:
+        logger.error('The filtered stream returned status code %d.', status_code)
+        self._set_disconnected()
+
+    def on_disconnect(self) -> None:
+        self._set_disconnected()
+
+    def get_received(self) -> List[Tuple[Dict[str, Any], tweepy.models.Status]]:
+        """Take the received tweets with their authors"""
+        received: List[Tuple[Dict[str, Any], tweepy.models.Status]] = []
+        while True:
+            try:
+                received.append(self.tweets.get_nowait())
+            except queue.Empty:
+                return received
+
+
+def create_tweet_stream(bearer_token: str, wake_up: Event) -> Optional[TweetStream]:
+    """Create the stream, None if the filtered stream is not available with the token"""
+    tweet_stream = TweetStream(bearer_token=bearer_token, wake_up=wake_up)
+    try:
+        tweet_stream.get_rules()
+    except tweepy.TweepyException:
+        logger.exception('The filtered stream is not available, use polling only.')
+        return None
+    return tweet_stream
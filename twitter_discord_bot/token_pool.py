@@ -0,0 +1,243 @@
+"""Share the requests to Twitter between the apps of several bearer tokens"""
+
+import functools
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from threading import RLock
+from typing import AbstractSet, Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+from .rate_limiter import TWITTER_API_PREFIX, SharedRateLimiter, mount_rate_limiter
+from .twitter_api import TwitterAPI, create_twitter_api
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# The length of the rate limit windows of Twitter API, for 429 without the reset time
+RATE_LIMIT_WINDOW_SECONDS = 15 * 60
+
+# The endpoints fetching the timelines, which the tokens are ranked and benched by
+TIMELINE_ENDPOINTS = frozenset({'/1.1/statuses/user_timeline.json', '/2/users/:id/tweets'})
+
+
+def get_endpoint(url: str) -> str:
+    """The path of the url with the ids replaced, since the quota is of the endpoint"""
+    # Not the version of the API at the start
+    return re.sub(r'(?<=.)/\d+(?=/|$)', '/:id', urlparse(url).path)
+
+
+@dataclass
+class TokenUsage:
+    """How much a bearer token has been used, from the rate limit headers of Twitter"""
+    request_count: int = 0
+    rate_limited_count: int = 0
+    # Endpoint (see `get_endpoint`) -> (remaining requests, when the window resets)
+    quotas: Dict[str, Tuple[int, float]] = field(default_factory=dict)
+
+    def get_remaining(
+        self, now: float, endpoints: AbstractSet[str] = TIMELINE_ENDPOINTS
+    ) -> Optional[int]:
+        """The fewest requests left among the endpoints, None if unknown"""
+        remainings = [
+            remaining for endpoint, (remaining, reset_at) in self.quotas.items()
+            if endpoint in endpoints and reset_at > now
+        ]
+        return min(remainings) if remainings else None
+
+    def get_reset_at(self, now: float, endpoints: AbstractSet[str] = TIMELINE_ENDPOINTS) -> float:
+        """When all the exhausted endpoints have their quotas back"""
+        return max(
+            (
+                reset_at for endpoint, (remaining, reset_at) in self.quotas.items()
+                if endpoint in endpoints and remaining <= 0 and reset_at > now
+            ),
+            default=now,
+        )
+
+    def get_exhausted(self, now: float) -> List[str]:
+        """The endpoints without quota left, including those other than the timelines"""
+        return sorted(
+            endpoint for endpoint, (remaining, reset_at) in self.quotas.items()
+            if remaining <= 0 and reset_at > now
+        )
+
+
+class TwitterClientPool:
+    """
+    Clients of Twitter API, one for each bearer token
+
+    Each account is pinned to the token with the most remaining quota when it is first
+    fetched, and stays there to keep its requests on the same client. A token without
+    quota left is benched until its window resets, and its accounts move to the others.
+    Only the quota of the timelines counts, the other endpoints are tracked for the logs.
+
+    With `rate_limiter`, the requests of each token are also limited together with the
+    other processes using the same token.
+
+    The timelines may be fetched from several threads at once, so the usages and the
+    pins are only touched with `_lock` held.
+    """
+
+    usage_log_interval_seconds: float
+
+    _clients: List[TwitterAPI]
+    _usages: List[TokenUsage]
+    # Casefolded screen name -> index of the token
+    _pins: Dict[str, int]
+    _last_usage_log_at: float
+    _lock: RLock
+
+    def __init__(
+        self,
+        bearer_tokens: Sequence[str],
+        api_version: str = 'v1',
+        usage_log_interval_seconds: float = 60 * 60,
+        rate_limiter: Optional[SharedRateLimiter] = None,
+    ) -> None:
+        if not bearer_tokens:
+            raise ValueError('At least one bearer token is required.')
+
+        self.usage_log_interval_seconds = usage_log_interval_seconds
+        self._clients = [
+            create_twitter_api(bearer_token=bearer_token, api_version=api_version)
+            for bearer_token in bearer_tokens
+        ]
+        self._usages = [TokenUsage() for _ in bearer_tokens]
+        self._pins = {}
+        self._last_usage_log_at = time.monotonic()
+        self._lock = RLock()
+
+        for index, client in enumerate(self._clients):
+            client.session.hooks['response'].append(
+                functools.partial(self._on_response, index)
+            )
+            if rate_limiter is not None:
+                mount_rate_limiter(
+                    session=client.session,
+                    prefix=TWITTER_API_PREFIX,
+                    rate_limiter=rate_limiter,
+                    get_key=lambda _request, key=bearer_tokens[index]: key,
+                )
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def _on_response(self, index: int, response: requests.Response, **_kwargs: Any) -> None:
+        """Record the rate limit of the endpoint from the response"""
+        with self._lock:
+            self._record_response(index, response)
+
+    def _record_response(self, index: int, response: requests.Response) -> None:
+        usage = self._usages[index]
+        usage.request_count += 1
+        now = time.time()
+        endpoint = get_endpoint(response.url)
+        was_available = self._is_available(index, now)
+
+        remaining = response.headers.get('x-rate-limit-remaining')
+        reset_at = response.headers.get('x-rate-limit-reset')
+        if remaining is not None and reset_at is not None:
+            usage.quotas[endpoint] = (int(remaining), float(reset_at))
+
+        if response.status_code == 429:
+            usage.rate_limited_count += 1
+            if reset_at is None:
+                usage.quotas[endpoint] = (0, now + RATE_LIMIT_WINDOW_SECONDS)
+            else:
+                usage.quotas[endpoint] = (0, float(reset_at))
+
+        if was_available and not self._is_available(index, now):
+            logger.warning(
+                'Twitter token #%d is out of quota, bench it until %s.',
+                index + 1,
+                datetime.fromtimestamp(usage.get_reset_at(now)).strftime('%H:%M:%S'),
+            )
+
+    def _is_available(self, index: int, now: float) -> bool:
+        remaining = self._usages[index].get_remaining(now)
+        return remaining is None or remaining > 0
+
+    def _get_pin_counts(self) -> List[int]:
+        pin_counts = [0] * len(self._clients)
+        for index in self._pins.values():
+            pin_counts[index] += 1
+        return pin_counts
+
+    def _select(self, now: float) -> int:
+        """The available token with the most remaining quota, then with fewer accounts"""
+        available = [
+            index for index in range(len(self._clients)) if self._is_available(index, now)
+        ]
+        if not available:
+            # Every token is exhausted, use the one back the soonest
+            return min(
+                range(len(self._clients)),
+                key=lambda index: self._usages[index].get_reset_at(now),
+            )
+
+        pin_counts = self._get_pin_counts()
+
+        def _get_rank(index: int) -> Tuple[float, int]:
+            remaining = self._usages[index].get_remaining(now)
+            return (float('inf') if remaining is None else remaining, -pin_counts[index])
+
+        return max(available, key=_get_rank)
+
+    def has_quota(self) -> bool:
+        """Whether any token is not benched"""
+        now = time.time()
+        with self._lock:
+            return any(self._is_available(index, now) for index in range(len(self._clients)))
+
+    def get_client(self, screen_name: Optional[str] = None) -> TwitterAPI:
+        """Get the client pinned to the account, or the one with the most quota"""
+        with self._lock:
+            return self._clients[self._get_index(screen_name)]
+
+    def _get_index(self, screen_name: Optional[str]) -> int:
+        now = time.time()
+        if screen_name is None:
+            return self._select(now)
+
+        twitter_name = screen_name.casefold()
+        index = self._pins.get(twitter_name)
+        if index is None or not self._is_available(index, now):
+            new_index = self._select(now)
+            if index is not None and new_index != index:
+                logger.info(
+                    'Move %s from Twitter token #%d to #%d.',
+                    screen_name,
+                    index + 1,
+                    new_index + 1,
+                )
+            index = self._pins[twitter_name] = new_index
+        return index
+
+    def log_usage(self) -> None:
+        """Log the requests and the remaining quota of each token"""
+        now = time.time()
+        with self._lock:
+            pin_counts = self._get_pin_counts()
+
+            for index, usage in enumerate(self._usages):
+                remaining = usage.get_remaining(now)
+                logger.info(
+                    'Twitter token #%d: %d account(s), %d request(s), %d rate limited, '
+                    '%s timeline request(s) remaining, exhausted: %s.',
+                    index + 1,
+                    pin_counts[index],
+                    usage.request_count,
+                    usage.rate_limited_count,
+                    'unknown' if remaining is None else remaining,
+                    ', '.join(usage.get_exhausted(now)) or 'none',
+                )
+            self._last_usage_log_at = time.monotonic()
+
+    def log_usage_if_due(self) -> None:
+        """Log the usage once every `usage_log_interval_seconds`"""
+        if time.monotonic() - self._last_usage_log_at >= self.usage_log_interval_seconds:
+            self.log_usage()
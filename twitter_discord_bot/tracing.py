@@ -0,0 +1,213 @@
+"""Trace the latency of each tweet from its creation to the acceptance by Discord"""
+
+import bisect
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from threading import Lock
+from typing import Any, Deque, Dict, List, Mapping, Optional, Sequence
+
+from .models import get_webhook_id
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# Upper bounds of the buckets of the histograms, in seconds
+LATENCY_BUCKETS = (5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+TRACE_ATTRIBUTE = '_tweet_trace'
+
+
+@dataclass
+class DeliveryAttempt:
+    """An attempt to send the post to a Discord webhook"""
+    webhook_url: str
+    sent_at: float
+    finished_at: float
+    # None if the request failed without a response
+    status_code: Optional[int]
+
+    @property
+    def is_accepted(self) -> bool:
+        """Whether Discord accepted the post"""
+        return self.status_code in (200, 201, 204)
+
+
+@dataclass
+class TweetTrace:
+    """The timestamps of a tweet going through the bot"""
+    tracer: 'LatencyTracer' = field(repr=False, compare=False)
+    screen_name: str
+    status_id: int
+    created_at: float
+    fetched_at: float
+    rendered_at: Optional[float] = None
+    enqueued_at: Optional[float] = None
+    attempts: List[DeliveryAttempt] = field(default_factory=list)
+
+    def mark_rendered(self) -> None:
+        """The post of the tweet is generated"""
+        self.rendered_at = time.time()
+
+    def mark_enqueued(self) -> None:
+        """The post is queued, only the first of all the webhooks is recorded"""
+        if self.enqueued_at is None:
+            self.enqueued_at = time.time()
+
+    def record_attempt(self, webhook_url: str, sent_at: float, status_code: Optional[int]) -> None:
+        """Record an attempt to send the post, and its latency if it is accepted"""
+        attempt = DeliveryAttempt(
+            webhook_url=webhook_url,
+            sent_at=sent_at,
+            finished_at=time.time(),
+            status_code=status_code,
+        )
+        self.attempts.append(attempt)
+        if attempt.is_accepted:
+            self.tracer.record_delivery(trace=self, attempt=attempt)
+
+
+def get_trace(obj: Any) -> Optional[TweetTrace]:
+    """Get the trace attached to a status, None if it is not traced"""
+    trace = getattr(obj, TRACE_ATTRIBUTE, None)
+    return trace if isinstance(trace, TweetTrace) else None
+
+
+class LatencyHistogram:
+    """Latencies of the most recent deliveries"""
+
+    _samples: Deque[float]
+
+    def __init__(self, max_samples: int = 1000) -> None:
+        self._samples = deque(maxlen=max_samples)
+
+    def add(self, latency: float) -> None:
+        """Add a sample"""
+        self._samples.append(latency)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def get_counts(self, buckets: Sequence[float] = LATENCY_BUCKETS) -> Dict[str, int]:
+        """Count the samples in each bucket, labeled with the upper bounds"""
+        counts = [0] * (len(buckets) + 1)
+        for latency in self._samples:
+            counts[bisect.bisect_left(buckets, latency)] += 1
+        labels = [f'<={bucket}s' for bucket in buckets] + [f'>{buckets[-1]}s']
+        return dict(zip(labels, counts))
+
+    def get_percentile(self, percentile: float) -> float:
+        """Get the latency at the percentile, 0 if there are no samples"""
+        if not self._samples:
+            return 0.0
+        samples = sorted(self._samples)
+        return samples[min(int(len(samples) * percentile / 100), len(samples) - 1)]
+
+
+class LatencyTracer:
+    """
+    Create traces for tweets and collect the latencies into histograms
+
+    The latencies are kept for each account and each channel, and deliveries slower than
+    `slow_threshold_seconds` are logged with their breakdown. The deliveries may be
+    recorded from several threads at once, so the histograms are guarded by `_lock`.
+    """
+
+    slow_threshold_seconds: float
+    summary_interval_seconds: float
+
+    _max_samples: int
+    _account_histograms: Dict[str, LatencyHistogram]
+    _channel_histograms: Dict[str, LatencyHistogram]
+    _channel_names: Dict[str, str]
+    _last_summary_at: float
+    _lock: Lock
+
+    def __init__(
+        self,
+        slow_threshold_seconds: float = 300,
+        summary_interval_seconds: float = 60 * 60,
+        max_samples: int = 1000,
+    ) -> None:
+        self.slow_threshold_seconds = slow_threshold_seconds
+        self.summary_interval_seconds = summary_interval_seconds
+        self._max_samples = max_samples
+        self._account_histograms = {}
+        self._channel_histograms = {}
+        self._channel_names = {}
+        self._last_summary_at = time.monotonic()
+        self._lock = Lock()
+
+    def set_channel_names(self, discord_webhooks: Mapping[str, str]) -> None:
+        """Use the names of the channels instead of the webhook urls in the logs"""
+        self._channel_names = {url: name for name, url in discord_webhooks.items()}
+
+    def get_channel_name(self, webhook_url: str) -> str:
+        """The name of the channel, or the webhook id if it is unknown"""
+        return self._channel_names.get(webhook_url, get_webhook_id(webhook_url))
+
+    def start(self, screen_name: str, status: Any) -> TweetTrace:
+        """Start tracing the fetched status"""
+        now = time.time()
+        created_at = getattr(status, 'created_at', None)
+        trace = TweetTrace(
+            tracer=self,
+            screen_name=screen_name,
+            status_id=status.id,
+            created_at=created_at.timestamp() if isinstance(created_at, datetime) else now,
+            fetched_at=now,
+        )
+        setattr(status, TRACE_ATTRIBUTE, trace)
+        return trace
+
+    def record_delivery(self, trace: TweetTrace, attempt: DeliveryAttempt) -> None:
+        """Add the latency of the accepted delivery to the histograms"""
+        latency = attempt.finished_at - trace.created_at
+        channel_name = self.get_channel_name(attempt.webhook_url)
+
+        with self._lock:
+            for histograms, key in (
+                (self._account_histograms, trace.screen_name.casefold()),
+                (self._channel_histograms, channel_name),
+            ):
+                if key not in histograms:
+                    histograms[key] = LatencyHistogram(max_samples=self._max_samples)
+                histograms[key].add(latency)
+
+        if latency > self.slow_threshold_seconds:
+            logger.warning(
+                'Slow delivery of tweet %d from %s to %s: %.1fs in total, fetched after'
+                ' %.1fs, queued for %.1fs, sent in %.1fs with %d attempt(s).',
+                trace.status_id,
+                trace.screen_name,
+                channel_name,
+                latency,
+                trace.fetched_at - trace.created_at,
+                attempt.sent_at - (trace.enqueued_at or trace.fetched_at),
+                attempt.finished_at - attempt.sent_at,
+                len(trace.attempts),
+            )
+
+    def log_summary(self) -> None:
+        """Log the percentiles and histograms of the latencies"""
+        with self._lock:
+            for kind, histograms in (
+                ('account', self._account_histograms),
+                ('channel', self._channel_histograms),
+            ):
+                for key, histogram in sorted(histograms.items()):
+                    logger.info(
+                        'Latency of %s %s: %d sample(s), p50 %.1fs, p95 %.1fs, %s',
+                        kind,
+                        key,
+                        len(histogram),
+                        histogram.get_percentile(50),
+                        histogram.get_percentile(95),
+                        histogram.get_counts(),
+                    )
+            self._last_summary_at = time.monotonic()
+
+    def log_summary_if_due(self) -> None:
+        """Log the summary once every `summary_interval_seconds`"""
+        if time.monotonic() - self._last_summary_at >= self.summary_interval_seconds:
+            self.log_summary()
@@ -4,27 +4,89 @@ from __future__ import annotations
 
 import logging
 import re
-from typing import Dict, List
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional, Union
 
+import requests
 import tweepy
 import tweepy.models
 
 from .models import TwitterAccount
+from .tracing import LatencyTracer
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+# v1.1 API or v2 API (created with `return_type=dict`)
+TwitterAPI = Union[tweepy.API, tweepy.Client]
+
+TWEET_FIELDS_V2 = ['attachments', 'created_at', 'referenced_tweets']
+MEDIA_FIELDS_V2 = ['duration_ms', 'preview_image_url', 'type', 'url', 'variants']
+USER_FIELDS_V2 = ['name', 'profile_image_url', 'username']
+# The most tweets to look up in a request, the same for v1.1 and v2
+LOOKUP_BATCH_SIZE = 100
+
+
+def is_twitter_overloaded(_result: Any, error: Optional[BaseException]) -> bool:
+    """Whether the failure is caused by the load of Twitter, for the concurrency limiter"""
+    if isinstance(error, (tweepy.TooManyRequests, tweepy.TwitterServerError)):
+        return True
+    # Timeouts and connection errors are wrapped by tweepy
+    return error is not None and isinstance(
+        error.__context__, (OSError, requests.RequestException)
+    )
+
+
+def is_token_authorized(api: TwitterAPI, screen_name: str) -> bool:
+    """
+    Whether the token itself is still accepted after a 401 from the timeline of the user
+
+    v1.1 also answers 401 for the timelines of protected or suspended users, so a request
+    not about the timeline tells whether the token is revoked. It is assumed authorized
+    if the request fails for other reasons.
+    """
+    try:
+        if isinstance(api, tweepy.Client):
+            # The profiles are readable even if the tweets are not
+            api.get_user(username=screen_name)
+        else:
+            api.rate_limit_status()
+    except tweepy.Unauthorized:
+        return False
+    except (tweepy.TweepyException, requests.RequestException) as error:
+        logger.warning('Failed to check the Twitter token: %r', error)
+    return True
+
+
+def _get_original_profile_image_url(profile_image_url: str) -> str:
+    """Remove the size suffix to get the image in the original size"""
+    return re.sub(r'_normal(\..+)$', R'\1', profile_image_url)
+
+
+def create_twitter_api(bearer_token: str, api_version: str = 'v1') -> TwitterAPI:
+    """Create the client of the specified version of Twitter API"""
+    if api_version == 'v1':
+        return tweepy.API(auth=tweepy.OAuth2BearerHandler(bearer_token=bearer_token))
+    if api_version == 'v2':
+        return tweepy.Client(bearer_token=bearer_token, return_type=dict)
+    raise ValueError(f'Unknown Twitter API version: {api_version}')
+
 
 class TwitterUserWrapper:
     """
     Contains the infomation of a Twitter user
 
-    Fetch the information from Twitter only when needed (lazy loading).
+    Fetch the information from Twitter only when needed (lazy loading), and fetch it
+    again once it is older than `PROFILE_TTL_SECONDS`.
     """
 
+    PROFILE_TTL_SECONDS = 24 * 60 * 60
+
     screen_name: str
 
-    _api: tweepy.API
+    _api: TwitterAPI
     _has_initalize: bool = False
+    _synced_at: float = 0.0
 
     _name: str
     _user_id: int
@@ -32,7 +94,7 @@ class TwitterUserWrapper:
 
     def __init__(
             self,
-            api: tweepy.API,
+            api: TwitterAPI,
             screen_name: str,
     ) -> None:
         self._api = api
@@ -49,32 +111,74 @@ class TwitterUserWrapper:
         # pylint: disable=protected-access
 
         obj = TwitterUserWrapper(None, screen_name)
-        obj._name = name
-        obj._user_id = user_id
-        obj._profile_image_url = profile_image_url
-
-        obj._has_initalize = True
+        obj.set_profile(name=name, user_id=user_id, profile_image_url=profile_image_url)
 
         return obj
 
+    def get_profile(self) -> Optional[Dict[str, Any]]:
+        """Return the fetched information without fetching it, None if not fetched yet"""
+        if not self._has_initalize:
+            return None
+        return {
+            'name': self._name,
+            'user_id': self._user_id,
+            'profile_image_url': self._profile_image_url,
+            'synced_at': self._synced_at,
+        }
+
+    def set_profile(
+        self,
+        name: str,
+        user_id: int,
+        profile_image_url: str,
+        synced_at: Optional[float] = None,
+    ) -> None:
+        """Set the information directly, e.g. from a snapshot or another API response"""
+        self._name = name
+        self._user_id = user_id
+        self._profile_image_url = profile_image_url
+
+        self._has_initalize = True
+        self._synced_at = time.time() if synced_at is None else synced_at
+
     def _sync_with_twitter_api(self) -> None:
         """Fetch the information via Twitter API"""
 
-        logger.debug(f'Fetching user info of {self.screen_name}...')
+        logger.debug('Fetching user info of %s...', self.screen_name)
+
+        if isinstance(self._api, tweepy.Client):
+            user_data = self._api.get_user(
+                username=self.screen_name,
+                user_fields=USER_FIELDS_V2,
+            )['data']
+            self.set_profile_from_v2(user_data)
+            return
+
         user_info = self._api.get_user(screen_name=self.screen_name)
 
-        self._name = user_info.name
-        self._user_id = user_info.id
-        self._profile_image_url = re.sub(
-            r'_normal(\..+)$',
-            R'\1',
-            user_info.profile_image_url_https,
+        self.set_profile(
+            name=user_info.name,
+            user_id=user_info.id,
+            profile_image_url=_get_original_profile_image_url(
+                user_info.profile_image_url_https
+            ),
         )
 
-        self._has_initalize = True
+    def set_profile_from_v2(self, user_data: Mapping[str, Any]) -> None:
+        """Set the information from a user object of Twitter API v2"""
+        self.set_profile(
+            name=user_data['name'],
+            user_id=int(user_data['id']),
+            profile_image_url=_get_original_profile_image_url(
+                user_data['profile_image_url']
+            ),
+        )
 
     def _init_if_needed(self) -> None:
-        if not self._has_initalize:
+        if (
+            not self._has_initalize
+            or time.time() - self._synced_at > self.PROFILE_TTL_SECONDS
+        ):
             self._sync_with_twitter_api()
 
     @property
@@ -97,27 +201,205 @@ class TwitterUserWrapper:
 
 
 def get_twitter_users_infos(
-        api: tweepy.API,
+        api: TwitterAPI,
         twitter_accounts: List[TwitterAccount],
+        cached_users_infos: Optional[Mapping[str, TwitterUserWrapper]] = None,
 ) -> Dict[str, TwitterUserWrapper]:
-    """Get user objects from Twitter"""
+    """
+    Get user objects from Twitter
+
+    Objects in `cached_users_infos` are reused so that the fetched information is kept.
+    """
 
     twitter_users_infos: Dict[str, TwitterUserWrapper] = {}
 
     for twitter_account in twitter_accounts:
         screen_name = twitter_account.twitter
-        twitter_user = TwitterUserWrapper(api=api, screen_name=screen_name)
+        if cached_users_infos is not None and screen_name in cached_users_infos:
+            twitter_user = cached_users_infos[screen_name]
+        else:
+            twitter_user = TwitterUserWrapper(api=api, screen_name=screen_name)
         twitter_users_infos[screen_name] = twitter_user
 
     return twitter_users_infos
 
 
+def _convert_media_v2_to_v1(media: Mapping[str, Any]) -> Dict[str, Any]:
+    """Convert a media object of Twitter API v2 to a media entity of v1.1"""
+    media_id_str = media['media_key'].split('_')[-1]
+    media_entity: Dict[str, Any] = {
+        'id': int(media_id_str),
+        'id_str': media_id_str,
+        'type': media['type'],
+        'media_url_https': media.get('url', media.get('preview_image_url')),
+    }
+    if 'variants' in media:
+        media_entity['video_info'] = {
+            'variants': [
+                {
+                    'bitrate': variant.get('bit_rate', 0),
+                    'content_type': variant['content_type'],
+                    'url': variant['url'],
+                }
+                for variant in media['variants']
+            ],
+        }
+        if 'duration_ms' in media:
+            media_entity['video_info']['duration_millis'] = media['duration_ms']
+    return media_entity
+
+
+def convert_tweet_v2_to_status(
+        tweet: Mapping[str, Any],
+        medias: Mapping[str, Mapping[str, Any]],
+        users: Optional[Mapping[str, Mapping[str, Any]]] = None,
+) -> tweepy.models.Status:
+    """
+    Convert a tweet object of Twitter API v2 to a status of v1.1
+
+    Only the fields used to generate Discord posts are converted. The author is included
+    if found in `users`, which maps the ids to the user objects.
+    """
+    status_json: Dict[str, Any] = {
+        'id': int(tweet['id']),
+        'id_str': tweet['id'],
+        'full_text': tweet['text'],
+    }
+
+    user_data = (users or {}).get(tweet.get('author_id', ''))
+    if user_data is not None:
+        status_json['user'] = {
+            'id': int(user_data['id']),
+            'id_str': user_data['id'],
+            'name': user_data['name'],
+            'screen_name': user_data['username'],
+            'profile_image_url_https': user_data.get('profile_image_url', ''),
+        }
+
+    for referenced_tweet in tweet.get('referenced_tweets', []):
+        if referenced_tweet['type'] == 'retweeted':
+            status_json['retweeted_status'] = {
+                'id': int(referenced_tweet['id']),
+                'id_str': referenced_tweet['id'],
+            }
+        elif referenced_tweet['type'] == 'quoted':
+            status_json['is_quote_status'] = True
+            status_json['quoted_status_id'] = int(referenced_tweet['id'])
+            status_json['quoted_status_id_str'] = referenced_tweet['id']
+
+    media_entities = [
+        _convert_media_v2_to_v1(medias[media_key])
+        for media_key in tweet.get('attachments', {}).get('media_keys', [])
+        if media_key in medias
+    ]
+    if media_entities:
+        status_json['extended_entities'] = {'media': media_entities}
+
+    status = tweepy.models.Status.parse(None, status_json)
+    if 'created_at' in tweet:
+        # v2 uses ISO 8601 instead of the format of v1.1
+        status.created_at = datetime.fromisoformat(tweet['created_at'].replace('Z', '+00:00'))
+    return status
+
+
+def _get_twitter_user_timeline_v2(
+        client: tweepy.Client,
+        user: TwitterUserWrapper,
+        since_id: int = -1,
+) -> List[tweepy.models.Status]:
+    """
+    Get statuses of the specific user with Twitter API v2
+
+    The medias and the author are included in the same response with expansions.
+    """
+
+    params: Dict[str, Any] = {
+        'exclude': ['replies'],
+        'expansions': ['author_id', 'attachments.media_keys'],
+        'tweet_fields': TWEET_FIELDS_V2,
+        'media_fields': MEDIA_FIELDS_V2,
+        'user_fields': USER_FIELDS_V2,
+    }
+    if since_id == -1:
+        logger.info(
+            'Doesn\'t found the information of last ids, fetch lastest 10 tweets...'
+        )
+        params['max_results'] = 10
+    else:
+        logger.debug('Fetching tweets since id: %s', since_id)
+        params['since_id'] = since_id
+        # The default count of v1.1
+        params['max_results'] = 20
+
+    response = client.get_users_tweets(user.user_id, **params)
+
+    includes = response.get('includes', {})
+    for user_data in includes.get('users', []):
+        if int(user_data['id']) == user.user_id:
+            user.set_profile_from_v2(user_data)
+
+    medias = {media['media_key']: media for media in includes.get('media', [])}
+
+    return [
+        convert_tweet_v2_to_status(tweet=tweet, medias=medias)
+        for tweet in response.get('data', [])
+    ]
+
+
 def get_twitter_user_timeline(
+        api: TwitterAPI,
+        user: TwitterUserWrapper,
+        since_id: int = -1,
+        tracer: Optional[LatencyTracer] = None,
+) -> List[tweepy.models.Status]:
+    """Get statuses of the specific user from Twitter, and start tracing them if needed"""
+
+    if isinstance(api, tweepy.Client):
+        statuses = _get_twitter_user_timeline_v2(client=api, user=user, since_id=since_id)
+    else:
+        statuses = _get_twitter_user_timeline_v1(api=api, user=user, since_id=since_id)
+
+    if tracer is not None:
+        for status in statuses:
+            tracer.start(screen_name=user.screen_name, status=status)
+
+    return statuses
+
+
+def lookup_statuses(api: TwitterAPI, status_ids: List[int]) -> List[tweepy.models.Status]:
+    """
+    Get the statuses with their authors by the ids, at most LOOKUP_BATCH_SIZE of them
+
+    The deleted or protected tweets are left out.
+    """
+    if len(status_ids) > LOOKUP_BATCH_SIZE:
+        raise ValueError(f'At most {LOOKUP_BATCH_SIZE} tweets can be looked up at once.')
+
+    if isinstance(api, tweepy.Client):
+        response = api.get_tweets(
+            ids=status_ids,
+            expansions=['author_id', 'attachments.media_keys'],
+            tweet_fields=TWEET_FIELDS_V2,
+            media_fields=MEDIA_FIELDS_V2,
+            user_fields=USER_FIELDS_V2,
+        )
+        includes = response.get('includes', {})
+        medias = {media['media_key']: media for media in includes.get('media', [])}
+        users = {user_data['id']: user_data for user_data in includes.get('users', [])}
+        return [
+            convert_tweet_v2_to_status(tweet=tweet, medias=medias, users=users)
+            for tweet in response.get('data', [])
+        ]
+
+    return api.lookup_statuses(id=status_ids, tweet_mode='extended')
+
+
+def _get_twitter_user_timeline_v1(
         api: tweepy.API,
         user: TwitterUserWrapper,
         since_id: int = -1,
 ) -> List[tweepy.models.Status]:
-    """Get statuses of the specific user from Twitter"""
+    """Get statuses of the specific user with Twitter API v1.1"""
 
     if since_id == -1:
         logger.info(
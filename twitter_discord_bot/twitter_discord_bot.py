@@ -1,48 +1,67 @@
 """A bot that fetch tweets from Twitter and post to Discord"""
+import atexit
+import dataclasses
 import logging
+import os
 import sys
+import tempfile
+import time
+from concurrent.futures import Future
 from configparser import ConfigParser
 from signal import SIGINT, SIGTERM, Signals, signal
 from threading import Event
 from types import FrameType
-from typing import Dict, Iterable, List, Mapping, Optional
+from typing import Callable, Container, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+from urllib.parse import urlparse
 
+import requests
 import tweepy
-from ruamel.yaml import YAML
 
+from .archive import TweetArchive
+from .circuit_breaker import CircuitBreakers
+from .concurrency import AIMDLimiter
+from .config_watcher import ConfigWatcher
+from .control import ControlCommand, ControlServer
 from .configs import (
-    DISCORD_WEBHOOKS_PATH,
+    ARCHIVE_DIRECTORY,
     LAST_FETECHED_POSTS_PATH,
-    TWITTER_ACCOUNTS_PATH,
+    RUNTIME_STATE_PATH,
+    SETTINGS_PATH,
     TWITTER_SECRETS_PATH,
+    TenantPaths,
+    get_tenants,
 )
-from .discord_api import DiscordPost
-from .models import TwitterAccount
+from .delivery import DeliveryQueues, PendingDelivery, is_discord_overloaded
+from .hydration import TweetHydrator
+from .discord_api import HTTP_SESSION, DiscordPost
+from .logging_config import parse_level, setup_logging
+from .media import DISCORD_UPLOAD_SIZE_LIMIT, MediaCache
+from .models import TwitterAccount, get_webhook_id
+from .rate_limiter import DISCORD_WEBHOOK_PREFIX, SharedRateLimiter, mount_rate_limiter
+from .state import AccountStats, RuntimeState, read_runtime_state, save_runtime_state
+from .stream import TweetStream, create_tweet_stream
+from .token_pool import TwitterClientPool
+from .tracing import LatencyTracer
+from .webhook_health import WebhookRegistry
 from .twitter_api import (
     TwitterUserWrapper,
     get_twitter_user_timeline,
     get_twitter_users_infos,
-)
-
-for logger_to_suppressed in (
-    'urllib3',
-    'oauthlib',
-    'requests_oauthlib',
-    'tweepy',
-):
-    logging.getLogger(logger_to_suppressed).setLevel(logging.WARNING)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s:%(levelname)-7s:%(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
+    is_token_authorized,
+    is_twitter_overloaded,
 )
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+# Warn if it takes longer than this from calling main() to the first fetch
+STARTUP_BUDGET_SECONDS = 5.0
+
 
 def _get_twitter_accounts(path: str) -> List[TwitterAccount]:
     """Read Twitter user names that need to fetch from the file"""
+    # Imported here since only the main loop needs it
+    from ruamel.yaml import YAML  # pylint: disable=import-outside-toplevel
+
     yaml = YAML()
     with open(path, encoding='utf-8') as twitter_accounts_flle:
         twitter_account_dicts = yaml.load(twitter_accounts_flle)
@@ -53,14 +72,66 @@ def _get_twitter_accounts(path: str) -> List[TwitterAccount]:
     ]
 
 
-def _get_twitter_bearer_token(path: str) -> str:
-    """Read Twitter Bearer Token from the file"""
+def _get_twitter_bearer_tokens(path: str) -> List[str]:
+    """Read Twitter Bearer Tokens (BearerToken, BearerToken2, ...) from the file"""
     config_parser = ConfigParser(interpolation=None)
 
     with open(path, encoding='utf-8') as secret_config_file:
         config_parser.read_file(secret_config_file)
 
-    return config_parser['Twitter']['BearerToken']
+    bearer_tokens = [
+        bearer_token
+        for key, bearer_token in config_parser['Twitter'].items()
+        if key.startswith('bearertoken')
+    ]
+    if not bearer_tokens:
+        raise KeyError('BearerToken')
+    return bearer_tokens
+
+
+def _get_settings(path: str) -> ConfigParser:
+    """Read the optional settings from the file, use the defaults if it does not exist"""
+    config_parser = ConfigParser(interpolation=None)
+
+    try:
+        with open(path, encoding='utf-8') as settings_file:
+            config_parser.read_file(settings_file)
+    except OSError:
+        logger.debug('%s does not exist, use the default settings.', path)
+
+    return config_parser
+
+
+def _share_rate_limits(settings: ConfigParser) -> Optional[SharedRateLimiter]:
+    """
+    Limit the posts to each Discord webhook together with the other processes on the
+    host if enabled, and return the limiter for the Twitter clients
+    """
+    if not settings.getboolean('RateLimit', 'Enabled', fallback=False):
+        return None
+
+    directory = settings.get(
+        'RateLimit',
+        'Directory',
+        fallback=os.path.join(tempfile.gettempdir(), 'twitter_discord_bot_limits'),
+    )
+    mount_rate_limiter(
+        session=HTTP_SESSION,
+        prefix=DISCORD_WEBHOOK_PREFIX,
+        rate_limiter=SharedRateLimiter(
+            directory=directory,
+            name='discord',
+            rate_per_second=settings.getfloat('RateLimit', 'DiscordRate', fallback=0.5),
+            burst=settings.getfloat('RateLimit', 'DiscordBurst', fallback=5),
+        ),
+        get_key=lambda request: get_webhook_id(urlparse(request.url or '').path),
+    )
+    return SharedRateLimiter(
+        directory=directory,
+        name='twitter',
+        rate_per_second=settings.getfloat('RateLimit', 'TwitterRate', fallback=1),
+        burst=settings.getfloat('RateLimit', 'TwitterBurst', fallback=15),
+    )
 
 
 def _get_discord_webhooks(path: str) -> Dict[str, str]:
@@ -73,106 +144,472 @@ def _get_discord_webhooks(path: str) -> Dict[str, str]:
     return dict(config_parser['Webhooks'])
 
 
-def _post_tweets_to_discord(
+class _GlobalFetchError(Exception):
+    """Fetching failed for a reason shared by all accounts"""
+
+    latest_posts: Dict[str, int]
+
+    def __init__(self, latest_posts: Dict[str, int]) -> None:
+        super().__init__()
+        # The ids of the tweets fetched before the failure
+        self.latest_posts = latest_posts
+
+
+def _build_webhook_routes(
+    twitter_accounts: Iterable[TwitterAccount],
+    discord_webhooks: Mapping[str, str],
+) -> Dict[str, List[str]]:
+    """Map each Twitter account (casefolded) to the webhook urls to post to"""
+    return {
+        # Channels of different tenants may share the same webhook, post once
+        twitter_account.twitter.casefold(): list(dict.fromkeys(
+            discord_webhooks[discord_channel.lower()]
+            for discord_channel in twitter_account.discord_channels or []
+        ))
+        for twitter_account in twitter_accounts
+    }
+
+
+def _update_webhook_routes(
+    webhook_routes: Dict[str, List[str]],
+    old_twitter_accounts: Iterable[TwitterAccount],
+    new_twitter_accounts: Iterable[TwitterAccount],
+    old_discord_webhooks: Mapping[str, str],
+    new_discord_webhooks: Mapping[str, str],
+) -> None:
+    """
+    Apply the difference between the old and new configurations to `webhook_routes`
+
+    Only the routes of the accounts that are added, modified or posting to a modified
+    webhook are rebuilt.
+    """
+    old_accounts = {account.twitter.casefold(): account for account in old_twitter_accounts}
+    new_accounts = {account.twitter.casefold(): account for account in new_twitter_accounts}
+    changed_channels = {
+        channel
+        for channel in old_discord_webhooks.keys() | new_discord_webhooks.keys()
+        if old_discord_webhooks.get(channel) != new_discord_webhooks.get(channel)
+    }
+
+    for twitter_name in old_accounts.keys() - new_accounts.keys():
+        logger.info('Stop fetching %s.', twitter_name)
+        webhook_routes.pop(twitter_name, None)
+
+    for twitter_name, account in new_accounts.items():
+        channels = {channel.lower() for channel in account.discord_channels or []}
+        if (
+            account != old_accounts.get(twitter_name)
+            or channels & changed_channels
+            or twitter_name not in webhook_routes
+        ):
+            logger.info('Update the routes of %s.', twitter_name)
+            webhook_routes.update(
+                _build_webhook_routes([account], new_discord_webhooks)
+            )
+
+
+def _merge_tenant_configurations(
+    configurations: Mapping[str, Tuple[List[TwitterAccount], Dict[str, str]]],
+) -> Tuple[List[TwitterAccount], Dict[str, str]]:
+    """
+    Merge the configurations of the tenants so that each account is fetched only once
+
+    The channels of a tenant are prefixed with its name. An account of several tenants
+    posts to the channels of all of them, with the shortest interval and the highest
+    priority among them.
+    """
+    merged_accounts: Dict[str, TwitterAccount] = {}
+    merged_webhooks: Dict[str, str] = {}
+
+    for tenant_name, (twitter_accounts, discord_webhooks) in configurations.items():
+        prefix = f'{tenant_name}/' if tenant_name else ''
+        merged_webhooks.update({
+            f'{prefix}{discord_channel}'.lower(): webhook_url
+            for discord_channel, webhook_url in discord_webhooks.items()
+        })
+
+        for twitter_account in twitter_accounts:
+            discord_channels = [
+                f'{prefix}{discord_channel}'.lower()
+                for discord_channel in twitter_account.discord_channels or []
+            ]
+            twitter_name = twitter_account.twitter.casefold()
+            merged_account = merged_accounts.get(twitter_name)
+            if merged_account is None:
+                merged_accounts[twitter_name] = dataclasses.replace(
+                    twitter_account, discord_channels=discord_channels
+                )
+            else:
+                merged_accounts[twitter_name] = dataclasses.replace(
+                    merged_account,
+                    discord_channels=(merged_account.discord_channels or []) + discord_channels,
+                    interval=min(merged_account.interval, twitter_account.interval),
+                    priority=max(merged_account.priority, twitter_account.priority),
+                )
+
+    return list(merged_accounts.values()), merged_webhooks
+
+
+def _read_configuration(
+    tenants: Iterable[TenantPaths],
+) -> Optional[Tuple[List[TwitterAccount], Dict[str, str]]]:
+    """Read the configurations of the tenants and merge them, None if any is invalid"""
+    configurations: Dict[str, Tuple[List[TwitterAccount], Dict[str, str]]] = {}
+
+    for tenant in tenants:
+        twitter_accounts = _get_twitter_accounts(path=tenant.twitter_accounts_path)
+        discord_webhooks = _get_discord_webhooks(path=tenant.discord_webhooks_path)
+        if not _is_configuration_valid(
+            twitter_accounts=twitter_accounts,
+            discord_webhooks=discord_webhooks,
+        ):
+            logger.error(
+                'The configuration in %s is invalid.',
+                os.path.dirname(tenant.twitter_accounts_path),
+            )
+            return None
+        configurations[tenant.name] = (twitter_accounts, discord_webhooks)
+
+    return _merge_tenant_configurations(configurations)
+
+
+def _reload_configuration(
+    tenants: Iterable[TenantPaths],
+) -> Optional[Tuple[List[TwitterAccount], Dict[str, str]]]:
+    """Read the configuration again, return None if it is unreadable or invalid."""
+    try:
+        configuration = _read_configuration(tenants=tenants)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception('Failed to read the modified configuration, keep the old one.')
+        return None
+
+    if configuration is None:
+        logger.error('The modified configuration is invalid, keep the old one.')
+
+    return configuration
+
+
+def _enqueue_tweets(
     user: TwitterUserWrapper,
     statuses: List[tweepy.models.Status],
-    webhook_url: str,
+    webhook_urls: Iterable[str],
+    delivery_queues: DeliveryQueues,
+    media_cache: Optional[MediaCache] = None,
+    archive: Optional[TweetArchive] = None,
+    hydrator: Optional[TweetHydrator] = None,
 ) -> None:
-    """Post the statuses to the Discord channel with the webhook"""
+    """Generate the posts of the statuses and queue them for the Discord webhooks"""
+    if archive is not None:
+        try:
+            for status in statuses:
+                archive.append(screen_name=user.screen_name, status=status)
+        except OSError:
+            logger.exception('Failed to archive the tweets from %s.', user.screen_name)
+
     for status in reversed(statuses):
-        post = DiscordPost.generate_from_twitter_status(user=user, status=status)
-        response_code = post.save(webhook_url=webhook_url)
-
-        if response_code in [200, 201, 204]:
-            logger.info(
-                'Successfully post twitter id %d from %s to the Discord channel.',
-                status.id,
-                user.screen_name,
-            )
-        else:
-            logger.error(
-                'Failed to post twitter id %d from %s to the Discord channel. Code: %d',
-                status.id,
-                user.screen_name,
-                response_code,
+        post = DiscordPost.generate_from_twitter_status(
+            user=user,
+            status=status,
+            media_cache=media_cache,
+            hydrator=hydrator,
+        )
+        for webhook_url in webhook_urls:
+            delivery_queues.enqueue(
+                webhook_url=webhook_url,
+                delivery=PendingDelivery.from_status(user=user, status=status, post=post),
             )
 
 
+def _should_fetch(
+    twitter_account: TwitterAccount,
+    interval_count: int,
+    webhook_routes: Mapping[str, List[str]],
+    account_breakers: Optional[CircuitBreakers] = None,
+    paused_accounts: Optional[Container[str]] = None,
+) -> bool:
+    """Whether to fetch the account in this cycle"""
+    twitter_name = twitter_account.twitter
+
+    if interval_count % twitter_account.interval != 0:
+        logger.debug(
+            '%s does\'t need to be fetched according'
+            ' to the interval setting, ignore.',
+            twitter_name,
+        )
+        return False
+
+    if not webhook_routes.get(twitter_name.casefold()):
+        logger.warning(
+            '%s does\'t need to post to any'
+            ' Discord channel, ignore.',
+            twitter_name,
+        )
+        return False
+
+    if account_breakers is not None and account_breakers.is_open(twitter_name.casefold()):
+        logger.debug('The circuit of %s is open, ignore.', twitter_name)
+        return False
+
+    if paused_accounts is not None and twitter_name.casefold() in paused_accounts:
+        logger.debug('%s is paused, ignore.', twitter_name)
+        return False
+
+    return True
+
+
 def _fetch_and_post(
-    twitter_api: tweepy.API,
+    twitter_clients: TwitterClientPool,
     twitter_accounts: List[TwitterAccount],
-    discord_webhooks: Mapping[str, str],
+    twitter_users_infos: Mapping[str, TwitterUserWrapper],
+    webhook_routes: Mapping[str, List[str]],
     last_fetched_posts: Dict[str, int],
     # to determine wheteher to post according to the interval
     interval_count: int,
+    delivery_queues: DeliveryQueues,
+    account_stats: Optional[Dict[str, AccountStats]] = None,
+    media_cache: Optional[MediaCache] = None,
+    tracer: Optional[LatencyTracer] = None,
+    account_breakers: Optional[CircuitBreakers] = None,
+    archive: Optional[TweetArchive] = None,
+    paused_accounts: Optional[Container[str]] = None,
+    fetch_limiter: Optional[AIMDLimiter] = None,
+    hydrator: Optional[TweetHydrator] = None,
 ) -> Dict[str, int]:
     """
-    Fetch tweets and post them to the Discord channel.
+    Fetch tweets and queue them for the Discord channels.
     Return the ids of the lastest tweets.
+
+    Accounts whose circuits are open, or paused (casefolded), are skipped. With
+    `fetch_limiter`, the timelines are fetched concurrently as the limiter allows. With
+    `hydrator`, the tweets retweeted or quoted by all the accounts are looked up together
+    before the tweets are queued.
+    Raise _GlobalFetchError if no account can be fetched, e.g. the token is invalid or
+    every token is out of quota.
     """
 
-    # Get user information
-    logger.debug('Fetching user information...')
-    twitter_users_infos = get_twitter_users_infos(
-        api=twitter_api,
-        twitter_accounts=twitter_accounts,
-    )
+    if account_stats is None:
+        account_stats = {}
 
     latest_posts = last_fetched_posts.copy()
 
-    # Fetching timeline
-    for twitter_account in twitter_accounts:
-        try:
+    accounts_to_fetch = [
+        twitter_account for twitter_account in twitter_accounts
+        if _should_fetch(
+            twitter_account=twitter_account,
+            interval_count=interval_count,
+            webhook_routes=webhook_routes,
+            account_breakers=account_breakers,
+            paused_accounts=paused_accounts,
+        )
+    ]
 
-            if interval_count % twitter_account.interval != 0:
-                logger.debug(
-                    f'{twitter_account.twitter} does\'t need to be fetched according'
-                    ' to the interval setting, ignore.'
-                )
+    def _get_timeline(
+        twitter_account: TwitterAccount,
+    ) -> Tuple[List[tweepy.models.Status], float]:
+        """Fetch the new tweets, return them and the seconds taken"""
+        twitter_name = twitter_account.twitter
+        logger.debug('Fetching timeline from %s...', twitter_name)
 
-            if not twitter_account.discord_channels:
-                logger.warning(
-                    f'{twitter_account.twitter} does\'t need to post to any'
-                    ' Discord channel, ignore.'
-                )
-                continue
+        fetch_started_at = time.perf_counter()
+        statuses = get_twitter_user_timeline(
+            api=twitter_clients.get_client(twitter_name),
+            user=twitter_users_infos[twitter_name],
+            since_id=last_fetched_posts.get(twitter_name.casefold(), -1),
+            tracer=tracer,
+        )
+        return statuses, time.perf_counter() - fetch_started_at
 
-            twitter_name = twitter_account.twitter
-            twitter_user = twitter_users_infos[twitter_name]
+    # Fetch the timelines concurrently, while the tweets are still queued in order
+    futures: Dict[str, 'Future[Tuple[List[tweepy.models.Status], float]]'] = {}
+    if fetch_limiter is not None:
+        for twitter_account in accounts_to_fetch:
+            futures[twitter_account.twitter] = fetch_limiter.submit(
+                _get_timeline, twitter_account
+            )
 
-            logger.debug('Fetching timeline from %s...', twitter_name)
+    # The accounts with new tweets, and the tweets, newest first
+    fetched: List[Tuple[TwitterAccount, List[tweepy.models.Status]]] = []
+    global_error: Optional[_GlobalFetchError] = None
 
+    try:
+        for twitter_account in accounts_to_fetch:
             try:
-                since_id = last_fetched_posts[twitter_name.casefold()]
-            except KeyError:
-                since_id = -1
-
-            statuses = get_twitter_user_timeline(
-                api=twitter_api,
-                user=twitter_user,
-                since_id=since_id,
-            )
+                twitter_name = twitter_account.twitter
+                twitter_user = twitter_users_infos[twitter_name]
 
-            logger.debug('Found %d new tweet(s).', len(statuses))
+                if fetch_limiter is not None:
+                    statuses, fetch_seconds = futures[twitter_name].result()
+                else:
+                    statuses, fetch_seconds = _get_timeline(twitter_account)
 
-            if statuses:
-                for discord_channel in twitter_account.discord_channels:
-                    _post_tweets_to_discord(
-                        user=twitter_user,
-                        statuses=statuses,
-                        webhook_url=discord_webhooks[discord_channel.lower()],
-                    )
-                latest_posts[twitter_name.casefold()] = statuses[0].id
+                stats = account_stats.setdefault(twitter_name.casefold(), AccountStats())
+                stats.last_fetched_at = time.time()
+                stats.last_fetch_seconds = fetch_seconds
+                stats.fetch_count += 1
+                stats.tweet_count += len(statuses)
+
+                logger.debug('Found %d new tweet(s).', len(statuses))
 
+                if statuses:
+                    if media_cache is not None:
+                        # Download the videos concurrently, and only once for all channels
+                        for status in statuses:
+                            media_cache.prefetch_status(status)
+                    fetched.append((twitter_account, statuses))
+
+                if account_breakers is not None:
+                    account_breakers.record_success(twitter_name.casefold())
+
+            except tweepy.TooManyRequests as error:
+                # The token is benched, the account is fetched with another one next time
+                if not twitter_clients.has_quota():
+                    raise _GlobalFetchError(latest_posts=latest_posts) from error
+                logger.warning(
+                    'Rate limited when fetching %s, retry with another token later.',
+                    twitter_account.twitter,
+                )
+
+            except tweepy.Unauthorized as error:
+                # Also answered for the protected or suspended accounts
+                if not is_token_authorized(
+                    api=twitter_clients.get_client(twitter_account.twitter),
+                    screen_name=twitter_account.twitter,
+                ):
+                    raise _GlobalFetchError(latest_posts=latest_posts) from error
+                logger.warning(
+                    'Unauthorized to fetch %s, the account may be protected or suspended.',
+                    twitter_account.twitter,
+                )
+                if account_breakers is not None:
+                    account_breakers.record_failure(twitter_account.twitter.casefold())
+
+            except Exception:   # pylint: disable=broad-except
+                logger.exception(
+                    'Failed to process the Twitter account: %s',
+                    twitter_account,
+                )
+                if account_breakers is not None:
+                    account_breakers.record_failure(twitter_account.twitter.casefold())
+    except _GlobalFetchError as error:
+        # Still queue the tweets fetched before, `latest_posts` of it is updated below
+        global_error = error
+    finally:
+        # The accounts not fetched yet are fetched again next time
+        for future in futures.values():
+            future.cancel()
+
+    if hydrator is not None:
+        hydrator.hydrate(status for _, statuses in fetched for status in statuses)
+
+    for twitter_account, statuses in fetched:
+        twitter_name = twitter_account.twitter
+        try:
+            _enqueue_tweets(
+                user=twitter_users_infos[twitter_name],
+                statuses=statuses,
+                webhook_urls=webhook_routes[twitter_name.casefold()],
+                delivery_queues=delivery_queues,
+                media_cache=media_cache,
+                archive=archive,
+                hydrator=hydrator,
+            )
         except Exception:   # pylint: disable=broad-except
             logger.exception(
                 'Failed to process the Twitter account: %s',
                 twitter_account,
             )
+            if account_breakers is not None:
+                account_breakers.record_failure(twitter_name.casefold())
+            continue
+        latest_posts[twitter_name.casefold()] = statuses[0].id
+
+    if global_error is not None:
+        raise global_error
 
     return latest_posts
 
 
+def _enqueue_streamed_tweets(
+    tweet_stream: TweetStream,
+    twitter_users_infos: Mapping[str, TwitterUserWrapper],
+    webhook_routes: Mapping[str, List[str]],
+    last_fetched_posts: Dict[str, int],
+    delivery_queues: DeliveryQueues,
+    media_cache: Optional[MediaCache] = None,
+    tracer: Optional[LatencyTracer] = None,
+    archive: Optional[TweetArchive] = None,
+    paused_accounts: Optional[Container[str]] = None,
+    hydrator: Optional[TweetHydrator] = None,
+) -> Dict[str, int]:
+    """
+    Queue the tweets received from the stream for the Discord channels.
+    Tweets that have been fetched by polling are skipped. So are the tweets of the
+    paused accounts, which are fetched by polling once resumed.
+    Return the ids of the lastest tweets.
+    """
+
+    latest_posts = last_fetched_posts.copy()
+    twitter_users = {
+        screen_name.casefold(): twitter_user
+        for screen_name, twitter_user in twitter_users_infos.items()
+    }
+
+    received: List[Tuple[TwitterUserWrapper, tweepy.models.Status, List[str]]] = []
+    for user_data, status in tweet_stream.get_received():
+        twitter_name = user_data['username'].casefold()
+        twitter_user = twitter_users.get(twitter_name)
+        webhook_urls = webhook_routes.get(twitter_name)
+
+        if (
+            twitter_user is None
+            or not webhook_urls
+            or (paused_accounts is not None and twitter_name in paused_accounts)
+        ):
+            logger.debug('Ignore tweet %d from %s.', status.id, twitter_name)
+            continue
+        if status.id <= latest_posts.get(twitter_name, -1):
+            logger.debug('Tweet %d has been fetched, ignore.', status.id)
+            continue
+
+        twitter_user.set_profile_from_v2(user_data)
+        if tracer is not None:
+            tracer.start(screen_name=twitter_user.screen_name, status=status)
+        if media_cache is not None:
+            media_cache.prefetch_status(status)
+
+        received.append((twitter_user, status, webhook_urls))
+        latest_posts[twitter_name] = status.id
+
+    if hydrator is not None:
+        hydrator.hydrate(status for _, status, _ in received)
+
+    for twitter_user, status, webhook_urls in received:
+        _enqueue_tweets(
+            user=twitter_user,
+            statuses=[status],
+            webhook_urls=webhook_urls,
+            delivery_queues=delivery_queues,
+            media_cache=media_cache,
+            archive=archive,
+            hydrator=hydrator,
+        )
+
+    return latest_posts
+
+
+def _sync_stream_rules(
+    tweet_stream: TweetStream,
+    twitter_accounts: Iterable[TwitterAccount],
+) -> bool:
+    """Update the rules of the stream to the accounts, return whether it succeeded"""
+    try:
+        tweet_stream.sync_rules(twitter_accounts)
+    except (tweepy.TweepyException, requests.RequestException):
+        logger.exception('Failed to sync the stream rules, poll until they are synced.')
+        return False
+    return True
+
+
 def _read_last_fetched_ids_from_file(filename: str) -> Dict[str, int]:
     """Read the id of tweets that have fetched last time from the file"""
 
@@ -208,6 +645,192 @@ def _save_last_fetched_ids_to_file(
         config_parser.write(last_id_file)
 
 
+def _restore_runtime_state(
+    runtime_state: RuntimeState,
+    twitter_users_infos: Mapping[str, TwitterUserWrapper],
+) -> None:
+    """Fill the cached user information from the snapshot"""
+    restored_count = 0
+    for screen_name, twitter_user in twitter_users_infos.items():
+        profile = runtime_state.profiles.get(screen_name.casefold())
+        if profile is not None:
+            twitter_user.set_profile(**profile)
+            restored_count += 1
+
+    logger.info(
+        'Restored %d user profile(s) from the snapshot, interval count: %d.',
+        restored_count,
+        runtime_state.interval_count,
+    )
+
+
+def _take_runtime_state(
+    twitter_users_infos: Mapping[str, TwitterUserWrapper],
+    account_stats: Mapping[str, AccountStats],
+    interval_count: int,
+    delivery_queues: DeliveryQueues,
+    account_breakers: CircuitBreakers,
+    webhook_breakers: CircuitBreakers,
+    webhook_registry: WebhookRegistry,
+) -> RuntimeState:
+    """Collect the state of the current accounts into a snapshot"""
+    profiles = {}
+    for screen_name, twitter_user in twitter_users_infos.items():
+        profile = twitter_user.get_profile()
+        if profile is not None:
+            profiles[screen_name.casefold()] = profile
+
+    return RuntimeState(
+        interval_count=interval_count,
+        profiles=profiles,
+        account_stats={
+            screen_name.casefold(): account_stats[screen_name.casefold()]
+            for screen_name in twitter_users_infos
+            if screen_name.casefold() in account_stats
+        },
+        pending_deliveries=delivery_queues.get_pending(),
+        circuit_breakers={
+            'accounts': account_breakers.get_states(),
+            'webhooks': webhook_breakers.get_states(),
+        },
+        webhook_health=webhook_registry.get_states(),
+    )
+
+
+def _get_queue_stats(
+    discord_webhooks: Mapping[str, str],
+    delivery_queues: DeliveryQueues,
+) -> List[Dict[str, object]]:
+    """The backlog of each webhook, the urls are left out since they hold the tokens"""
+    discord_channels: Dict[str, List[str]] = {}
+    for discord_channel, webhook_url in discord_webhooks.items():
+        discord_channels.setdefault(webhook_url, []).append(discord_channel)
+
+    queue_stats = delivery_queues.get_stats()
+    webhook_registry = delivery_queues.webhook_registry
+    return [
+        {
+            'channels': discord_channels.get(webhook_url, []),
+            'webhook_id': get_webhook_id(webhook_url),
+            'depth': queue_stats.get(webhook_url, {}).get('depth', 0),
+            'backlog_age_seconds': round(
+                queue_stats.get(webhook_url, {}).get('backlog_age_seconds', 0.0), 1
+            ),
+            'paused': delivery_queues.is_paused(webhook_url),
+            'quarantined': (
+                webhook_registry is not None and webhook_registry.is_quarantined(webhook_url)
+            ),
+        }
+        # Also the webhooks removed from the configuration with posts still queued
+        for webhook_url in dict.fromkeys([*discord_channels, *queue_stats])
+    ]
+
+
+def _handle_control_command(
+    command: ControlCommand,
+    twitter_clients: TwitterClientPool,
+    twitter_accounts: List[TwitterAccount],
+    twitter_users_infos: Mapping[str, TwitterUserWrapper],
+    webhook_routes: Mapping[str, List[str]],
+    discord_webhooks: Mapping[str, str],
+    last_fetched_posts: Dict[str, int],
+    delivery_queues: DeliveryQueues,
+    paused_accounts: Set[str],
+    save_state: Callable[[Dict[str, int]], None],
+    media_cache: Optional[MediaCache] = None,
+    tracer: Optional[LatencyTracer] = None,
+    archive: Optional[TweetArchive] = None,
+    fetch_limiter: Optional[AIMDLimiter] = None,
+    hydrator: Optional[TweetHydrator] = None,
+) -> Dict[str, int]:
+    """
+    Carry out the command from the control endpoint and reply to it.
+    Return the ids of the lastest tweets.
+    """
+
+    latest_posts = last_fetched_posts
+
+    try:
+        if command.action == 'queues':
+            command.finish(result={
+                'webhooks': _get_queue_stats(discord_webhooks, delivery_queues),
+                'paused_accounts': sorted(paused_accounts),
+                'concurrency': {
+                    limiter.name: limiter.get_stats()
+                    for limiter in (fetch_limiter, delivery_queues.delivery_limiter)
+                    if limiter is not None
+                },
+            })
+
+        elif command.action == 'flush':
+            save_state(latest_posts)
+            logger.info('Saved the state files on request.')
+            command.finish(result={'saved': True})
+
+        elif command.account:
+            twitter_name = command.account.casefold()
+            matched_accounts = [
+                twitter_account for twitter_account in twitter_accounts
+                if twitter_account.twitter.casefold() == twitter_name
+            ]
+            if not matched_accounts:
+                command.finish(error=f'Unknown Twitter account: {command.account}')
+            elif command.action == 'pause':
+                paused_accounts.add(twitter_name)
+                logger.info('Pause fetching %s on request.', command.account)
+                command.finish(result={'account': twitter_name, 'paused': True})
+            else:
+                if command.action == 'resume':
+                    paused_accounts.discard(twitter_name)
+                    logger.info('Resume fetching %s on request.', command.account)
+                # Fetch it now, also to catch up with the tweets missed while paused
+                latest_posts = _fetch_and_post(
+                    twitter_clients=twitter_clients,
+                    twitter_accounts=matched_accounts,
+                    twitter_users_infos=twitter_users_infos,
+                    webhook_routes=webhook_routes,
+                    last_fetched_posts=latest_posts,
+                    interval_count=0,
+                    delivery_queues=delivery_queues,
+                    media_cache=media_cache,
+                    tracer=tracer,
+                    archive=archive,
+                    hydrator=hydrator,
+                )
+                delivery_queues.deliver()
+                command.finish(result={
+                    'account': twitter_name,
+                    'paused': twitter_name in paused_accounts,
+                    'last_id': latest_posts.get(twitter_name),
+                })
+
+        elif command.action == 'fetch':
+            command.finish(error='An account is required to fetch')
+
+        else:
+            webhook_url = discord_webhooks.get((command.channel or '').lower())
+            if webhook_url is None:
+                command.finish(error=f'Unknown Discord channel: {command.channel}')
+            elif command.action == 'pause':
+                delivery_queues.pause(webhook_url)
+                logger.info('Pause posting to %s on request.', command.channel)
+                command.finish(result={'channel': command.channel, 'paused': True})
+            else:
+                delivery_queues.resume(webhook_url)
+                logger.info('Resume posting to %s on request.', command.channel)
+                delivery_queues.deliver()
+                command.finish(result={'channel': command.channel, 'paused': False})
+
+    except _GlobalFetchError as error:
+        latest_posts = error.latest_posts
+        command.finish(error=f'Failed to fetch tweets: {error.__cause__!r}')
+    except Exception as error:  # pylint: disable=broad-except
+        logger.exception('Failed to handle the control command: %s', command)
+        command.finish(error=repr(error))
+
+    return latest_posts
+
+
 def _is_configuration_valid(
         twitter_accounts: Iterable[TwitterAccount],
         discord_webhooks: Mapping[str, str],
@@ -230,51 +853,364 @@ def _is_configuration_valid(
 def main() -> None:
     """main function"""
 
+    started_at = time.perf_counter()
     receive_stop = Event()
+    # Set when stopping or when there is something to do before the next cycle
+    wake_up = Event()
 
     def _quit(signo: int, _frame: Optional[FrameType]) -> None:
         print(f'Receive {Signals(signo).name}, quit.')
         receive_stop.set()
+        wake_up.set()
 
     signal(SIGTERM, _quit)
     signal(SIGINT, _quit)
 
-    twitter_accounts = _get_twitter_accounts(path=TWITTER_ACCOUNTS_PATH)
-    twitter_bearer_token = _get_twitter_bearer_token(path=TWITTER_SECRETS_PATH)
-    discord_webhooks = _get_discord_webhooks(path=DISCORD_WEBHOOKS_PATH)
-    api = tweepy.API(auth=tweepy.OAuth2BearerHandler(bearer_token=twitter_bearer_token))
-
-    if not _is_configuration_valid(
-        twitter_accounts=twitter_accounts,
-        discord_webhooks=discord_webhooks,
-    ):
+    settings = _get_settings(path=SETTINGS_PATH)
+    try:
+        log_level = parse_level(settings.get('Logging', 'Level', fallback='INFO'))
+    except ValueError as error:
+        print(f'Invalid [Logging] Level in {SETTINGS_PATH}: {error}', file=sys.stderr)
+        sys.exit(-1)
+    log_listener = setup_logging(
+        level=log_level,
+        json_output=settings.getboolean('Logging', 'JSON', fallback=False),
+        rate_limit_burst=settings.getint('Logging', 'RateLimitBurst', fallback=5),
+        rate_limit_period_seconds=settings.getfloat(
+            'Logging', 'RateLimitPeriod', fallback=60
+        ),
+    )
+    # Flush the queued records however the process exits
+    atexit.register(log_listener.stop)
+    tenants = get_tenants()
+    configuration = _read_configuration(tenants=tenants)
+    if configuration is None:
         sys.exit(-1)
+    twitter_accounts, discord_webhooks = configuration
+    if tenants[0].name:
+        logger.info(
+            'Serve %d tenant(s): %s.',
+            len(tenants),
+            ', '.join(tenant.name for tenant in tenants),
+        )
+
+    # Shared by all the tenants, each account is fetched once for all of them
+    twitter_bearer_tokens = _get_twitter_bearer_tokens(path=TWITTER_SECRETS_PATH)
+    twitter_clients = TwitterClientPool(
+        bearer_tokens=twitter_bearer_tokens,
+        api_version=settings.get('Twitter', 'APIVersion', fallback='v1'),
+        rate_limiter=_share_rate_limits(settings),
+    )
+    if len(twitter_clients) > 1:
+        logger.info('Share the requests to Twitter between %d tokens.', len(twitter_clients))
+
+    archive = None
+    if settings.getboolean('Archive', 'Enabled', fallback=False):
+        archive = TweetArchive(
+            directory=settings.get('Archive', 'Directory', fallback=ARCHIVE_DIRECTORY),
+            segment_size=settings.getint('Archive', 'SegmentSize', fallback=1000),
+        )
+        logger.info('Archived %d tweet(s) so far.', len(archive))
+
+    media_cache = None
+    if settings.getboolean('Discord', 'UploadVideos', fallback=False):
+        media_cache = MediaCache(
+            cache_dir=settings.get(
+                'Discord',
+                'MediaCacheDirectory',
+                fallback=os.path.join(tempfile.gettempdir(), 'twitter_discord_bot_media'),
+            ),
+            size_limit=settings.getint(
+                'Discord', 'UploadSizeLimit', fallback=DISCORD_UPLOAD_SIZE_LIMIT
+            ),
+            max_workers=settings.getint('Discord', 'MaxDownloads', fallback=2),
+            session=HTTP_SESSION,
+        )
+
+    tracer = None
+    if settings.getboolean('Tracing', 'Enabled', fallback=False):
+        tracer = LatencyTracer(
+            slow_threshold_seconds=settings.getfloat('Tracing', 'SlowThreshold', fallback=300),
+            summary_interval_seconds=settings.getfloat(
+                'Tracing', 'SummaryInterval', fallback=60 * 60
+            ),
+        )
+        tracer.set_channel_names(discord_webhooks)
+
+    tweet_stream = None
+    # Retried every cycle until synced, while the timelines are polled
+    are_stream_rules_synced = False
+    if settings.get('Twitter', 'Ingestion', fallback='polling') == 'stream':
+        tweet_stream = create_tweet_stream(
+            bearer_token=twitter_bearer_tokens[0], wake_up=wake_up
+        )
+        if tweet_stream is not None:
+            are_stream_rules_synced = _sync_stream_rules(tweet_stream, twitter_accounts)
 
     # Get the last ids that have fecthed
     last_fetched_posts = _read_last_fetched_ids_from_file(
         filename=LAST_FETECHED_POSTS_PATH,
     )
 
-    logger.info('Start to fetch tweets.')
+    twitter_users_infos = get_twitter_users_infos(
+        api=twitter_clients.get_client(),
+        twitter_accounts=twitter_accounts,
+    )
+    hydrator = None
+    if settings.getboolean('Twitter', 'HydrateReferencedTweets', fallback=False):
+        hydrator = TweetHydrator(
+            get_api=twitter_clients.get_client,
+            max_size=settings.getint('Twitter', 'HydrationCacheSize', fallback=1000),
+        )
+    webhook_routes = _build_webhook_routes(
+        twitter_accounts=twitter_accounts,
+        discord_webhooks=discord_webhooks,
+    )
+    config_watcher = ConfigWatcher(paths=[
+        path
+        for tenant in tenants
+        for path in (tenant.twitter_accounts_path, tenant.discord_webhooks_path)
+    ])
+
+    runtime_state = read_runtime_state(filename=RUNTIME_STATE_PATH)
+    _restore_runtime_state(
+        runtime_state=runtime_state,
+        twitter_users_infos=twitter_users_infos,
+    )
+    account_stats = runtime_state.account_stats
+    interval_count = runtime_state.interval_count
+
+    account_breakers = CircuitBreakers(name='account')
+    account_breakers.restore_states(runtime_state.circuit_breakers.get('accounts', {}))
+    webhook_breakers = CircuitBreakers(name='webhook', describe=get_webhook_id)
+    webhook_breakers.restore_states(runtime_state.circuit_breakers.get('webhooks', {}))
+    webhook_registry = WebhookRegistry(
+        probe_interval_seconds=settings.getfloat(
+            'Discord', 'QuarantineProbeInterval', fallback=6 * 60 * 60
+        ),
+    )
+    webhook_registry.restore_states({
+        webhook_url: health
+        for webhook_url, health in runtime_state.webhook_health.items()
+        if webhook_url in discord_webhooks.values()
+    })
+    # Validate the webhooks quarantined before, only those due for a probe are called
+    webhook_registry.probe_due()
+    webhook_registry.log_quarantined(discord_webhooks)
+
+    fetch_limiter = None
+    delivery_limiter = None
+    if settings.getboolean('Concurrency', 'Enabled', fallback=False):
+        fetch_limiter = AIMDLimiter(
+            name='fetch',
+            is_overloaded=is_twitter_overloaded,
+            max_limit=settings.getint('Concurrency', 'MaxFetches', fallback=8),
+            latency_threshold_seconds=settings.getfloat(
+                'Concurrency', 'FetchLatencyThreshold', fallback=5
+            ),
+        )
+        delivery_limiter = AIMDLimiter(
+            name='delivery',
+            is_overloaded=is_discord_overloaded,
+            max_limit=settings.getint('Concurrency', 'MaxPosts', fallback=4),
+            # Uploading the videos takes a while
+            latency_threshold_seconds=settings.getfloat(
+                'Concurrency', 'PostLatencyThreshold', fallback=30
+            ),
+        )
+
+    delivery_queues = DeliveryQueues(
+        max_depth=settings.getint('Discord', 'BacklogMaxDepth', fallback=10),
+        max_age_seconds=settings.getfloat('Discord', 'BacklogMaxAge', fallback=60 * 60),
+        webhook_breakers=webhook_breakers,
+        webhook_registry=webhook_registry,
+        delivery_limiter=delivery_limiter,
+    )
+    delivery_queues.set_priorities(twitter_accounts)
+    delivery_queues.restore_pending(runtime_state.pending_deliveries)
+
+    # Casefolded names of the accounts paused through the control endpoint
+    paused_accounts: Set[str] = set()
+
+    def _save_state(last_fetched_ids: Dict[str, int]) -> None:
+        _save_last_fetched_ids_to_file(LAST_FETECHED_POSTS_PATH, last_fetched_ids)
+        save_runtime_state(
+            filename=RUNTIME_STATE_PATH,
+            runtime_state=_take_runtime_state(
+                twitter_users_infos=twitter_users_infos,
+                account_stats=account_stats,
+                interval_count=interval_count,
+                delivery_queues=delivery_queues,
+                account_breakers=account_breakers,
+                webhook_breakers=webhook_breakers,
+                webhook_registry=webhook_registry,
+            ),
+        )
+
+    control_server = None
+    if settings.getboolean('Control', 'Enabled', fallback=False):
+        control_server = ControlServer(
+            wake_up=wake_up,
+            port=settings.getint('Control', 'Port', fallback=8750),
+        )
+        control_server.start()
+
+    def _wait_for_next_cycle(seconds: float, until_woken: bool) -> None:
+        """
+        Carry out the control commands while waiting, also while backing off after errors
+
+        With `until_woken`, being woken up without commands, e.g. by the stream, ends the
+        wait early.
+        """
+        nonlocal last_fetched_posts
 
-    interval_count = 0
+        next_cycle_at = time.monotonic() + seconds
+        while wake_up.wait(max(next_cycle_at - time.monotonic(), 0)):
+            wake_up.clear()
+            if receive_stop.is_set():
+                break
+            commands = control_server.take_commands() if control_server is not None else []
+            if not commands:
+                if until_woken:
+                    break
+                continue
+            for command in commands:
+                last_fetched_posts = _handle_control_command(
+                    command=command,
+                    twitter_clients=twitter_clients,
+                    twitter_accounts=twitter_accounts,
+                    twitter_users_infos=twitter_users_infos,
+                    webhook_routes=webhook_routes,
+                    discord_webhooks=discord_webhooks,
+                    last_fetched_posts=last_fetched_posts,
+                    delivery_queues=delivery_queues,
+                    paused_accounts=paused_accounts,
+                    save_state=_save_state,
+                    media_cache=media_cache,
+                    tracer=tracer,
+                    archive=archive,
+                    fetch_limiter=fetch_limiter,
+                    hydrator=hydrator,
+                )
+
+    startup_seconds = time.perf_counter() - started_at
+    if startup_seconds > STARTUP_BUDGET_SECONDS:
+        logger.warning(
+            'Start to fetch tweets. Startup took %.2fs, over the budget of %.2fs.',
+            startup_seconds,
+            STARTUP_BUDGET_SECONDS,
+        )
+    else:
+        logger.info('Start to fetch tweets. Startup took %.2fs.', startup_seconds)
 
     while not receive_stop.is_set():
+        if config_watcher.has_changed():
+            logger.info('The configuration is modified, reload it.')
+            new_configuration = _reload_configuration(tenants=tenants)
+            if new_configuration is not None:
+                new_twitter_accounts, new_discord_webhooks = new_configuration
+                _update_webhook_routes(
+                    webhook_routes=webhook_routes,
+                    old_twitter_accounts=twitter_accounts,
+                    new_twitter_accounts=new_twitter_accounts,
+                    old_discord_webhooks=discord_webhooks,
+                    new_discord_webhooks=new_discord_webhooks,
+                )
+                twitter_users_infos = get_twitter_users_infos(
+                    api=twitter_clients.get_client(),
+                    twitter_accounts=new_twitter_accounts,
+                    cached_users_infos=twitter_users_infos,
+                )
+                twitter_accounts = new_twitter_accounts
+                discord_webhooks = new_discord_webhooks
+                delivery_queues.set_priorities(twitter_accounts)
+                are_stream_rules_synced = False
+                if tracer is not None:
+                    tracer.set_channel_names(discord_webhooks)
+
+        if tweet_stream is not None and not are_stream_rules_synced:
+            are_stream_rules_synced = _sync_stream_rules(tweet_stream, twitter_accounts)
+        # Whether the stream receives the tweets of all the accounts
+        is_streaming = (
+            tweet_stream is not None and are_stream_rules_synced and tweet_stream.is_connected
+        )
+
         try:
-            last_fetched_posts = _fetch_and_post(
-                twitter_api=api,
-                twitter_accounts=twitter_accounts,
-                last_fetched_posts=last_fetched_posts,
-                discord_webhooks=discord_webhooks,
-                interval_count=interval_count,
+            # Poll the timelines, unless the stream is connected with the rules synced and
+            # the gap since the last connection has been filled
+            is_polling = (
+                tweet_stream is None
+                or not are_stream_rules_synced
+                or tweet_stream.take_gap_fill_request()
             )
+            if is_polling:
+                last_fetched_posts = _fetch_and_post(
+                    twitter_clients=twitter_clients,
+                    twitter_accounts=twitter_accounts,
+                    twitter_users_infos=twitter_users_infos,
+                    webhook_routes=webhook_routes,
+                    last_fetched_posts=last_fetched_posts,
+                    # Fetch every account to fill the gap after connecting to the stream
+                    interval_count=interval_count if not is_streaming else 0,
+                    delivery_queues=delivery_queues,
+                    account_stats=account_stats,
+                    media_cache=media_cache,
+                    tracer=tracer,
+                    account_breakers=account_breakers,
+                    archive=archive,
+                    paused_accounts=paused_accounts,
+                    fetch_limiter=fetch_limiter,
+                    hydrator=hydrator,
+                )
+            if tweet_stream is not None:
+                tweet_stream.ensure_running()
+                last_fetched_posts = _enqueue_streamed_tweets(
+                    tweet_stream=tweet_stream,
+                    twitter_users_infos=twitter_users_infos,
+                    webhook_routes=webhook_routes,
+                    last_fetched_posts=last_fetched_posts,
+                    delivery_queues=delivery_queues,
+                    media_cache=media_cache,
+                    tracer=tracer,
+                    archive=archive,
+                    paused_accounts=paused_accounts,
+                    hydrator=hydrator,
+                )
+            webhook_registry.probe_due()
+            delivery_queues.deliver(should_stop=receive_stop.is_set)
+        except _GlobalFetchError as error:
+            logger.error('Failed to fetch tweets: %r', error.__cause__)
+            # Still post what has been fetched
+            last_fetched_posts = error.latest_posts
+            delivery_queues.deliver(should_stop=receive_stop.is_set)
+            # The posts still queued are saved with the ids, so a crash does not lose them
+            _save_state(last_fetched_posts)
+            _wait_for_next_cycle(600, until_woken=False)
         except Exception:  # pylint: disable=broad-except
             logger.exception('Failed to fetch tweets.')
-            receive_stop.wait(600)
+            _wait_for_next_cycle(600, until_woken=False)
         else:
-            _save_last_fetched_ids_to_file(LAST_FETECHED_POSTS_PATH, last_fetched_posts)
-            interval_count += 1
-            receive_stop.wait(60)
+            if media_cache is not None:
+                media_cache.remove_expired(in_use=delivery_queues.get_attachments())
+            if tracer is not None:
+                tracer.log_summary_if_due()
+            twitter_clients.log_usage_if_due()
+            if is_polling:
+                interval_count += 1
+            _save_state(last_fetched_posts)
+
+            _wait_for_next_cycle(60, until_woken=True)
+
+    if control_server is not None:
+        control_server.stop()
+    if tweet_stream is not None:
+        tweet_stream.disconnect()
+    if tracer is not None:
+        tracer.log_summary()
+    twitter_clients.log_usage()
+
+    _save_state(last_fetched_posts)
+    logger.info('Saved the runtime state.')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,142 @@
+"""Track the health of the Discord webhooks and quarantine the dead ones"""
+
+import logging
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Mapping, Optional
+
+from .discord_api import get_webhook_status
+from .models import get_webhook_id
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# Discord answers these when the webhook is deleted or its token is revoked
+DEAD_WEBHOOK_CODES = (401, 404)
+
+
+@dataclass
+class WebhookHealth:
+    """The health of a webhook from its latest response"""
+    # None if there was no response
+    status_code: Optional[int] = None
+    # When it was quarantined (epoch), 0 if it is healthy
+    quarantined_at: float = 0.0
+    next_probe_at: float = 0.0
+
+    @property
+    def is_quarantined(self) -> bool:
+        """Whether nothing should be posted to the webhook"""
+        return self.quarantined_at > 0
+
+
+def _format_time(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class WebhookRegistry:
+    """
+    Health of the Discord webhooks, tracked from the response codes
+
+    A webhook answering 401 or 404 has been deleted or revoked, which retrying does not
+    fix, so it is quarantined at once. Nothing is posted to it, and it is probed with
+    `probe`, which posts nothing, once every `probe_interval_seconds`.
+    """
+
+    probe_interval_seconds: float
+    probe: Callable[[str], Optional[int]]
+
+    _healths: Dict[str, WebhookHealth]
+
+    def __init__(
+        self,
+        probe_interval_seconds: float = 6 * 60 * 60,
+        probe: Callable[[str], Optional[int]] = get_webhook_status,
+    ) -> None:
+        self.probe_interval_seconds = probe_interval_seconds
+        self.probe = probe
+        self._healths = {}
+
+    def get_health(self, webhook_url: str) -> Optional[WebhookHealth]:
+        """The health of the webhook, None if it has not been used"""
+        return self._healths.get(webhook_url)
+
+    def is_quarantined(self, webhook_url: str) -> bool:
+        """Whether nothing should be posted to the webhook"""
+        health = self._healths.get(webhook_url)
+        return health is not None and health.is_quarantined
+
+    def record(self, webhook_url: str, status_code: Optional[int]) -> None:
+        """Update the health from the response of the webhook"""
+        health = self._healths.setdefault(webhook_url, WebhookHealth())
+        health.status_code = status_code
+
+        if status_code is not None and 200 <= status_code < 300:
+            if health.is_quarantined:
+                logger.info(
+                    'The Discord webhook %s is back, end the quarantine.',
+                    get_webhook_id(webhook_url),
+                )
+            health.quarantined_at = 0.0
+            health.next_probe_at = 0.0
+        elif status_code in DEAD_WEBHOOK_CODES:
+            now = time.time()
+            if not health.is_quarantined:
+                health.quarantined_at = now
+                logger.warning(
+                    'The Discord webhook %s answered %d, quarantine it.',
+                    get_webhook_id(webhook_url),
+                    status_code,
+                )
+            health.next_probe_at = now + self.probe_interval_seconds
+
+    def probe_due(self) -> None:
+        """Probe the quarantined webhooks whose probes are due"""
+        now = time.time()
+        for webhook_url, health in list(self._healths.items()):
+            if not health.is_quarantined or now < health.next_probe_at:
+                continue
+            status_code = self.probe(webhook_url)
+            self.record(webhook_url, status_code)
+            if health.is_quarantined:
+                # Probe it again later whatever the failure is
+                health.next_probe_at = now + self.probe_interval_seconds
+
+    def log_quarantined(self, discord_webhooks: Mapping[str, str]) -> int:
+        """Report the quarantined webhooks of the channels, return the number of them"""
+        quarantined_count = 0
+        for discord_channel, webhook_url in discord_webhooks.items():
+            health = self._healths.get(webhook_url)
+            if health is None or not health.is_quarantined:
+                continue
+            quarantined_count += 1
+            logger.warning(
+                'The webhook of Discord channel %s has been quarantined since %s '
+                'after answering %s, next probe at %s.',
+                discord_channel,
+                _format_time(health.quarantined_at),
+                health.status_code,
+                _format_time(health.next_probe_at),
+            )
+        return quarantined_count
+
+    def get_states(self) -> Dict[str, Dict[str, Any]]:
+        """Return the healths to be saved in the snapshot"""
+        return {webhook_url: asdict(health) for webhook_url, health in self._healths.items()}
+
+    def restore_states(self, states: Mapping[str, Mapping[str, Any]]) -> None:
+        """Restore the healths from the snapshot, ignoring the invalid ones"""
+        for webhook_url, state in states.items():
+            try:
+                health = WebhookHealth(**state)
+                if health.status_code is not None:
+                    health.status_code = int(health.status_code)
+                health.quarantined_at = float(health.quarantined_at)
+                health.next_probe_at = float(health.next_probe_at)
+            except (TypeError, ValueError):
+                logger.warning(
+                    'The health of webhook %s in the snapshot is invalid, ignore it.',
+                    get_webhook_id(webhook_url),
+                )
+                continue
+            self._healths[webhook_url] = health